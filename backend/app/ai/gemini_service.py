@@ -1,23 +1,92 @@
 from typing import Any, Dict, Optional
 from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import copy
+import functools
+import hashlib
+import json
+import logging
 
 try:
     import google.generativeai as genai
 except Exception:
     genai = None
 
-from ..core.config import GOOGLE_API_KEY, GEMINI_MODEL
+from ..core.cache import TTLCache
+from ..core.config import (
+    GOOGLE_API_KEY, GEMINI_MODEL, GEMINI_TIMEOUT, GEMINI_MAX_CONCURRENCY,
+    AI_PROPOSAL_CACHE_TTL, AI_PROPOSAL_CACHE_MAXSIZE, AI_PROPOSAL_WEIGHT_BUCKET_KG,
+)
+
+logger = logging.getLogger(__name__)
 
 # Usar versão "-latest" por compatibilidade e permitir fallback automático
 DEFAULT_MODEL = "gemini-2.0-flash-lite"
 FALLBACK_MODEL = "gemini-2.0-flash-lite"
 
+GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "response_mime_type": "application/json",
+}
+
 
 class DietAIError(Exception):
     pass
 
 
-def _build_prompt(animal: Dict[str, Any], preferences: Optional[Dict[str, Any]], user_input: Dict[str, Any]) -> str:
+class DietAITimeoutError(DietAIError):
+    pass
+
+
+# Chamadas ao Gemini nunca bloqueiam o event loop: usam a API assíncrona do SDK
+# ou, na falta dela, um pool de threads limitado. O semáforo limita as chamadas
+# simultâneas por processo (GEMINI_MAX_CONCURRENCY).
+_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini")
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+_configured = False
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Semáforo de concorrência do loop atual (recriado se o loop mudar, como em testes)."""
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        _semaphore_loop = loop
+    return _semaphore
+
+
+def _configure_sdk() -> None:
+    global _configured
+    if not _configured:
+        genai.configure(api_key=GOOGLE_API_KEY)
+        _configured = True
+
+
+async def _generate_content(model: Any, prompt: str) -> str:
+    """Chama o modelo sem bloquear o event loop, com limite de concorrência e tempo limite."""
+    async with _get_semaphore():
+        if hasattr(model, "generate_content_async"):
+            call = model.generate_content_async(
+                prompt,
+                generation_config=GENERATION_CONFIG,
+                request_options={"timeout": GEMINI_TIMEOUT},
+            )
+        else:
+            call = asyncio.get_running_loop().run_in_executor(
+                _executor,
+                functools.partial(model.generate_content, prompt, generation_config=GENERATION_CONFIG),
+            )
+        try:
+            response = await asyncio.wait_for(call, timeout=GEMINI_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise DietAITimeoutError(f"Tempo limite de {GEMINI_TIMEOUT:g}s excedido ao chamar Gemini.")
+    return response.text or "{}"
+
+
+def _build_context(animal: Dict[str, Any], preferences: Optional[Dict[str, Any]], user_input: Dict[str, Any]) -> Dict[str, Any]:
     species = animal.get("species") or "cão"
     name = animal.get("name") or "Pet"
     weight = animal.get("weight")
@@ -57,7 +126,14 @@ def _build_prompt(animal: Dict[str, Any], preferences: Optional[Dict[str, Any]],
             "alimento_id", "quantidade_gramas", "horario", "justificativa"
         ]
     }
+    return context
 
+
+def _build_prompt(animal: Dict[str, Any], preferences: Optional[Dict[str, Any]], user_input: Dict[str, Any]) -> str:
+    return _render_prompt(_build_context(animal, preferences, user_input))
+
+
+def _render_prompt(context: Dict[str, Any]) -> str:
     system = (
         "Você é um nutricionista veterinário. Gere um plano de dieta seguro e objetivo para o pet, "
         "em JSON puro (application/json) e SEM explicações. Regras:\n"
@@ -79,6 +155,67 @@ def _build_prompt(animal: Dict[str, Any], preferences: Optional[Dict[str, Any]],
     return prompt
 
 
+# --- Cache de propostas por conteúdo ---
+# A chave é o hash do contexto do prompt normalizado (espécie, raça, faixa de peso,
+# condição, objetivo, preferências...). O nome do pet fica fora da chave e é
+# substituído na proposta reaproveitada.
+
+proposal_cache = TTLCache(maxsize=AI_PROPOSAL_CACHE_MAXSIZE, ttl=AI_PROPOSAL_CACHE_TTL, name="ai_proposals")
+
+# Campos de preferencias_pet que identificam o registro, não o perfil
+_VOLATILE_PREFERENCE_FIELDS = {"id", "animal_id", "clinic_id", "created_at", "updated_at"}
+
+
+def _bucket(value: Any, step: float) -> Any:
+    try:
+        return round(round(float(value) / step) * step, 3)
+    except (TypeError, ValueError):
+        return value
+
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip().lower() or None
+    if isinstance(value, dict):
+        return {k: _normalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_value(v) for v in value]
+    return value
+
+
+def _proposal_cache_key(context: Dict[str, Any]) -> str:
+    animal = context.get("animal") or {}
+    request = dict(context.get("request") or {})
+    if request.get("calorias_alvo_estimadas") is not None:
+        request["calorias_alvo_estimadas"] = _bucket(request["calorias_alvo_estimadas"], 10)
+    preferences = {
+        k: v for k, v in (context.get("preferences") or {}).items()
+        if k not in _VOLATILE_PREFERENCE_FIELDS and v not in (None, "", [], {})
+    }
+    normalized = _normalize_value({
+        "animal": {
+            "species": animal.get("species"),
+            "breed": animal.get("breed"),
+            "weight": _bucket(animal.get("weight"), AI_PROPOSAL_WEIGHT_BUCKET_KG) if animal.get("weight") else None,
+        },
+        "preferences": preferences,
+        "request": request,
+    })
+    payload = json.dumps(normalized, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _reuse_cached_proposal(entry: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """Cópia da resposta em cache com o nome do pet original trocado pelo atual."""
+    data = copy.deepcopy(entry["data"])
+    cached_name = entry.get("animal_name")
+    if cached_name and cached_name != name:
+        for key, value in data.items():
+            if isinstance(value, str):
+                data[key] = value.replace(cached_name, name)
+    return data
+
+
 def _estimate_calories(species: Optional[str], weight: Optional[float]) -> Optional[int]:
     if not weight or weight <= 0:
         return None
@@ -128,17 +265,18 @@ def _parse_json_response(content: str) -> Dict[str, Any]:
     return data if isinstance(data, dict) else {}
 
 
-async def generate_diet_proposal(animal: Dict[str, Any], preferences: Optional[Dict[str, Any]], user_input: Dict[str, Any]) -> tuple[Dict[str, Any], str]:
+async def _request_proposal(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Chama o Gemini com o prompt do contexto e retorna o JSON da resposta."""
     if not GOOGLE_API_KEY:
         raise DietAIError("GOOGLE_API_KEY não configurada no ambiente.")
     if genai is None:
         raise DietAIError("Dependência google-generativeai ausente. Adicione ao requirements e instale.")
 
     # Configurar SDK
-    genai.configure(api_key=GOOGLE_API_KEY)
+    _configure_sdk()
 
     # Construir prompt
-    prompt = _build_prompt(animal, preferences, user_input)
+    prompt = _render_prompt(context)
 
     # Inicializar modelo com fallback quando necessário
     try:
@@ -147,33 +285,48 @@ async def generate_diet_proposal(animal: Dict[str, Any], preferences: Optional[D
         model = genai.GenerativeModel(FALLBACK_MODEL)
 
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": 0.3,
-                "response_mime_type": "application/json",
-            },
-        )
-        content = response.text or "{}"
+        content = await _generate_content(model, prompt)
+    except DietAITimeoutError:
+        raise
     except Exception as e:
         # Se o modelo atual não suportar generateContent, tentar novamente com fallback
         if DEFAULT_MODEL != FALLBACK_MODEL:
             try:
                 model = genai.GenerativeModel(FALLBACK_MODEL)
-                response = model.generate_content(
-                    prompt,
-                    generation_config={
-                        "temperature": 0.3,
-                        "response_mime_type": "application/json",
-                    },
-                )
-                content = response.text or "{}"
+                content = await _generate_content(model, prompt)
+            except DietAITimeoutError:
+                raise
             except Exception as e2:
                 raise DietAIError(f"Falha ao chamar Gemini: {str(e2)}")
         else:
             raise DietAIError(f"Falha ao chamar Gemini: {str(e)}")
 
-    data = _parse_json_response(content)
+    return _parse_json_response(content)
+
+
+async def generate_diet_proposal(
+    animal: Dict[str, Any],
+    preferences: Optional[Dict[str, Any]],
+    user_input: Dict[str, Any],
+    use_cache: bool = True,
+) -> tuple[Dict[str, Any], str]:
+    """
+    Gera a proposta de dieta via Gemini.
+    Com `use_cache`, reaproveita a resposta de um contexto equivalente ainda no cache;
+    sem ele, sempre chama o modelo (e atualiza o cache com a nova resposta).
+    """
+    context = _build_context(animal, preferences, user_input)
+    cache_key = _proposal_cache_key(context)
+    name = context["animal"]["name"]
+
+    cached = proposal_cache.get(cache_key) if use_cache else None
+    if cached is not None:
+        logger.info(f"Proposta de dieta reaproveitada do cache ({cache_key[:12]}).")
+        data = _reuse_cached_proposal(cached, name)
+    else:
+        data = await _request_proposal(context)
+        if data:
+            proposal_cache.set(cache_key, {"data": copy.deepcopy(data), "animal_name": name})
 
     nome = data.get("nome") or f"Dieta AI para {animal.get('name') or 'Pet'}"
     tipo = data.get("tipo") or user_input.get("tipo_alimento_preferencia") or "ração"
@@ -11,6 +11,7 @@ from .dashboard import router as dashboard_router
 from .client import client_router
 from .health_check import router as health_router
 from .diets_ai import router as diets_ai_router
+from .exports import router as exports_router
 
 api_router = APIRouter()
 
@@ -32,4 +33,5 @@ api_router.include_router(diets_ai_router, tags=["diets_ai"])
 api_router.include_router(activities_router, prefix="", tags=["activities"])
 api_router.include_router(gamification_router, prefix="", tags=["gamification"])
 api_router.include_router(dashboard_router, prefix="", tags=["dashboard"])
+api_router.include_router(exports_router, tags=["exports"])
 api_router.include_router(health_router, tags=["health"])
\ No newline at end of file
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Path, Query
+from fastapi import APIRouter, HTTPException, Depends, Path, Query, Response
 from typing import Dict, Any, List, Optional
 from uuid import UUID
 import logging
@@ -22,6 +22,8 @@ from ..models.activity_metrics import (
 
 from ..db.supabase import supabase_admin
 from ..api.auth import get_current_user
+from ..api.dashboard import invalidate_dashboard, DASHBOARD_STATS
+from ..api.pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, Keyset, fetch_page
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -102,11 +104,18 @@ async def create_activity(
         raise HTTPException(status_code=500, detail=f"Erro interno no servidor ao criar atividade: {str(e)}")
 
 
+# Ordem do catálogo de atividades
+ACTIVITIES_KEYSET = Keyset("nome.asc", "id.asc")
+
 @router.get("/atividades", response_model=List[ActivityResponse])
 async def list_activities(
+    http_response: Response,
     tipo: Optional[str] = Query(None, description="Filtrar por tipo de atividade"),
     calorias_gt: Optional[int] = Query(None, alias="calorias_gt", description="Filtrar por calorias estimadas por minuto maior que"),
     calorias_lt: Optional[int] = Query(None, alias="calorias_lt", description="Filtrar por calorias estimadas por minuto menor que"),
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ) -> List[Dict[str, Any]]:
     """
@@ -117,22 +126,25 @@ async def list_activities(
         if not current_user.get("id"):
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
-        query = "/rest/v1/atividades?select=*"
+        filters = []
         if tipo:
-            query += f"&tipo=eq.{tipo}"
+            filters.append(("tipo", f"eq.{tipo}"))
         if calorias_gt is not None:
-            query += f"&calorias_estimadas_por_minuto=gt.{calorias_gt}"
+            filters.append(("calorias_estimadas_por_minuto", f"gt.{calorias_gt}"))
         if calorias_lt is not None:
-            query += f"&calorias_estimadas_por_minuto=lt.{calorias_lt}"
-
-        query += "&order=nome.asc"
+            filters.append(("calorias_estimadas_por_minuto", f"lt.{calorias_lt}"))
 
-        response = await supabase_admin._request("GET", query)
-        activities = supabase_admin.process_response(response)
+        page = await fetch_page(
+            "atividades", ACTIVITIES_KEYSET, filters,
+            limit=limit, cursor=cursor, include_total=include_total,
+        )
+        page.apply_headers(http_response)
 
-        logger.info(f"Listando {len(activities)} atividades com filtros tipo={tipo}, calorias_gt={calorias_gt}, calorias_lt={calorias_lt}")
-        return activities
+        logger.info(f"Listando {len(page.items)} atividades com filtros tipo={tipo}, calorias_gt={calorias_gt}, calorias_lt={calorias_lt}")
+        return page.items
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao listar atividades: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno no servidor ao listar atividades: {str(e)}")
@@ -331,6 +343,8 @@ async def create_activity_plan(
         # Adicionar nome da atividade à resposta
         created_plan["nome_atividade"] = activity_data.get("nome")
 
+        invalidate_dashboard(clinic_id, DASHBOARD_STATS)
+
         logger.info(f"Plano de atividade criado com sucesso para animal {animal_id}: {created_plan.get('id')}")
         return created_plan
 
@@ -570,6 +584,7 @@ async def delete_activity_plan(
              raise HTTPException(status_code=500, detail="Erro ao remover plano: Falha na exclusão.")
 
 
+        invalidate_dashboard(clinic_id, DASHBOARD_STATS)
         logger.info(f"Plano de atividade {plano_id} removido com sucesso.")
         return None # FastAPI retorna 204 No Content
 
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, Body, Path
+from fastapi import APIRouter, HTTPException, Depends, Query, Body, Path, Response
 from typing import Dict, Any, Annotated, Optional
 from ..models.animal import (
     AnimalCreate, AnimalResponse, AnimalUpdate, 
@@ -12,7 +12,10 @@ from uuid import UUID
 import logging
 import secrets
 import string
-from ..api.auth import get_current_user
+from ..api.auth import get_current_user, invalidate_principal
+from ..api.dashboard import invalidate_dashboard, DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY
+from ..api.gamification import invalidate_leaderboards
+from ..api.pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, Keyset, fetch_page
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO)
@@ -60,6 +63,10 @@ async def create_animal(
         try:
             # A função insert já lida com a requisição POST para /rest/v1/animals
             created_animal = await supabase_admin.insert("animals", data=animal_data)
+            invalidate_dashboard(clinic_id, DASHBOARD_STATS)
+            invalidate_leaderboards(clinic_id)
+            # O email pode passar a identificar um tutor (ou mudar a lista de animais dele)
+            invalidate_principal(email=animal.email)
             
             # O método insert retorna uma lista, pegamos o primeiro elemento
             if isinstance(created_animal, list) and created_animal:
@@ -118,7 +125,7 @@ async def update_animal(
         # 1. Verificar se o animal pertence à clínica antes de atualizar
         existing_animal_response = await supabase_admin._request(
             "GET",
-            f"/rest/v1/animals?id=eq.{animal_id}&clinic_id=eq.{clinic_id}&select=id"
+            f"/rest/v1/animals?id=eq.{animal_id}&clinic_id=eq.{clinic_id}&select=id,email,tutor_user_id"
         )
         existing_animal = supabase_admin.process_response(existing_animal_response, single_item=True)
         if not existing_animal:
@@ -163,6 +170,15 @@ async def update_animal(
         else:
             updated_animal = updated_animal_list[0]
 
+        # Nome do animal/tutor aparecem na lista de agendamentos do dashboard
+        if "name" in update_data or "tutor_name" in update_data:
+            invalidate_dashboard(clinic_id, DASHBOARD_APPOINTMENTS_TODAY)
+        if "name" in update_data:
+            invalidate_leaderboards(clinic_id)
+        # Vínculo tutor/animal alterado: identidades do tutor antigo e do novo
+        if "email" in update_data or "tutor_user_id" in update_data:
+            invalidate_principal(user_id=existing_animal.get("tutor_user_id"), email=existing_animal.get("email"))
+            invalidate_principal(user_id=updated_animal.get("tutor_user_id"), email=updated_animal.get("email"))
 
         logger.info(f"Animal {animal_id} atualizado com sucesso: {updated_animal}")
         return updated_animal
@@ -197,7 +213,7 @@ async def delete_animal(
         # 1. Verificar se o animal pertence à clínica antes de deletar (redundante com o filtro no DELETE, mas bom para log)
         existing_animal_response = await supabase_admin._request(
             "GET",
-            f"/rest/v1/animals?id=eq.{animal_id}&clinic_id=eq.{clinic_id}&select=id"
+            f"/rest/v1/animals?id=eq.{animal_id}&clinic_id=eq.{clinic_id}&select=id,email,tutor_user_id"
         )
         existing_animal = supabase_admin.process_response(existing_animal_response, single_item=True)
 
@@ -222,6 +238,10 @@ async def delete_animal(
             logger.error(f"Erro ao deletar animal {animal_id}: ainda encontrado após DELETE.")
             raise HTTPException(status_code=500, detail="Erro interno: Falha ao deletar o animal.")
 
+        # A lista de animais do tutor em cache não é mais válida
+        invalidate_principal(user_id=existing_animal.get("tutor_user_id"), email=existing_animal.get("email"))
+        invalidate_dashboard(clinic_id)
+        invalidate_leaderboards(clinic_id)
 
         # DELETE não retorna conteúdo, então apenas logamos sucesso
         logger.info(f"Animal {animal_id} deletado com sucesso da clínica {clinic_id}")
@@ -240,8 +260,25 @@ async def delete_animal(
             detail=f"Erro interno no servidor ao deletar animal: {error_detail}"
         )
 
+# Ordem das listagens de animais (o id desempata nomes repetidos)
+ANIMALS_KEYSET = Keyset("name.asc", "id.asc")
+
+
+async def _has_linked_animals(tutor_user_id: str) -> bool:
+    """Se há algum animal vinculado ao tutor por tutor_user_id (uma linha)."""
+    response = await supabase_admin._request(
+        "GET", "/rest/v1/animals", params={"tutor_user_id": f"eq.{tutor_user_id}", "select": "id", "limit": "1"}
+    )
+    if "error" in response:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar animais do tutor: {response['error']}")
+    return bool(supabase_admin.process_response(response))
+
 @router.get("", response_model=list[Dict[str, Any]])
 async def list_animals(
+    http_response: Response,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ) -> list[Dict[str, Any]]:
     user_type = current_user.get("user_type")
@@ -251,32 +288,32 @@ async def list_animals(
     if not user_id:
         raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
+    # O cursor codifica (name, id): o nome precisa vir na seleção
+    page_args = {"select": "id,name", "limit": limit, "cursor": cursor, "include_total": include_total}
+
     if user_type == "tutor":
         logger.info(f"Listando IDs de animais do tutor_id: {user_id}")
         try:
-            tutor_query = f"/rest/v1/animals?tutor_user_id=eq.{user_id}&select=id"
-            tutor_response = await supabase_admin._request("GET", tutor_query)
-
-            animals = []
-            if isinstance(tutor_response, list):
-                animals = tutor_response
-            elif isinstance(tutor_response, dict) and "data" in tutor_response and isinstance(tutor_response["data"], list):
-                animals = tutor_response["data"]
-
-            if not animals and user_email:
-                email_query = f"/rest/v1/animals?email=eq.{user_email}&select=id"
-                email_response = await supabase_admin._request("GET", email_query)
-                if isinstance(email_response, list):
-                    animals = email_response
-                elif isinstance(email_response, dict) and "data" in email_response and isinstance(email_response["data"], list):
-                    animals = email_response["data"]
-
-            if not animals:
+            # Sem animais vinculados por tutor_user_id, usa o email; as páginas seguintes
+            # precisam repetir a mesma escolha de filtro
+            by_user = {"tutor_user_id": f"eq.{user_id}"}
+            by_email = {"email": f"eq.{user_email}"}
+            if cursor and user_email and not await _has_linked_animals(user_id):
+                page = await fetch_page("animals", ANIMALS_KEYSET, by_email, **page_args)
+            else:
+                page = await fetch_page("animals", ANIMALS_KEYSET, by_user, **page_args)
+                if not page.items and not cursor and user_email:
+                    page = await fetch_page("animals", ANIMALS_KEYSET, by_email, **page_args)
+
+            if not page.items:
                 logger.info("Nenhum animal encontrado para o tutor")
                 return []
 
-            logger.info(f"Encontrados {len(animals)} IDs de animais para o tutor")
-            return animals
+            logger.info(f"Encontrados {len(page.items)} IDs de animais para o tutor")
+            page.apply_headers(http_response)
+            return page.items
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Erro ao buscar IDs de animais do tutor {user_id}: {e}", exc_info=True)
             error_detail = str(e)
@@ -288,24 +325,21 @@ async def list_animals(
     logger.info(f"Requisição recebida para listar todos os animais da clinic_id: {clinic_id}")
 
     try:
-        response = await supabase_admin._request(
-            method="GET",
-            endpoint=f"/rest/v1/animals?clinic_id=eq.{clinic_id}&select=*"
+        page = await fetch_page(
+            "animals", ANIMALS_KEYSET, {"clinic_id": f"eq.{clinic_id}"},
+            **{**page_args, "select": "*"},
         )
+        page.apply_headers(http_response)
 
-        animals_list = []
-        if isinstance(response, list):
-            animals_list = response
-        elif isinstance(response, dict) and "data" in response and isinstance(response["data"], list):
-            animals_list = response["data"]
-
-        if not animals_list:
+        if not page.items:
             logger.info("Nenhum animal encontrado no banco de dados.")
             return []
 
-        logger.info(f"Encontrados {len(animals_list)} animais.")
-        return animals_list
+        logger.info(f"Encontrados {len(page.items)} animais.")
+        return page.items
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar animais: {e}", exc_info=True)
         error_detail = str(e)
@@ -735,6 +769,10 @@ async def activate_client_access(
             
             raise HTTPException(status_code=500, detail="Falha ao vincular tutor ao animal")
 
+        invalidate_principal(user_id=user_id, email=activation_data.email)
+        if animal_data.get("email"):
+            invalidate_principal(email=animal_data["email"])
+
         logger.info(f"Acesso do cliente ativado com sucesso para animal {animal_id}")
 
         return ClientActivationResponse(
@@ -799,6 +837,8 @@ async def toggle_client_status(
         if not updated_animal:
             raise HTTPException(status_code=500, detail="Falha ao atualizar status")
 
+        invalidate_principal(user_id=animal_data.get("tutor_user_id"))
+
         return ClientStatusToggleResponse(
             success=True,
             message=f"Acesso do cliente {'ativado' if status_data.active else 'desativado'} com sucesso",
@@ -929,6 +969,9 @@ async def update_client_info(
         if not updated_animal:
             raise HTTPException(status_code=500, detail="Falha ao atualizar dados do animal")
 
+        invalidate_principal(user_id=tutor_user_id, email=animal_data.get("email"))
+        invalidate_principal(email=activation_data.email)
+
         logger.info(f"Informações do cliente atualizadas com sucesso para animal {animal_id}")
 
         return ClientActivationResponse(
@@ -4,13 +4,17 @@ Handles appointment requests from tutors and management by clinics.
 Uses the appointments table with client-specific fields.
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Query, Path
+from fastapi import APIRouter, HTTPException, Depends, Query, Path, Response
 from typing import List, Dict, Any, Optional
 from datetime import date as Date, datetime as DateTime, time as Time
 from pydantic import BaseModel, Field, UUID4
 import logging
 
 from .auth import get_current_user
+from .dashboard import invalidate_dashboard, DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY
+from .appointments import ensure_no_conflict, invalidate_schedule, is_schedule_conflict
+from .pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, Keyset, fetch_page
+from ..core.scheduling import BLOCKING_STATUSES
 from ..db.supabase import supabase_admin
 
 # Configurar logging
@@ -82,19 +86,14 @@ async def create_appointment_request(
         # Verificar conflitos de horário básico
         end_time = request_data.end_time or Time(hour=request_data.start_time.hour + 1)
         
-        conflict_query = f"/rest/v1/appointments?clinic_id=eq.{animal['clinic_id']}"
-        conflict_query += f"&date=eq.{request_data.date.isoformat()}"
-        conflict_query += f"&start_time=eq.{request_data.start_time.isoformat()}"
-        conflict_query += "&status=in.(scheduled,confirmed)"
-        
-        conflict_response = await supabase_admin._request("GET", conflict_query)
-        conflict_data = supabase_admin.process_response(conflict_response)
-        
-        if conflict_data:
-            raise HTTPException(
-                status_code=409, 
-                detail="Já existe um agendamento para este horário"
-            )
+        await ensure_no_conflict(
+            animal["clinic_id"],
+            request_data.date.isoformat(),
+            request_data.start_time,
+            end_time,
+            status_code=409,
+            detail="Já existe um agendamento para este horário",
+        )
         
         # Preparar dados para inserção na tabela appointments
         insert_data = {
@@ -121,6 +120,7 @@ async def create_appointment_request(
             raise HTTPException(status_code=500, detail="Erro ao criar solicitação de agendamento")
         
         appointment = created_request[0]
+        invalidate_dashboard(animal["clinic_id"], DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
         
         # Retornar resposta formatada
         response = AppointmentRequestResponse(
@@ -150,17 +150,53 @@ async def create_appointment_request(
         logger.error(f"Erro ao criar solicitação de agendamento: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro interno ao criar solicitação: {str(e)}")
 
+# Ordem estável da listagem (o id desempata) e colunas lidas, com o animal embutido
+REQUESTS_KEYSET = Keyset("date.desc", "start_time.desc", "id.desc")
+REQUESTS_SELECT = (
+    "id,animal_id,description,date,start_time,end_time,observacoes_cliente,status,"
+    "status_solicitacao,created_at,updated_at"
+)
+
+
+def _request_response(appointment: Dict[str, Any], animal: Dict[str, Any]) -> Dict[str, Any]:
+    """Formato de AppointmentRequestResponse a partir do appointment e do animal."""
+    return {
+        "id": str(appointment["id"]),
+        "animal_id": str(appointment["animal_id"]),
+        "animal_name": animal.get("name"),
+        "tutor_name": animal.get("tutor_name"),
+        "tutor_email": animal.get("email"),
+        "service": appointment.get("description") or "",
+        "date": appointment["date"],
+        "start_time": appointment["start_time"],
+        "end_time": appointment.get("end_time"),
+        "notes": appointment.get("observacoes_cliente"),
+        "priority": "normal",  # Default priority
+        "status": appointment["status"],
+        "status_solicitacao": appointment.get("status_solicitacao") or "aguardando_aprovacao",
+        "created_at": appointment["created_at"],
+        "updated_at": appointment.get("updated_at"),
+    }
+
+
 @router.get("/", response_model=List[AppointmentRequestResponse])
 async def list_appointment_requests(
+    http_response: Response,
     status: Optional[str] = Query(None, description="Filtrar por status"),
     status_solicitacao: Optional[str] = Query(None, description="Filtrar por status da solicitação"),
     date_from: Optional[Date] = Query(None, description="Data inicial"),
     date_to: Optional[Date] = Query(None, description="Data final"),
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ) -> List[Dict[str, Any]]:
     """
     Lista solicitações de agendamento da tabela appointments.
     Mostra apenas agendamentos solicitados por clientes.
+
+    Uma única consulta, com os dados do animal embutidos. Paginação por cursor: quando
+    houver mais resultados, o header X-Next-Cursor traz o valor para `cursor`.
     """
     user_email = current_user.get("email")
     user_type = current_user.get("user_type", "tutor")
@@ -168,22 +204,15 @@ async def list_appointment_requests(
     logger.info(f"Listando solicitações de agendamento para user: {user_email}, tipo: {user_type}")
 
     try:
-        # Query base para appointments solicitados por clientes
-        query = "/rest/v1/appointments?solicitado_por_cliente=eq.true"
-        query += "&select=*"
+        # Filtro base para appointments solicitados por clientes
+        filters = [("solicitado_por_cliente", "eq.true")]
+        select = f"{REQUESTS_SELECT},animals(name,tutor_name,email)"
         
         # Filtrar baseado no tipo de usuário
         if user_type == "tutor":
-            # Buscar animais do tutor
-            animals_query = f"/rest/v1/animals?email=eq.{user_email}&select=id"
-            animals_response = await supabase_admin._request("GET", animals_query)
-            animals_data = supabase_admin.process_response(animals_response)
-            
-            if not animals_data:
-                return []
-            
-            animal_ids = [str(animal["id"]) for animal in animals_data]
-            query += f"&animal_id=in.({','.join(animal_ids)})"
+            # Animais do tutor filtrados no próprio embed (inner join)
+            select = f"{REQUESTS_SELECT},animals!inner(name,tutor_name,email)"
+            filters.append(("animals.email", f"eq.{user_email}"))
             
         elif user_type == "clinic":
             # Para clínicas, buscar pelo clinic_id
@@ -192,70 +221,37 @@ async def list_appointment_requests(
                 logger.warning(f"Clínica {user_email} não possui clinic_id")
                 return []
             
-            query += f"&clinic_id=eq.{clinic_id}"
+            filters.append(("clinic_id", f"eq.{clinic_id}"))
         
         # Aplicar filtros
         if status:
-            query += f"&status=eq.{status}"
+            filters.append(("status", f"eq.{status}"))
         
         if status_solicitacao:
-            query += f"&status_solicitacao=eq.{status_solicitacao}"
+            filters.append(("status_solicitacao", f"eq.{status_solicitacao}"))
         
         if date_from:
-            query += f"&date=gte.{date_from.isoformat()}"
+            filters.append(("date", f"gte.{date_from.isoformat()}"))
         
         if date_to:
-            query += f"&date=lte.{date_to.isoformat()}"
-        
-        # Ordenar por data e hora
-        query += "&order=date.desc,start_time.desc"
-        
-        # Executar query
-        response = await supabase_admin._request("GET", query)
-        appointments_data = supabase_admin.process_response(response)
-        
-        if not appointments_data:
-            return []
-        
-        # Buscar informações dos animais para cada appointment
-        detailed_requests = []
-        for appointment in appointments_data:
-            try:
-                # Buscar dados do animal
-                animal_query = f"/rest/v1/animals?id=eq.{appointment['animal_id']}"
-                animal_response = await supabase_admin._request("GET", animal_query)
-                animal_data = supabase_admin.process_response(animal_response)
-                
-                animal = animal_data[0] if animal_data else {}
-                
-                # Criar resposta formatada
-                request_response = AppointmentRequestResponse(
-                    id=str(appointment["id"]),
-                    animal_id=str(appointment["animal_id"]),
-                    animal_name=animal.get("name"),
-                    tutor_name=animal.get("tutor_name"),
-                    tutor_email=animal.get("email"),
-                    service=appointment.get("description", ""),
-                    date=appointment["date"],
-                    start_time=appointment["start_time"],
-                    end_time=appointment.get("end_time"),
-                    notes=appointment.get("observacoes_cliente"),
-                    priority="normal",  # Default priority
-                    status=appointment["status"],
-                    status_solicitacao=appointment.get("status_solicitacao", "aguardando_aprovacao"),
-                    created_at=appointment["created_at"],
-                    updated_at=appointment.get("updated_at")
-                )
-                
-                detailed_requests.append(request_response)
-                
-            except Exception as e:
-                logger.warning(f"Erro ao processar appointment {appointment['id']}: {e}")
-                continue
+            filters.append(("date", f"lte.{date_to.isoformat()}"))
+
+        page = await fetch_page(
+            "appointments", REQUESTS_KEYSET, filters, select=select,
+            limit=limit, cursor=cursor, include_total=include_total,
+        )
+        page.apply_headers(http_response)
+
+        detailed_requests = [
+            _request_response(appointment, appointment.get("animals") or {})
+            for appointment in page.items
+        ]
         
         logger.info(f"Encontradas {len(detailed_requests)} solicitações de agendamento")
         return detailed_requests
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao listar solicitações de agendamento: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro interno ao listar solicitações: {str(e)}")
@@ -408,14 +404,33 @@ async def update_appointment_request(
         
         update_fields["updated_at"] = DateTime.now().isoformat()
         
+        # Agendamentos que ocupam a agenda não podem ser movidos para um horário ocupado
+        new_status = update_fields.get("status", appointment.get("status"))
+        if new_status in BLOCKING_STATUSES and {"date", "start_time", "end_time", "status"} & update_fields.keys():
+            await ensure_no_conflict(
+                appointment.get("clinic_id"),
+                update_fields.get("date", appointment.get("date")),
+                update_fields.get("start_time", appointment.get("start_time")),
+                update_fields.get("end_time", appointment.get("end_time")),
+                exclude_id=request_id,
+                status_code=409,
+                detail="Conflito de horário detectado",
+            )
+        
         # Executar atualização
         update_query = f"/rest/v1/appointments?id=eq.{request_id}"
         update_response = await supabase_admin._request("PATCH", update_query, json=update_fields)
+        if is_schedule_conflict(update_response):
+            invalidate_schedule(appointment.get("clinic_id"))
+            raise HTTPException(status_code=409, detail="Conflito de horário detectado")
         updated_data = supabase_admin.process_response(update_response)
         
         if not updated_data:
             raise HTTPException(status_code=404, detail="Solicitação não encontrada")
         
+        invalidate_dashboard(appointment.get("clinic_id"), DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
+        invalidate_schedule(appointment.get("clinic_id"))
+        
         # Buscar dados do animal para resposta
         animal_query = f"/rest/v1/animals?id=eq.{appointment['animal_id']}"
         animal_response = await supabase_admin._request("GET", animal_query)
@@ -490,20 +505,16 @@ async def approve_appointment_request(
         if appointment.get("status_solicitacao") != "aguardando_aprovacao":
             raise HTTPException(status_code=400, detail="Apenas solicitações aguardando aprovação podem ser aprovadas")
         
-        # Verificar conflitos de horário novamente
-        if appointment.get("end_time"):
-            conflict_query = f"/rest/v1/appointments?clinic_id=eq.{appointment['clinic_id']}"
-            conflict_query += f"&date=eq.{appointment['date']}"
-            conflict_query += f"&start_time=lt.{appointment['end_time']}"
-            conflict_query += f"&end_time=gt.{appointment['start_time']}"
-            conflict_query += "&status=in.(scheduled,confirmed)"
-            conflict_query += f"&id=neq.{request_id}"
-            
-            conflict_response = await supabase_admin._request("GET", conflict_query)
-            conflict_data = supabase_admin.process_response(conflict_response)
-            
-            if conflict_data:
-                raise HTTPException(status_code=409, detail="Conflito de horário detectado")
+        # Verificar conflitos de horário novamente (mesma regra de create/update)
+        await ensure_no_conflict(
+            appointment["clinic_id"],
+            appointment["date"],
+            appointment["start_time"],
+            appointment.get("end_time"),
+            exclude_id=request_id,
+            status_code=409,
+            detail="Conflito de horário detectado",
+        )
         
         # Atualizar status da solicitação para aprovada
         update_query = f"/rest/v1/appointments?id=eq.{request_id}"
@@ -513,11 +524,18 @@ async def approve_appointment_request(
             "updated_at": DateTime.now().isoformat()
         }
         update_response = await supabase_admin._request("PATCH", update_query, json=update_data)
+        # Aprovação concorrente para o mesmo horário: a constraint do banco rejeita a segunda
+        if is_schedule_conflict(update_response):
+            invalidate_schedule(clinic_id, appointment["date"])
+            raise HTTPException(status_code=409, detail="Conflito de horário detectado")
         updated_appointment = supabase_admin.process_response(update_response)
         
         if not updated_appointment:
             raise HTTPException(status_code=500, detail="Erro ao aprovar solicitação")
         
+        invalidate_dashboard(clinic_id, DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
+        invalidate_schedule(clinic_id, appointment["date"])
+        
         logger.info(f"Solicitação {request_id} aprovada com sucesso")
         return {
             "message": "Solicitação aprovada com sucesso",
@@ -590,6 +608,8 @@ async def reject_appointment_request(
         if not updated_data:
             raise HTTPException(status_code=404, detail="Solicitação não encontrada")
         
+        invalidate_dashboard(appointment.get("clinic_id"), DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
+        
         logger.info(f"Solicitação {request_id} rejeitada")
         return {
             "message": "Solicitação rejeitada com sucesso",
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, HTTPException, Query, Body, Path, Depends
+from fastapi import APIRouter, HTTPException, Query, Body, Path, Depends, Response
 from typing import Dict, Any, List, Optional
-from ..models.appointment import AppointmentCreate, AppointmentResponse, AppointmentUpdate
+from ..models.appointment import AppointmentCreate, AppointmentResponse, AppointmentUpdate, AvailabilityResponse
 from ..db.supabase import supabase_admin
 from uuid import UUID
 import logging
-from datetime import date, time, datetime
+import time as time_module
+from datetime import date, time, datetime, timedelta
 import httpx
 from ..api.auth import get_current_user
+from ..api.dashboard import invalidate_dashboard, DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY
+from ..core.cache import TTLCache
+from ..core.config import SCHEDULE_INDEX_TTL, SCHEDULE_INDEX_MAXSIZE
+from ..core.scheduling import (
+    BLOCKING_STATUSES, ScheduleIndex, format_seconds, free_slots, interval_seconds, merge_intervals, to_seconds,
+)
+from .pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, Keyset, fetch_page
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -15,6 +23,193 @@ logger = logging.getLogger(__name__)
 # Definir o router
 router = APIRouter()
 
+# Índices de intervalos da agenda por (clinic_id, data); a exclusion constraint
+# appointments_sem_sobreposicao garante a regra no banco entre processos. Os índices só
+# ficam em cache com a constraint ativa: sem ela, cada verificação lê o dia do banco
+schedule_indexes = TTLCache(maxsize=SCHEDULE_INDEX_MAXSIZE, ttl=SCHEDULE_INDEX_TTL, name="schedule")
+_schedule_generation: Dict[str, int] = {}
+
+SCHEDULE_CONSTRAINT = "appointments_sem_sobreposicao"
+
+# Constraint ativa no banco (RPC appointments_sem_sobreposicao_ativa); None = ainda não verificado.
+# Ausente, é verificada de novo a cada _CONSTRAINT_RECHECK_INTERVAL segundos (a migração pode ser reexecutada)
+_constraint_active: Optional[bool] = None
+_constraint_checked_at = 0.0
+_CONSTRAINT_RECHECK_INTERVAL = 300.0
+
+
+async def _schedule_constraint_active() -> bool:
+    global _constraint_active, _constraint_checked_at
+    now = time_module.monotonic()
+    if _constraint_active or (
+        _constraint_active is not None and now - _constraint_checked_at < _CONSTRAINT_RECHECK_INTERVAL
+    ):
+        return bool(_constraint_active)
+
+    response = await supabase_admin.rpc("appointments_sem_sobreposicao_ativa")
+    if "error" in response:
+        if supabase_admin.is_missing_object(response):
+            logger.warning(f"RPC appointments_sem_sobreposicao_ativa não existe; agenda sem cache: {response['error']}")
+            _constraint_active, _constraint_checked_at = False, now
+        else:
+            # Falha transitória: não guardar nada desta vez e verificar de novo na próxima
+            logger.warning(f"Falha ao verificar {SCHEDULE_CONSTRAINT}: {response['error']}")
+        return False
+    _constraint_active = supabase_admin.process_response(response) is True
+    _constraint_checked_at = now
+    if not _constraint_active:
+        logger.warning(f"Constraint {SCHEDULE_CONSTRAINT} ausente; agenda lida do banco a cada verificação")
+    return _constraint_active
+
+
+def invalidate_schedule(clinic_id: Optional[Any], day: Optional[Any] = None) -> None:
+    """Invalida o índice da agenda de uma clínica (um dia ou todos)."""
+    if not clinic_id:
+        return
+    clinic_id = str(clinic_id)
+    _schedule_generation[clinic_id] = _schedule_generation.get(clinic_id, 0) + 1
+    day = str(day) if day is not None else None
+    schedule_indexes.invalidate_where(lambda key, _v: key[0] == clinic_id and (day is None or key[1] == day))
+
+
+async def get_schedule_index(clinic_id: Any, day: Any, fresh: bool = False) -> ScheduleIndex:
+    """
+    Índice do dia da agenda (agendamentos que bloqueiam horário), carregado com uma consulta.
+    Com `fresh`, ignora o cache e relê o dia do banco.
+    """
+    key = (str(clinic_id), str(day))
+    index = None if fresh else schedule_indexes.get(key)
+    if index is not None:
+        return index
+
+    generation = _schedule_generation.get(key[0], 0)
+    response = await supabase_admin._request(
+        "GET",
+        f"/rest/v1/appointments?clinic_id=eq.{key[0]}&date=eq.{key[1]}"
+        f"&status=in.({','.join(BLOCKING_STATUSES)})&select=id,start_time,end_time"
+    )
+    if "error" in response:
+        logger.error(f"Erro ao carregar agenda de {key[1]} da clínica {key[0]}: {response['error']}")
+        raise HTTPException(status_code=500, detail="Erro ao verificar conflitos de horário")
+    index = ScheduleIndex(supabase_admin.process_response(response) or [])
+    # Não guardar um índice montado enquanto a agenda era alterada
+    if _schedule_generation.get(key[0], 0) == generation and await _schedule_constraint_active():
+        schedule_indexes.set(key, index)
+    return index
+
+
+async def ensure_no_conflict(
+    clinic_id: Any,
+    day: Any,
+    start_time: Any,
+    end_time: Any = None,
+    exclude_id: Any = None,
+    status_code: int = 400,
+    detail: str = "Já existe um agendamento neste horário",
+) -> None:
+    """
+    Levanta HTTPException se [start_time, end_time) sobrepõe outro agendamento ativo do dia.
+    Um conflito no índice em cache é confirmado relendo o dia do banco antes de rejeitar
+    (o horário pode ter sido liberado por outro processo).
+    """
+    cached = schedule_indexes.get((str(clinic_id), str(day)))
+    if cached is not None and cached.find_conflict(start_time, end_time, exclude_id=exclude_id) is None:
+        return
+    index = await get_schedule_index(clinic_id, day, fresh=True)
+    conflict = index.find_conflict(start_time, end_time, exclude_id=exclude_id)
+    if conflict:
+        logger.warning(f"Conflito de horário em {day} ({start_time}-{end_time}) com o agendamento {conflict['id']}")
+        raise HTTPException(status_code=status_code, detail=detail)
+
+
+# Maior janela (em dias) aceita na busca de horários livres
+AVAILABILITY_MAX_DAYS = 31
+
+
+async def find_free_slots(
+    clinic_id: Any,
+    data_inicio: date,
+    data_fim: date,
+    duracao_minutos: int,
+    abertura: time,
+    fechamento: time,
+    intervalo_minutos: int = 0,
+    passo_minutos: Optional[int] = None,
+    dias_semana: Optional[List[int]] = None,
+) -> Dict[str, Any]:
+    """
+    Horários livres da clínica no período: uma consulta aos agendamentos que bloqueiam
+    horário e, por dia, mescla dos ocupados (com `intervalo_minutos` de folga) e varredura
+    do expediente. Dias no passado e horários já passados de hoje são ignorados.
+    """
+    if data_fim < data_inicio:
+        raise HTTPException(status_code=400, detail="data_fim deve ser igual ou posterior a data_inicio")
+    if (data_fim - data_inicio).days + 1 > AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Período máximo de {AVAILABILITY_MAX_DAYS} dias")
+    if fechamento <= abertura:
+        raise HTTPException(status_code=400, detail="Horário de fechamento deve ser posterior ao de abertura")
+
+    response = await supabase_admin._request(
+        "GET",
+        f"/rest/v1/appointments?clinic_id=eq.{clinic_id}"
+        f"&date=gte.{data_inicio.isoformat()}&date=lte.{data_fim.isoformat()}"
+        f"&status=in.({','.join(BLOCKING_STATUSES)})&select=date,start_time,end_time"
+    )
+    if "error" in response:
+        logger.error(f"Erro ao buscar agenda da clínica {clinic_id}: {response['error']}")
+        raise HTTPException(status_code=500, detail="Erro ao buscar horários livres")
+
+    ocupados: Dict[str, List[tuple]] = {}
+    for appointment in supabase_admin.process_response(response) or []:
+        interval = interval_seconds(appointment.get("start_time"), appointment.get("end_time"))
+        if interval:
+            ocupados.setdefault(str(appointment.get("date")), []).append(interval)
+
+    now = datetime.now()
+    open_s, close_s = to_seconds(abertura), to_seconds(fechamento)
+    dias = []
+    total = 0
+    day = max(data_inicio, now.date())
+    while day <= data_fim:
+        if not dias_semana or day.isoweekday() in dias_semana:
+            busy = merge_intervals(ocupados.get(day.isoformat(), []), buffer_seconds=intervalo_minutos * 60)
+            not_before = to_seconds(now.time()) if day == now.date() else None
+            slots = free_slots(busy, open_s, close_s, duracao_minutos * 60, (passo_minutos or 0) * 60 or None, not_before)
+            if slots:
+                dias.append({
+                    "date": day,
+                    "slots": [{"start_time": format_seconds(a), "end_time": format_seconds(b)} for a, b in slots],
+                })
+                total += len(slots)
+        day += timedelta(days=1)
+
+    return {
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "duracao_minutos": duracao_minutos,
+        "total_slots": total,
+        "dias": dias,
+    }
+
+
+def parse_dias_semana(value: Optional[str]) -> Optional[List[int]]:
+    """'1,2,3,4,5' (1 = segunda ... 7 = domingo) -> [1, 2, 3, 4, 5]."""
+    if not value:
+        return None
+    try:
+        dias = [int(d) for d in value.split(",") if d.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="dias_semana deve ser uma lista de números de 1 (segunda) a 7 (domingo)")
+    if any(d < 1 or d > 7 for d in dias):
+        raise HTTPException(status_code=400, detail="dias_semana deve ser uma lista de números de 1 (segunda) a 7 (domingo)")
+    return dias
+
+
+def is_schedule_conflict(response: Dict[str, Any]) -> bool:
+    """Verdadeiro se a escrita foi rejeitada pela exclusion constraint de sobreposição."""
+    error = response.get("error") or ""
+    return SCHEDULE_CONSTRAINT in error or "23P01" in error
+
 # Rota de teste para verificar se o router está funcionando
 @router.get("/test", response_model=Dict[str, str])
 async def test_appointment_router():
@@ -54,34 +249,11 @@ async def create_appointment(
         if not animal_result:
             raise HTTPException(status_code=404, detail="Animal não encontrado ou não pertence a esta clínica")
         
-        # 2. Verificar conflitos de horário
-        appointments_response = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/appointments?clinic_id=eq.{str(clinic_id)}&date=eq.{appointment.date.isoformat()}&status=eq.scheduled&select=*"
-        )
-        
-        # Tratar a resposta para verificar conflitos
-        appointments_result = supabase_admin.process_response(appointments_response)
-        
-        # Verificação manual de conflito
-        if appointments_result:
-            for existing in appointments_result:
-                # Verificar se end_time existe e não é nulo em ambos os registros
-                existing_end_time = existing.get("end_time")
-                appointment_end_time = appointment.end_time
-                
-                # Se algum dos horários de término for nulo, não podemos verificar conflito completamente
-                if existing_end_time is None or appointment_end_time is None:
-                    # Se os horários de início coincidem, consideramos conflito
-                    if existing["start_time"] == appointment.start_time.isoformat():
-                        raise HTTPException(status_code=400, detail="Já existe um agendamento neste horário de início")
-                    # Caso contrário, permitimos o agendamento (risco de sobreposição)
-                    continue
-                
-                # Verificação normal de conflito quando ambos end_time estão presentes
-                if (existing["start_time"] <= appointment_end_time.isoformat() and
-                    existing_end_time >= appointment.start_time.isoformat()):
-                    raise HTTPException(status_code=400, detail="Já existe um agendamento neste horário")
+        # 2. Verificar conflitos de horário (índice de intervalos do dia)
+        if appointment.status in BLOCKING_STATUSES:
+            await ensure_no_conflict(
+                clinic_id, appointment.date.isoformat(), appointment.start_time, appointment.end_time
+            )
         
         # 3. Inserir o agendamento
         appointment_data = {
@@ -103,10 +275,20 @@ async def create_appointment(
             json=appointment_data
         )
         
+        # Outro processo pode ter ocupado o horário entre a verificação e a inserção
+        if is_schedule_conflict(new_appointment_response):
+            invalidate_schedule(clinic_id, appointment.date.isoformat())
+            raise HTTPException(status_code=400, detail="Já existe um agendamento neste horário")
+        
         # Tratar a resposta do POST
         new_appointment = supabase_admin.process_response(new_appointment_response, single_item=True)
         
         if new_appointment:
+            invalidate_dashboard(clinic_id, DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
+            if appointment.status in BLOCKING_STATUSES:
+                index = schedule_indexes.get((str(clinic_id), appointment.date.isoformat()))
+                if index is not None:
+                    index.add(new_appointment.get("id"), appointment.start_time, appointment.end_time)
             logger.info(f"Agendamento criado com sucesso: {new_appointment}")
             return new_appointment
         else:
@@ -122,15 +304,22 @@ async def create_appointment(
             error_detail = f"{error_detail} - Response: {e.response.text}"
         raise HTTPException(status_code=500, detail=f"Erro interno no servidor: {error_detail}")
 
+# Ordem da listagem de agendamentos (o id desempata horários iguais)
+APPOINTMENTS_KEYSET = Keyset("date.asc", "start_time.asc", "id.asc")
+
 @router.get("", response_model=List[AppointmentResponse])
 async def get_appointments(
+    http_response: Response,
     animal_id: Optional[UUID] = Query(None, description="Filtrar por ID do animal"),
     date_from: Optional[date] = Query(None, description="Filtrar a partir desta data"),
     status: Optional[str] = Query(None, description="Filtrar por status"),
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ) -> List[Dict[str, Any]]:
     """
-    Obtém todos os agendamentos da clínica autenticada, com filtros opcionais.
+    Obtém os agendamentos da clínica autenticada, com filtros opcionais, paginados por cursor.
     """
     clinic_id = current_user.get("id")
     if not clinic_id:
@@ -139,32 +328,26 @@ async def get_appointments(
     logger.info(f"Listando agendamentos para clinic_id: {clinic_id} com filtros animal_id={animal_id}, date_from={date_from}, status={status}")
 
     try:
-        # Construir a query base
-        query = f"/rest/v1/appointments?clinic_id=eq.{str(clinic_id)}"
-        
-        # Adicionar filtros opcionais
+        # Filtros base e opcionais
+        filters = [("clinic_id", f"eq.{str(clinic_id)}")]
         if animal_id:
-            query += f"&animal_id=eq.{str(animal_id)}"
+            filters.append(("animal_id", f"eq.{str(animal_id)}"))
         if date_from:
-            query += f"&date=gte.{date_from.isoformat()}"
+            filters.append(("date", f"gte.{date_from.isoformat()}"))
         if status:
-            query += f"&status=eq.{status}"
-            
-        # Adicionar ordenação
-        query += "&order=date.asc,start_time.asc"
-        query += "&select=*"
-        
-        # Log da query final
-        logger.debug(f"Executando query Supabase: {query}")
+            filters.append(("status", f"eq.{status}"))
 
-        response = await supabase_admin._request("GET", query)
-        
-        # Tratar a resposta para garantir que retornamos uma lista
-        result = supabase_admin.process_response(response)
+        page = await fetch_page(
+            "appointments", APPOINTMENTS_KEYSET, filters,
+            limit=limit, cursor=cursor, include_total=include_total,
+        )
+        page.apply_headers(http_response)
         
-        logger.info(f"Encontrados {len(result)} agendamentos com os filtros aplicados")
-        return result
+        logger.info(f"Encontrados {len(page.items)} agendamentos com os filtros aplicados")
+        return page.items
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar agendamentos: {e}", exc_info=True)
         error_detail = str(e)
@@ -172,6 +355,38 @@ async def get_appointments(
             error_detail = f"{error_detail} - Response: {e.response.text}"
         raise HTTPException(status_code=500, detail=f"Erro ao buscar agendamentos: {error_detail}")
 
+@router.get("/disponibilidade", response_model=AvailabilityResponse)
+async def get_availability(
+    data_inicio: date = Query(..., description="Primeiro dia da busca"),
+    data_fim: Optional[date] = Query(None, description="Último dia da busca (padrão: data_inicio)"),
+    duracao_minutos: int = Query(30, ge=5, le=480, description="Duração de cada horário"),
+    abertura: time = Query(time(8, 0), description="Início do expediente"),
+    fechamento: time = Query(time(18, 0), description="Fim do expediente"),
+    intervalo_minutos: int = Query(0, ge=0, le=240, description="Folga antes e depois de cada agendamento existente"),
+    passo_minutos: Optional[int] = Query(None, ge=5, le=480, description="Espaçamento entre inícios (padrão: a duração)"),
+    dias_semana: Optional[str] = Query(None, description="Dias atendidos, ex.: 1,2,3,4,5 (1 = segunda, 7 = domingo)"),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Lista os horários livres da clínica autenticada no período, para escolher um horário
+    antes de criar o agendamento.
+    """
+    clinic_id = current_user.get("id")
+    if not clinic_id:
+        raise HTTPException(status_code=401, detail="Usuário não autenticado ou ID da clínica não encontrado no token")
+
+    return await find_free_slots(
+        clinic_id,
+        data_inicio,
+        data_fim or data_inicio,
+        duracao_minutos,
+        abertura,
+        fechamento,
+        intervalo_minutos,
+        passo_minutos,
+        parse_dias_semana(dias_semana),
+    )
+
 @router.get("/{appointment_id}", response_model=AppointmentResponse)
 async def get_appointment(
     appointment_id: UUID = Path(..., description="ID do agendamento"),
@@ -252,6 +467,8 @@ async def delete_appointment(
             logger.error(f"Erro ao deletar agendamento {appointment_id}: ainda encontrado após DELETE.")
             raise HTTPException(status_code=500, detail="Erro interno: Falha ao deletar o agendamento.")
 
+        invalidate_dashboard(clinic_id, DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
+        invalidate_schedule(clinic_id)
         logger.info(f"Agendamento {appointment_id} removido com sucesso")
         return {"message": "Agendamento removido com sucesso"}
         
@@ -322,42 +539,18 @@ async def update_appointment(
             logger.warning(f"Nenhum dado fornecido para atualização do agendamento {appointment_id}")
             raise HTTPException(status_code=400, detail="Nenhum dado fornecido para atualização")
 
-        # Verificar conflito de horário, se data/hora forem atualizados
-        if "date" in update_data or "start_time" in update_data:
-            new_date = update_data.get("date", current_appointment["date"])
-            new_start_str = update_data.get("start_time", current_appointment["start_time"])
-            # A lógica de verificação de conflito precisa ser robusta
-            # Buscando outros agendamentos no mesmo dia para a clínica
-            if clinic_id:
-                conflict_check_query = (
-                    f"/rest/v1/appointments?clinic_id=eq.{clinic_id}"
-                    f"&date=eq.{new_date}"
-                    f"&status=eq.scheduled" # Apenas conflita com agendamentos ativos
-                    f"&id=neq.{appointment_id}" # Exclui o próprio agendamento
-                    f"&select=id,start_time,end_time"
+        # Verificar conflito de horário, se data/hora/status forem atualizados
+        if {"date", "start_time", "end_time", "status"} & update_data.keys():
+            new_status = update_data.get("status", current_appointment.get("status"))
+            if new_status in BLOCKING_STATUSES:
+                await ensure_no_conflict(
+                    clinic_id,
+                    update_data.get("date", current_appointment["date"]),
+                    update_data.get("start_time", current_appointment["start_time"]),
+                    update_data.get("end_time", current_appointment.get("end_time")),
+                    exclude_id=appointment_id,
+                    detail="Horário conflita com outro agendamento",
                 )
-                other_apps_resp = await supabase_admin._request("GET", conflict_check_query)
-                other_apps = supabase_admin.process_response(other_apps_resp)
-
-                new_start_time_obj = datetime.strptime(new_start_str, '%H:%M:%S').time()
-                new_end_time_str = update_data.get("end_time", current_appointment.get("end_time"))
-                new_end_time_obj = datetime.strptime(new_end_time_str, '%H:%M:%S').time() if new_end_time_str else None
-
-                for app in other_apps:
-                    app_start_time = datetime.strptime(app["start_time"], '%H:%M:%S').time()
-                    app_end_time_str = app.get("end_time")
-                    app_end_time = datetime.strptime(app_end_time_str, '%H:%M:%S').time() if app_end_time_str else None
-
-                    # Lógica de verificação de sobreposição
-                    # Caso 1: Ambos têm hora de fim
-                    if new_end_time_obj and app_end_time:
-                        if max(new_start_time_obj, app_start_time) < min(new_end_time_obj, app_end_time):
-                             logger.warning(f"Conflito de horário detectado para {appointment_id} com {app['id']}")
-                             raise HTTPException(status_code=400, detail="Horário conflita com outro agendamento")
-                    # Caso 2: Um ou ambos não têm hora de fim (considera conflito se início for igual)
-                    elif new_start_time_obj == app_start_time:
-                         logger.warning(f"Conflito de horário (início igual) detectado para {appointment_id} com {app['id']}")
-                         raise HTTPException(status_code=400, detail="Horário de início conflita com outro agendamento")
 
         # Atualizar usando PATCH e Prefer: return=representation
         headers = supabase_admin.admin_headers.copy()
@@ -369,7 +562,13 @@ async def update_appointment(
             headers=headers
         )
 
+        if is_schedule_conflict(update_response):
+            invalidate_schedule(clinic_id)
+            raise HTTPException(status_code=400, detail="Horário conflita com outro agendamento")
+
         updated_appointment_data = supabase_admin.process_response(update_response)
+        invalidate_dashboard(clinic_id, DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
+        invalidate_schedule(clinic_id)
 
         if not updated_appointment_data:
             logger.error(f"Agendamento {appointment_id} não encontrado após atualização ou erro na resposta.")
@@ -2,17 +2,176 @@ from fastapi import APIRouter, HTTPException, Depends, Body, status, Header
 from typing import Dict, Any, Optional
 import httpx
 import jwt
+import time
 from datetime import datetime
 import logging
 
 from ..models.user import UserCreate, UserResponse, ClinicProfileUpdate
 from ..models.tutor import DualLoginData, UserTypeResponse, ClientAuthResponse
-from ..db.supabase import supabase_admin
+from ..db.supabase import supabase_admin, get_http_client
+from ..core.config import (
+    SUPABASE_AUTH_MODE,
+    SUPABASE_JWT_SECRET,
+    SUPABASE_JWT_AUDIENCE,
+    SUPABASE_JWKS_URL,
+    SUPABASE_JWKS_CACHE_TTL,
+    SUPABASE_JWKS_MIN_REFETCH_INTERVAL,
+    PRINCIPAL_CACHE_TTL,
+    PRINCIPAL_CACHE_MAXSIZE,
+)
+from ..core.cache import TTLCache
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
+# Cache user_id -> identidade resolvida (tipo, clinic_data / animals do tutor)
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_MAXSIZE, ttl=PRINCIPAL_CACHE_TTL, name="principal")
+
+
+def invalidate_principal(user_id: Optional[str] = None, email: Optional[str] = None) -> None:
+    """
+    Remove do cache a identidade de um usuário, por id e/ou email.
+    Deve ser chamado nas escritas que alteram clínica ou vínculo tutor/animal.
+    """
+    if user_id:
+        principal_cache.pop(str(user_id))
+    if email:
+        email = email.lower()
+        principal_cache.invalidate_where(lambda _k, v: (v.get("email") or "").lower() == email)
+
+
+# Cache das chaves públicas (JWKS) do Supabase Auth: kid -> jwk
+_jwks_cache: Dict[str, Dict[str, Any]] = {}
+_jwks_fetched_at: float = 0.0
+# Última tentativa de busca (com ou sem sucesso), para limitar refetches
+_jwks_attempted_at: Optional[float] = None
+
+
+async def _get_jwk(kid: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Retorna a chave pública (JWK) correspondente ao `kid`, usando cache com TTL.
+    Recarrega o JWKS quando o cache expira ou o `kid` é desconhecido (rotação de chaves),
+    no máximo uma vez a cada SUPABASE_JWKS_MIN_REFETCH_INTERVAL segundos: tokens com `kid`
+    forjado ou falhas do Supabase não viram uma chamada ao JWKS por requisição.
+    """
+    global _jwks_cache, _jwks_fetched_at, _jwks_attempted_at
+    now = time.monotonic()
+    expired = (now - _jwks_fetched_at) > SUPABASE_JWKS_CACHE_TTL
+    throttled = _jwks_attempted_at is not None and (now - _jwks_attempted_at) < SUPABASE_JWKS_MIN_REFETCH_INTERVAL
+    if (expired or (kid and kid not in _jwks_cache)) and not throttled:
+        _jwks_attempted_at = now
+        try:
+            response = await get_http_client().get(
+                SUPABASE_JWKS_URL,
+                headers={"apikey": supabase_admin.key}
+            )
+            response.raise_for_status()
+            keys = response.json().get("keys", [])
+            _jwks_cache = {k.get("kid"): k for k in keys if isinstance(k, dict)}
+            _jwks_fetched_at = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Não foi possível obter JWKS do Supabase: {str(e)}")
+    if kid:
+        return _jwks_cache.get(kid)
+    # Sem kid no header: só é seguro usar a chave se houver apenas uma publicada
+    return next(iter(_jwks_cache.values())) if len(_jwks_cache) == 1 else None
+
+
+async def _verify_token_locally(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Valida o JWT localmente (assinatura, `exp` e `aud`) sem chamar o Supabase Auth.
+
+    Retorna os dados do usuário no mesmo formato relevante de /auth/v1/user
+    (id, email, user_metadata) ou None quando não há chave disponível para o
+    algoritmo do token, caso em que o chamador deve recorrer à validação remota.
+    Tokens inválidos ou expirados levantam `jwt.PyJWTError`.
+    """
+    if SUPABASE_AUTH_MODE != "local":
+        return None
+
+    header = jwt.get_unverified_header(token)
+    alg = header.get("alg")
+
+    if alg == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            return None
+        key: Any = SUPABASE_JWT_SECRET
+    elif alg in ("RS256", "ES256", "EdDSA"):
+        jwk = await _get_jwk(header.get("kid"))
+        if not jwk:
+            return None
+        try:
+            key = jwt.PyJWK(jwk, algorithm=alg).key
+        except jwt.PyJWKError as e:
+            # Ex.: pacote `cryptography` ausente para chaves assimétricas
+            logger.warning(f"Chave JWKS não utilizável localmente: {str(e)}")
+            return None
+    else:
+        return None
+
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=[alg],
+        audience=SUPABASE_JWT_AUDIENCE,
+        options={"require": ["exp", "sub"]},
+    )
+    return {
+        "id": claims.get("sub"),
+        "email": claims.get("email"),
+        "user_metadata": claims.get("user_metadata", {}),
+    }
+
+
+async def _fetch_user_remote(token: str) -> Dict[str, Any]:
+    """Valida o token consultando /auth/v1/user no Supabase (fallback)."""
+    # Headers para a requisição ao Supabase para validar o token do USUÁRIO
+    # Garantir que APENAS o token do usuário seja usado para "Authorization"
+    # e os outros headers necessários do supabase_admin (como apikey) sejam mantidos.
+    request_headers = supabase_admin.headers.copy() # Copia os headers base (apikey, etc.)
+    request_headers["Authorization"] = f"Bearer {token}" # Define/Sobrescreve o Authorization com o token do usuário
+
+    logger.debug(f"Enviando requisição para Supabase /auth/v1/user com headers: {request_headers}")
+
+    client = get_http_client()
+    response = await client.get(
+        f"{supabase_admin.url}/auth/v1/user",
+        headers=request_headers
+    )
+    logger.debug(f"Resposta do Supabase /auth/v1/user: Status {response.status_code}, Conteúdo: {response.text}")
+    response.raise_for_status() # Levanta exceção para 4xx/5xx
+    return response.json()
+
+
+async def _resolve_principal(user_id: str, user_email: Optional[str]) -> Dict[str, Any]:
+    """Identifica se o usuário é uma clínica ou tutor consultando as tabelas."""
+    # Verificar se é uma clínica
+    clinic_result = await supabase_admin.get_by_eq("clinics", "id", user_id)
+    if clinic_result:
+        logger.debug(f"Usuário {user_email} identificado como clínica")
+        return {
+            "email": user_email,
+            "user_type": "clinic",
+            "clinic_id": user_id,  # O clinic_id é o próprio user_id
+            "clinic_data": clinic_result[0]
+        }
+
+    # Verificar se é um tutor (animal com este email)
+    animal_result = await supabase_admin.get_by_eq("animals", "email", user_email)
+    if animal_result:
+        logger.debug(f"Usuário {user_email} identificado como tutor")
+        return {
+            "email": user_email,
+            "user_type": "tutor",
+            "animals": animal_result
+        }
+
+    # Se não encontrou nem clínica nem tutor, retorna como usuário genérico
+    logger.warning(f"Usuário {user_email} não encontrado nas tabelas clinics ou animals")
+    return {"email": user_email, "user_type": "unknown"}
+
+
 async def get_current_user(authorization: str = Header(...)) -> Dict[str, Any]:
     """
     Dependência para obter o usuário atual a partir do token JWT.
@@ -28,64 +187,32 @@ async def get_current_user(authorization: str = Header(...)) -> Dict[str, Any]:
         token = authorization.split(" ")[1] # Mais robusto que replace
         logger.debug(f"Token extraído: {token}")
         
-        # Headers para a requisição ao Supabase para validar o token do USUÁRIO
-        # Garantir que APENAS o token do usuário seja usado para "Authorization"
-        # e os outros headers necessários do supabase_admin (como apikey) sejam mantidos.
-        request_headers = supabase_admin.headers.copy() # Copia os headers base (apikey, etc.)
-        request_headers["Authorization"] = f"Bearer {token}" # Define/Sobrescreve o Authorization com o token do usuário
-
-        logger.debug(f"Enviando requisição para Supabase /auth/v1/user com headers: {request_headers}")
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{supabase_admin.url}/auth/v1/user",
-                headers=request_headers
-            )
-            logger.debug(f"Resposta do Supabase /auth/v1/user: Status {response.status_code}, Conteúdo: {response.text}")
-            response.raise_for_status() # Levanta exceção para 4xx/5xx
-            user_data = response.json()
-            
-            # Verificar se user_data contém as informações esperadas
-            if not user_data or not user_data.get("id"):
-                logger.error(f"Resposta inesperada do Supabase /auth/v1/user: {user_data}")
-                raise HTTPException(status_code=500, detail="Resposta inesperada do serviço de autenticação")
-            
-            user_id = user_data.get("id")
-            user_email = user_data.get("email")
-            
-            # Verificar se é uma clínica
-            clinic_result = await supabase_admin.get_by_eq("clinics", "id", user_id)
-            if clinic_result:
-                logger.debug(f"Usuário {user_email} identificado como clínica")
-                return {
-                    "id": user_id,
-                    "email": user_email,
-                    "user_metadata": user_data.get("user_metadata", {}),
-                    "user_type": "clinic",
-                    "clinic_id": user_id,  # O clinic_id é o próprio user_id
-                    "clinic_data": clinic_result[0]
-                }
-            
-            # Verificar se é um tutor (animal com este email)
-            animal_result = await supabase_admin.get_by_eq("animals", "email", user_email)
-            if animal_result:
-                logger.debug(f"Usuário {user_email} identificado como tutor")
-                return {
-                    "id": user_id,
-                    "email": user_email,
-                    "user_metadata": user_data.get("user_metadata", {}),
-                    "user_type": "tutor",
-                    "animals": animal_result
-                }
-            
-            # Se não encontrou nem clínica nem tutor, retorna como usuário genérico
-            logger.warning(f"Usuário {user_email} não encontrado nas tabelas clinics ou animals")
-            return {
-                "id": user_id,
-                "email": user_email,
-                "user_metadata": user_data.get("user_metadata", {}),
-                "user_type": "unknown"
-            }
+        # Validação local da assinatura; só consulta o Supabase Auth se não houver chave
+        user_data = await _verify_token_locally(token)
+        if user_data is None:
+            user_data = await _fetch_user_remote(token)
+        
+        # Verificar se user_data contém as informações esperadas
+        if not user_data or not user_data.get("id"):
+            logger.error(f"Resposta inesperada do Supabase /auth/v1/user: {user_data}")
+            raise HTTPException(status_code=500, detail="Resposta inesperada do serviço de autenticação")
+        
+        user_id = user_data.get("id")
+        user_email = user_data.get("email")
+        
+        principal = principal_cache.get(user_id)
+        if principal is None:
+            principal = await _resolve_principal(user_id, user_email)
+            # Usuário ainda não vinculado não é cacheado: o vínculo pode surgir a qualquer escrita
+            if principal.get("user_type") != "unknown":
+                principal_cache.set(user_id, principal)
+
+        return {
+            "id": user_id,
+            "email": user_email,
+            "user_metadata": user_data.get("user_metadata", {}),
+            **{k: v for k, v in principal.items() if k != "email"},
+        }
     
     except httpx.HTTPStatusError as exc:
         logger.error(f"Erro HTTP ao validar token com Supabase: {exc.response.status_code} - {exc.response.text}", exc_info=True)
@@ -97,9 +224,15 @@ async def get_current_user(authorization: str = Header(...)) -> Dict[str, Any]:
             detail_message = "Token JWT inválido (bad_jwt)."
         raise HTTPException(status_code=401, detail=detail_message) # Retorna 401 para o cliente
 
-    except jwt.PyJWTError: # Embora a validação JWT local não pareça ser o caso aqui.
-        logger.warning("Erro de decodificação JWT (PyJWTError)", exc_info=True)
-        raise HTTPException(status_code=401, detail="Token JWT malformado.")
+    except HTTPException:
+        raise
+
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token inválido ou expirado.")
+
+    except jwt.PyJWTError:
+        logger.warning("Erro de validação JWT (PyJWTError)", exc_info=True)
+        raise HTTPException(status_code=401, detail="Token JWT inválido.")
     
     except Exception as e:
         logger.error(f"Exceção não esperada em get_current_user: {str(e)}", exc_info=True)
@@ -248,39 +381,39 @@ async def login(email: str = Body(...),
         print(f"Tentando fazer login para: {email}")
         
         # Fazer a requisição POST para login
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                url,
-                headers=supabase_admin.headers,
-                json=data
-            )
-            response.raise_for_status()
-            
-            # Retornar os dados do usuário
-            auth_response = response.json()
-            print(f"Login bem-sucedido para: {email}")
-            
-            # Extrair dados do usuário
-            user = auth_response.get("user", {})
+        client = get_http_client()
+        response = await client.post(
+            url,
+            headers=supabase_admin.headers,
+            json=data
+        )
+        response.raise_for_status()
+        
+        # Retornar os dados do usuário
+        auth_response = response.json()
+        print(f"Login bem-sucedido para: {email}")
+        
+        # Extrair dados do usuário
+        user = auth_response.get("user", {})
+        
+        # Montar resposta no formato exato da documentação da API
+        token = auth_response.get("access_token", "")
+        if not token:
+            print("ALERTA: Token não encontrado na resposta original!")
+            # Tenta encontrar o token em outros campos possíveis
+            token = auth_response.get("accessToken", auth_response.get("token", ""))
             
-            # Montar resposta no formato exato da documentação da API
-            token = auth_response.get("access_token", "")
-            if not token:
-                print("ALERTA: Token não encontrado na resposta original!")
-                # Tenta encontrar o token em outros campos possíveis
-                token = auth_response.get("accessToken", auth_response.get("token", ""))
-                
-            result = {
-                "access_token": token,
-                "token_type": "bearer",
-                "clinic": {
-                    "id": user.get("id", ""),
-                    "name": user.get("user_metadata", {}).get("name", ""),
-                    "email": user.get("email", "")
-                }
+        result = {
+            "access_token": token,
+            "token_type": "bearer",
+            "clinic": {
+                "id": user.get("id", ""),
+                "name": user.get("user_metadata", {}).get("name", ""),
+                "email": user.get("email", "")
             }
-            
-            return result
+        }
+        
+        return result
     
     except Exception as e:
         # Adicionando log mais detalhado
@@ -362,44 +495,44 @@ async def dual_login(login_data: DualLoginData) -> Dict[str, Any]:
             "password": login_data.password
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                url,
-                headers=supabase_admin.headers,
-                json=data
-            )
-            response.raise_for_status()
-            
-            auth_response = response.json()
-            token = auth_response.get("access_token", "")
-            user = auth_response.get("user", {})
-            
-            # Retornar resposta baseada no tipo de usuário
-            if user_type_response.user_type == "clinic":
-                return {
-                    "access_token": token,
-                    "token_type": "bearer",
-                    "user_type": "clinic",
-                    "redirect_url": "/clinic/dashboard",
-                    "clinic": {
-                        "id": user.get("id", ""),
-                        "name": user_type_response.name,
-                        "email": user.get("email", "")
-                    }
+        client = get_http_client()
+        response = await client.post(
+            url,
+            headers=supabase_admin.headers,
+            json=data
+        )
+        response.raise_for_status()
+        
+        auth_response = response.json()
+        token = auth_response.get("access_token", "")
+        user = auth_response.get("user", {})
+        
+        # Retornar resposta baseada no tipo de usuário
+        if user_type_response.user_type == "clinic":
+            return {
+                "access_token": token,
+                "token_type": "bearer",
+                "user_type": "clinic",
+                "redirect_url": "/clinic/dashboard",
+                "clinic": {
+                    "id": user.get("id", ""),
+                    "name": user_type_response.name,
+                    "email": user.get("email", "")
                 }
-            else:  # client
-                return {
-                    "access_token": token,
-                    "token_type": "bearer",
-                    "user_type": "client",
-                    "redirect_url": "/client/dashboard",
-                    "client": {
-                        "id": user_type_response.user_id,
-                        "name": user_type_response.name,
-                        "email": user.get("email", "")
-                    }
+            }
+        else:  # client
+            return {
+                "access_token": token,
+                "token_type": "bearer",
+                "user_type": "client",
+                "redirect_url": "/client/dashboard",
+                "client": {
+                    "id": user_type_response.user_id,
+                    "name": user_type_response.name,
+                    "email": user.get("email", "")
                 }
-                
+            }
+            
     except HTTPException:
         raise
     except Exception as e:
@@ -533,6 +666,9 @@ async def update_clinic_profile(
         else:
             updated_clinic = updated_clinic_list[0]
 
+        # clinic_data em cache ficou desatualizado
+        invalidate_principal(user_id=user_id)
+
         logger.info(f"Perfil da clínica {user_id} atualizado com sucesso.")
         return {
             "id": updated_clinic.get("id"),
@@ -2,12 +2,16 @@
 Rotas de solicitações de agendamento específicas para clientes/tutores
 Utiliza a tabela 'appointments' com campos específicos para solicitações de clientes
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from typing import List, Optional
 from datetime import date, datetime, time
 from pydantic import BaseModel, UUID4
 from ..auth import get_current_user
 from ...db.supabase import supabase_admin as supabase
+from ..dashboard import invalidate_dashboard, DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY
+from ..appointments import ensure_no_conflict, find_free_slots, parse_dias_semana
+from ..pagination import PAGE_SIZE_MAX, Keyset, fetch_page
+from ...models.appointment import AvailabilityResponse
 
 router = APIRouter()
 
@@ -65,24 +69,16 @@ async def create_appointment_request(
         if animal["email"] != current_user.get("email"):
             raise HTTPException(status_code=403, detail="Acesso negado a este animal")
         
-        # Verificar conflitos de horário usando a função SQL
-        conflict_check = await supabase.select(
-            "appointments",
-            columns="id",
-            filters={
-                "clinic_id": f"eq.{animal['clinic_id']}",
-                "date": f"eq.{request_data.date}",
-                "start_time": f"eq.{request_data.start_time}",
-                "status": "in.(scheduled,confirmed)"
-            }
+        # Verificar conflitos de horário com a agenda da clínica
+        await ensure_no_conflict(
+            animal["clinic_id"],
+            request_data.date,
+            request_data.start_time,
+            request_data.end_time,
+            status_code=409,
+            detail="Já existe um agendamento para este horário",
         )
         
-        if conflict_check:
-            raise HTTPException(
-                status_code=409, 
-                detail="Já existe um agendamento para este horário"
-            )
-        
         # Criar solicitação na tabela appointments
         new_appointment = {
             "clinic_id": animal["clinic_id"],
@@ -104,6 +100,8 @@ async def create_appointment_request(
         if not created_appointment:
             raise HTTPException(status_code=500, detail="Erro ao criar solicitação")
         
+        invalidate_dashboard(animal["clinic_id"], DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
+        
         return AppointmentRequestResponse(
             id=str(created_appointment["id"]),
             animal_id=str(created_appointment["animal_id"]),
@@ -127,65 +125,58 @@ async def create_appointment_request(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao criar solicitação: {str(e)}")
 
+# Ordem da listagem de solicitações do tutor (o id desempata horários iguais)
+REQUESTS_KEYSET = Keyset("date.desc", "start_time.desc", "id.desc")
+
 @router.get("/", response_model=List[AppointmentRequestResponse])
 async def get_client_appointment_requests(
+    http_response: Response,
     current_user: dict = Depends(get_current_user),
     status: Optional[str] = Query(None, description="Filtrar por status"),
     status_solicitacao: Optional[str] = Query(None, description="Filtrar por status da solicitação"),
     animal_id: Optional[UUID4] = Query(None, description="Filtrar por animal"),
-    limit: int = Query(50, description="Limite de resultados")
+    limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
 ):
     """
-    Lista todas as solicitações de agendamento do cliente da tabela appointments
+    Lista as solicitações de agendamento do cliente da tabela appointments, paginadas por
+    cursor. Os animais do tutor são filtrados no próprio embed (uma consulta).
     """
     try:
-        # Primeiro, buscar todos os animais do cliente
-        animals_result = await supabase.select(
-            "animals",
-            columns="id,name,clinic_id",
-            filters={
-                "email": f"eq.{current_user.get('email')}",
-                "client_active": "eq.true"
-            }
-        )
-        
-        if not animals_result:
-            return []
-        
-        # Extrair IDs dos animais
-        animal_ids = [animal["id"] for animal in animals_result]
-        animal_names = {animal["id"]: animal["name"] for animal in animals_result}
-        animal_clinics = {animal["id"]: animal["clinic_id"] for animal in animals_result}
-        
-        # Construir filtros para appointments
-        filters = {
-            "solicitado_por_cliente": "eq.true",
-            "animal_id": f"in.({','.join(animal_ids)})"
-        }
+        filters = [
+            ("solicitado_por_cliente", "eq.true"),
+            ("animals.email", f"eq.{current_user.get('email')}"),
+            ("animals.client_active", "eq.true"),
+        ]
         
         if status:
-            filters["status"] = f"eq.{status}"
+            filters.append(("status", f"eq.{status}"))
             
         if status_solicitacao:
-            filters["status_solicitacao"] = f"eq.{status_solicitacao}"
+            filters.append(("status_solicitacao", f"eq.{status_solicitacao}"))
             
         if animal_id:
-            filters["animal_id"] = f"eq.{animal_id}"
+            filters.append(("animal_id", f"eq.{animal_id}"))
         
-        # Buscar agendamentos/solicitações
-        appointments_result = await supabase.select(
+        page = await fetch_page(
             "appointments",
-            columns="id,animal_id,description,date,start_time,end_time,status,status_solicitacao,observacoes_cliente,created_at,updated_at,clinic_id",
-            filters=filters
+            REQUESTS_KEYSET,
+            filters,
+            select=(
+                "id,animal_id,description,date,start_time,end_time,status,status_solicitacao,"
+                "observacoes_cliente,created_at,updated_at,clinic_id,animals!inner(name)"
+            ),
+            limit=limit,
+            cursor=cursor,
+            include_total=include_total,
         )
-        
-        if not appointments_result:
-            return []
+        page.apply_headers(http_response)
         
         # Construir resposta
         requests = []
-        for apt in appointments_result:
-            animal_name = animal_names.get(apt["animal_id"], "Animal não encontrado")
+        for apt in page.items:
+            animal_name = (apt.get("animals") or {}).get("name") or "Animal não encontrado"
             
             requests.append(AppointmentRequestResponse(
                 id=str(apt["id"]),
@@ -207,9 +198,58 @@ async def get_client_appointment_requests(
         
         return requests
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar solicitações: {str(e)}")
 
+@router.get("/disponibilidade", response_model=AvailabilityResponse)
+async def get_request_availability(
+    animal_id: UUID4 = Query(..., description="Animal para o qual o horário será solicitado"),
+    data_inicio: date = Query(..., description="Primeiro dia da busca"),
+    data_fim: Optional[date] = Query(None, description="Último dia da busca (padrão: data_inicio)"),
+    duracao_minutos: int = Query(60, ge=5, le=480, description="Duração do atendimento"),
+    abertura: time = Query(time(8, 0), description="Início do expediente"),
+    fechamento: time = Query(time(18, 0), description="Fim do expediente"),
+    intervalo_minutos: int = Query(0, ge=0, le=240, description="Folga antes e depois de cada agendamento existente"),
+    dias_semana: Optional[str] = Query(None, description="Dias atendidos, ex.: 1,2,3,4,5 (1 = segunda, 7 = domingo)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Horários livres na clínica do animal, para o tutor escolher antes de enviar a
+    solicitação (os mesmos critérios de conflito usados na criação).
+    """
+    try:
+        animal_result = await supabase.get_by_eq(
+            "animals",
+            "id",
+            str(animal_id),
+            select="id,clinic_id,email"
+        )
+        if not animal_result:
+            raise HTTPException(status_code=404, detail="Animal não encontrado")
+
+        animal = animal_result[0]
+        if animal["email"] != current_user.get("email"):
+            raise HTTPException(status_code=403, detail="Acesso negado a este animal")
+
+        return await find_free_slots(
+            animal["clinic_id"],
+            data_inicio,
+            data_fim or data_inicio,
+            duracao_minutos,
+            abertura,
+            fechamento,
+            intervalo_minutos,
+            None,
+            parse_dias_semana(dias_semana),
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar horários livres: {str(e)}")
+
 @router.get("/{request_id}", response_model=AppointmentRequestResponse)
 async def get_appointment_request_details(
     request_id: UUID4,
@@ -334,6 +374,7 @@ async def cancel_appointment_request(
             {"id": f"eq.{request_id}"}
         )
         
+        invalidate_dashboard(appointment_data.get("clinic_id"), DASHBOARD_STATS, DASHBOARD_APPOINTMENTS_TODAY)
         return {"message": "Solicitação cancelada com sucesso"}
         
     except HTTPException:
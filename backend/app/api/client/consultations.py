@@ -1,12 +1,13 @@
 """
 Rotas de consultas específicas para clientes/tutores
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from typing import List, Optional
 from datetime import date, datetime
 from pydantic import BaseModel
 from ..auth import get_current_user
 from ...db.supabase import supabase_admin as supabase
+from ..pagination import PAGE_SIZE_MAX, Keyset, fetch_page
 import logging
 
 logger = logging.getLogger(__name__)
@@ -73,13 +74,34 @@ class ConsultationSummary(BaseModel):
     animals_with_consultations: int
     last_consultation_date: Optional[str] = None
 
+# Ordem das consultas do tutor (mais recentes primeiro)
+CONSULTATIONS_KEYSET = Keyset("date.desc", "id.desc")
+CONSULTATIONS_SELECT = "id,animal_id,date,description,created_at,updated_at,clinic_id"
+
+
+async def _get_clinic_names(consultations: List[dict]) -> dict:
+    """Nomes das clínicas das consultas da página (uma busca em lote)."""
+    clinic_ids = list(set([c["clinic_id"] for c in consultations if c.get("clinic_id")]))
+    if not clinic_ids:
+        return {}
+    clinics_result = await supabase.select(
+        "clinics",
+        columns="id,name",
+        filters={"id": f"in.({','.join(map(str, clinic_ids))})"}
+    )
+    return {clinic["id"]: clinic["name"] for clinic in clinics_result or []}
+
+
 @router.get("/", response_model=List[ConsultationResponse])
 async def get_client_consultations(
+    http_response: Response,
     current_user: dict = Depends(get_current_user),
     animal_id: Optional[int] = Query(None, description="Filtrar por animal específico"),
     date_from: Optional[date] = Query(None, description="Data inicial"),
     date_to: Optional[date] = Query(None, description="Data final"),
-    limit: int = Query(50, description="Limite de resultados")
+    limit: int = Query(50, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
 ):
     """
     Lista todas as consultas dos animais do cliente/tutor
@@ -108,54 +130,40 @@ async def get_client_consultations(
         animal_ids = [animal["id"] for animal in animals_result]
         
         # Construir filtros para consultas
-        filters = {}
+        filters = []
         
         # Filtrar por animal específico se fornecido
         if animal_id:
             if animal_id not in animal_ids:
                 return []  # Animal não pertence ao tutor
-            filters["animal_id"] = f"eq.{animal_id}"
+            filters.append(("animal_id", f"eq.{animal_id}"))
         else:
             # Filtrar por todos os animais do tutor
             if len(animal_ids) == 1:
-                filters["animal_id"] = f"eq.{animal_ids[0]}"
+                filters.append(("animal_id", f"eq.{animal_ids[0]}"))
             else:
-                filters["animal_id"] = f"in.({','.join(map(str, animal_ids))})"
+                filters.append(("animal_id", f"in.({','.join(map(str, animal_ids))})"))
         
-        # Filtros de data
+        # Filtros de data (pares repetidos combinam com AND)
         if date_from:
-            filters["date"] = f"gte.{date_from.isoformat()}"
+            filters.append(("date", f"gte.{date_from.isoformat()}"))
             
         if date_to:
-            if "date" in filters:
-                # Combinar filtros de data (precisa usar AND)
-                filters["date"] = f"gte.{date_from.isoformat()}"
-                filters["date"] = f"lte.{date_to.isoformat()}"
-            else:
-                filters["date"] = f"lte.{date_to.isoformat()}"
+            filters.append(("date", f"lte.{date_to.isoformat()}"))
         
-        # Buscar consultas com informações da clínica
-        consultations_result = await supabase.select(
-            "consultations",
-            columns="id,animal_id,date,description,created_at,updated_at,clinic_id",
-            filters=filters
+        # Página de consultas
+        page = await fetch_page(
+            "consultations", CONSULTATIONS_KEYSET, filters, select=CONSULTATIONS_SELECT,
+            limit=limit, cursor=cursor, include_total=include_total,
         )
+        page.apply_headers(http_response)
+        consultations_result = page.items
         
         if not consultations_result:
             return []
         
         # Buscar informações das clínicas
-        clinic_ids = list(set([c["clinic_id"] for c in consultations_result if c.get("clinic_id")]))
-        clinics_map = {}
-        
-        if clinic_ids:
-            clinics_result = await supabase.select(
-                "clinics",
-                columns="id,name",
-                filters={"id": f"in.({','.join(clinic_ids)})"}  
-            )
-            if clinics_result:
-                clinics_map = {clinic["id"]: clinic["name"] for clinic in clinics_result}
+        clinics_map = await _get_clinic_names(consultations_result)
         
         # Criar mapa de animais para facilitar o lookup
         animals_map = {animal["id"]: animal["name"] for animal in animals_result}
@@ -179,6 +187,8 @@ async def get_client_consultations(
         
         return consultations
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar consultas: {str(e)}")
 
@@ -249,9 +259,12 @@ async def get_consultation_details(
 
 @router.get("/animal/{animal_id}", response_model=List[ConsultationResponse])
 async def get_animal_consultations(
+    http_response: Response,
     animal_id: str,
     current_user: dict = Depends(get_current_user),
-    limit: int = Query(20, description="Limite de resultados")
+    limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
 ):
     """
     Lista consultas de um animal específico
@@ -273,28 +286,19 @@ async def get_animal_consultations(
         if animal["tutor_user_id"] != current_user["id"]:
             raise HTTPException(status_code=404, detail="Animal não encontrado")
         
-        # Buscar consultas do animal
-        consultations_result = await supabase.select(
-            "consultations",
-            columns="id,animal_id,date,description,created_at,updated_at,clinic_id",
-            filters={"animal_id": f"eq.{animal_id}"}
+        # Página de consultas do animal (mais recentes primeiro)
+        page = await fetch_page(
+            "consultations", CONSULTATIONS_KEYSET, {"animal_id": f"eq.{animal_id}"}, select=CONSULTATIONS_SELECT,
+            limit=limit, cursor=cursor, include_total=include_total,
         )
+        page.apply_headers(http_response)
+        consultations_result = page.items
         
         if not consultations_result:
             return []
         
         # Buscar informações das clínicas
-        clinic_ids = list(set([c["clinic_id"] for c in consultations_result if c.get("clinic_id")]))
-        clinics_map = {}
-        
-        if clinic_ids:
-            clinics_result = await supabase.select(
-                "clinics",
-                columns="id,name",
-                filters={"id": f"in.({','.join(clinic_ids)})"}
-            )
-            if clinics_result:
-                clinics_map = {clinic["id"]: clinic["name"] for clinic in clinics_result}
+        clinics_map = await _get_clinic_names(consultations_result)
         
         # Formatar resposta
         consultations = []
@@ -312,11 +316,7 @@ async def get_animal_consultations(
                 updated_at=consultation["updated_at"]
             ))
         
-        # Ordenar por data (mais recentes primeiro)
-        consultations.sort(key=lambda x: x.date, reverse=True)
-        
-        # Aplicar limite
-        return consultations[:limit]
+        return consultations
         
     except HTTPException:
         raise
@@ -4,7 +4,7 @@ Rotas de dietas para clientes/tutores
 Permite ao tutor listar as dietas do seu animal sem precisar informar o animal_id.
 O animal é resolvido pelo `tutor_user_id` presente no JWT do tutor.
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from datetime import datetime, date
@@ -12,42 +12,24 @@ import logging
 
 from ..auth import get_current_user
 from ...db.supabase import supabase_admin as supabase
+from ...db.alimentos_catalog import get_alimento_nomes
+from ..pagination import PAGE_SIZE_MAX, Keyset, fetch_page
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-# Helper: obter nome do alimento base pelo alimento_id (ou id como fallback)
-async def _get_alimento_nome(alimento_id: Optional[int]) -> Optional[str]:
-    if not alimento_id:
-        return None
-    try:
-        # Tenta por coluna 'alimento_id'
-        resp = await supabase._request(
-            "GET",
-            f"/rest/v1/alimentos_base?alimento_id=eq.{alimento_id}&select=nome"
-        )
-        data = supabase.process_response(resp)
-        if isinstance(data, list) and len(data) > 0:
-            return data[0].get("nome")
-
-        # Fallback: tenta por coluna 'id'
-        resp2 = await supabase._request(
-            "GET",
-            f"/rest/v1/alimentos_base?id=eq.{alimento_id}&select=nome"
-        )
-        data2 = supabase.process_response(resp2)
-        if isinstance(data2, list) and len(data2) > 0:
-            return data2[0].get("nome")
-    except Exception:
-        pass
-    return None
+# Ordem das dietas do tutor (mais recentes primeiro)
+DIETS_KEYSET = Keyset("created_at.desc", "id.desc")
 
 
 @router.get("/diets", response_model=List[Dict[str, Any]])
 async def get_tutor_diets(
+    http_response: Response,
     status: Optional[str] = Query(None, description="Filtrar por status da dieta"),
-    limit: int = Query(20, ge=1, le=100),
+    limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
     current_user: Dict[str, Any] = Depends(get_current_user),
 ) -> List[Dict[str, Any]]:
     """
@@ -55,7 +37,7 @@ async def get_tutor_diets(
 
     - Resolve `animal_id` via `animals.tutor_user_id = current_user['id']`
     - Opcionalmente filtra por `status`
-    - Ordena por `created_at` desc
+    - Ordena por `created_at` desc, paginado por cursor (header X-Next-Cursor)
     """
     try:
         tutor_id = current_user.get("id")
@@ -76,27 +58,25 @@ async def get_tutor_diets(
         if not animal_id:
             return []
 
-        # Construir query de dietas
-        query = f"/rest/v1/dietas?animal_id=eq.{animal_id}"
+        # Página de dietas
+        filters = [("animal_id", f"eq.{animal_id}")]
         if status:
-            query += f"&status=eq.{status}"
-        query += "&order=created_at.desc"
-        query += f"&limit={limit}"
+            filters.append(("status", f"eq.{status}"))
 
-        diets_resp = await supabase._request("GET", query)
-        diets = supabase.process_response(diets_resp) or []
+        page = await fetch_page(
+            "dietas", DIETS_KEYSET, filters,
+            limit=limit, cursor=cursor, include_total=include_total,
+        )
+        page.apply_headers(http_response)
+        diets = page.items
 
-        # Enriquecer cada dieta com o nome do alimento
-        enriched: List[Dict[str, Any]] = []
+        # Enriquecer as dietas com o nome do alimento (uma busca em lote)
+        nomes = await get_alimento_nomes(d.get("alimento_id") for d in diets)
         for d in diets:
-            try:
-                aid = d.get("alimento_id")
-                d["alimento_nome"] = await _get_alimento_nome(aid)
-            except Exception:
-                d["alimento_nome"] = None
-            enriched.append(d)
+            aid = d.get("alimento_id")
+            d["alimento_nome"] = nomes.get(str(aid)) if aid else None
 
-        return enriched
+        return diets
 
     except HTTPException:
         raise
@@ -199,6 +179,143 @@ async def get_today_progress(
         raise HTTPException(status_code=500, detail=f"Erro ao obter progresso: {str(e)}")
 
 
+# Check-in atômico (RPC dieta_registrar_refeicao); desativado se a função não existir no banco
+_checkin_rpc_available = True
+
+
+async def _register_meal_rpc(
+    tutor_id: str,
+    input_data: DietProgressInput,
+    today_str: str,
+    horario: str,
+    pontos: int,
+) -> Optional[Dict[str, Any]]:
+    """
+    Registra a refeição e devolve o resumo do dia em uma única transação no banco
+    (dieta bloqueada + limite de refeicoes_por_dia + inserção).
+    Retorna None quando a RPC não existe no banco; outras falhas da RPC viram HTTP 503,
+    sem recorrer ao caminho não atômico.
+    """
+    global _checkin_rpc_available
+    if not _checkin_rpc_available:
+        return None
+
+    rpc_response = await supabase.rpc("dieta_registrar_refeicao", {
+        "p_tutor_user_id": str(tutor_id),
+        "p_data": today_str,
+        "p_refeicao_completa": bool(input_data.refeicao_completa) if input_data.refeicao_completa is not None else True,
+        "p_horario_realizado": horario,
+        "p_pontos_ganhos": pontos,
+        "p_quantidade_consumida": f"{input_data.quantidade_gramas}g" if input_data.quantidade_gramas is not None else None,
+        "p_observacoes_tutor": input_data.observacoes_tutor,
+    })
+    if "error" in rpc_response:
+        if supabase.is_missing_object(rpc_response):
+            logger.warning(f"RPC dieta_registrar_refeicao não existe, usando consultas separadas: {rpc_response['error']}")
+            _checkin_rpc_available = False
+            return None
+        # A RPC pode ter sido efetivada com a resposta perdida: não repetir a inserção por outro caminho
+        logger.error(f"Falha na RPC dieta_registrar_refeicao: {rpc_response['error']}")
+        raise HTTPException(
+            status_code=503,
+            detail="Falha ao registrar progresso. Confira o progresso de hoje antes de tentar novamente."
+        )
+
+    result = supabase.process_response(rpc_response, single_item=True)
+    if not isinstance(result, dict):
+        logger.error(f"Resposta inesperada da RPC dieta_registrar_refeicao: {rpc_response}")
+        raise HTTPException(status_code=500, detail="Falha ao registrar progresso no Supabase")
+
+    status = result.get("status")
+    if status == "animal_nao_encontrado":
+        raise HTTPException(status_code=404, detail="Nenhum animal vinculado ao tutor")
+    if status == "dieta_nao_encontrada":
+        raise HTTPException(status_code=404, detail="Nenhuma dieta ativa para o animal")
+    if status == "limite_atingido":
+        raise HTTPException(status_code=400, detail="Todas as refeições de hoje já foram registradas")
+    if status != "ok" or not result.get("created"):
+        logger.error(f"Resposta inesperada da RPC dieta_registrar_refeicao: {rpc_response}")
+        raise HTTPException(status_code=500, detail="Falha ao registrar progresso no Supabase")
+
+    refeicoes_por_dia = int(result.get("refeicoes_por_dia") or 0)
+    completed_count = int(result.get("completed_count") or 0)
+    return {
+        "created": result["created"],
+        "summary": {
+            "date": today_str,
+            "animal_id": result.get("animal_id"),
+            "dieta_id": result.get("dieta_id"),
+            "refeicoes_por_dia": refeicoes_por_dia,
+            "completed_count": completed_count,
+            "remaining_count": max(refeicoes_por_dia - completed_count, 0),
+        },
+    }
+
+
+async def _register_meal_non_atomic(
+    current_user: Dict[str, Any],
+    input_data: DietProgressInput,
+    today_str: str,
+    horario: str,
+    pontos: int,
+) -> Dict[str, Any]:
+    """Resolve animal/dieta, verifica o limite e insere em passos separados (sem a RPC de check-in)."""
+    resolved = await _resolve_tutor_animal_and_active_diet(current_user)
+    animal_id = resolved["animal_id"]
+    dieta = resolved["dieta"]
+
+    # Contagem atual de hoje
+    prog_query = (
+        f"/rest/v1/dieta_progresso?animal_id=eq.{animal_id}&dieta_id=eq.{dieta['id']}"
+        f"&data=eq.{today_str}"
+    )
+    prog_resp = await supabase._request("GET", prog_query)
+    today_entries = supabase.process_response(prog_resp) or []
+
+    refeicoes_por_dia = int(dieta.get("refeicoes_por_dia", 0) or 0)
+    completed_count = len(today_entries)
+    if refeicoes_por_dia and completed_count >= refeicoes_por_dia:
+        raise HTTPException(status_code=400, detail="Todas as refeições de hoje já foram registradas")
+
+    next_index = completed_count + 1 if refeicoes_por_dia else None
+
+    # Payload principal (conforme colunas atuais da tabela)
+    payload: Dict[str, Any] = {
+        "animal_id": animal_id,
+        "dieta_id": dieta["id"],
+        "data": today_str,
+        "refeicao_completa": bool(input_data.refeicao_completa) if input_data.refeicao_completa is not None else True,
+        "horario_realizado": horario,
+        "pontos_ganhos": pontos,
+    }
+    if next_index is not None:
+        payload["refeicao_index"] = next_index
+    if input_data.quantidade_gramas is not None:
+        # armazenar como texto amigável na coluna existente
+        payload["quantidade_consumida"] = f"{input_data.quantidade_gramas}g"
+    if input_data.observacoes_tutor is not None:
+        payload["observacoes_tutor"] = input_data.observacoes_tutor
+
+    created_resp = await supabase._request("POST", "/rest/v1/dieta_progresso", json=payload)
+    created_item = supabase.process_response(created_resp, single_item=True)
+    if not created_item:
+        raise HTTPException(status_code=500, detail="Falha ao registrar progresso no Supabase")
+
+    # Resumo a partir da contagem já lida (+ o registro criado)
+    updated_completed = completed_count + 1
+    return {
+        "created": created_item,
+        "summary": {
+            "date": today_str,
+            "animal_id": animal_id,
+            "dieta_id": dieta["id"],
+            "refeicoes_por_dia": refeicoes_por_dia,
+            "completed_count": updated_completed,
+            "remaining_count": max(refeicoes_por_dia - updated_completed, 0),
+        },
+    }
+
+
 @router.post("/diets/progress", response_model=Dict[str, Any])
 async def register_meal_progress(
     input_data: DietProgressInput,
@@ -208,93 +325,22 @@ async def register_meal_progress(
     Registra uma refeição realizada hoje pelo tutor na dieta ativa.
 
     - Incrementa o count diário em `dieta_progresso`
-    - Limita ao máximo `refeicoes_por_dia`
+    - Limita ao máximo `refeicoes_por_dia` (atomicamente via RPC, quando disponível)
     - Retorna o item criado e o resumo atualizado
     """
     try:
-        resolved = await _resolve_tutor_animal_and_active_diet(current_user)
-        animal_id = resolved["animal_id"]
-        dieta = resolved["dieta"]
-        today_str = date.today().isoformat()
-
-        # Contagem atual de hoje
-        prog_query = (
-            f"/rest/v1/dieta_progresso?animal_id=eq.{animal_id}&dieta_id=eq.{dieta['id']}"
-            f"&data=eq.{today_str}"
-        )
-        prog_resp = await supabase._request("GET", prog_query)
-        today_entries = supabase.process_response(prog_resp) or []
-
-        refeicoes_por_dia = int(dieta.get("refeicoes_por_dia", 0) or 0)
-        completed_count = len(today_entries)
-        if refeicoes_por_dia and completed_count >= refeicoes_por_dia:
-            raise HTTPException(status_code=400, detail="Todas as refeições de hoje já foram registradas")
+        tutor_id = current_user.get("id")
+        if not tutor_id:
+            raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
-        # Montar payload
+        today_str = date.today().isoformat()
         horario = input_data.horario_realizado or datetime.now().strftime("%H:%M:%S")
         pontos = 10 if (input_data.refeicao_completa is None or input_data.refeicao_completa) else 0
-        next_index = completed_count + 1 if refeicoes_por_dia else None
 
-        # Payload principal (conforme colunas atuais da tabela)
-        extended_payload: Dict[str, Any] = {
-            "animal_id": animal_id,
-            "dieta_id": dieta["id"],
-            "data": today_str,
-            "refeicao_completa": bool(input_data.refeicao_completa) if input_data.refeicao_completa is not None else True,
-            "horario_realizado": horario,
-            "pontos_ganhos": pontos,
-        }
-        # Campos extras caso existam na tabela
-        if next_index is not None:
-            extended_payload["refeicao_index"] = next_index
-        if input_data.quantidade_gramas is not None:
-            # armazenar como texto amigável na coluna existente
-            extended_payload["quantidade_consumida"] = f"{input_data.quantidade_gramas}g"
-        if input_data.observacoes_tutor is not None:
-            extended_payload["observacoes_tutor"] = input_data.observacoes_tutor
-
-        # Tentar inserir com payload estendido; se falhar, fazer fallback para payload básico
-        created_resp = await supabase._request("POST", "/rest/v1/dieta_progresso", json=extended_payload)
-        created_item = supabase.process_response(created_resp, single_item=True)
-        if not created_item:
-            # Fallback básico
-            basic_payload = {
-                "animal_id": animal_id,
-                "dieta_id": dieta["id"],
-                "data": today_str,
-                "refeicao_completa": bool(input_data.refeicao_completa) if input_data.refeicao_completa is not None else True,
-                "horario_realizado": horario,
-                "pontos_ganhos": pontos,
-            }
-            if next_index is not None:
-                basic_payload["refeicao_index"] = next_index
-            if input_data.quantidade_gramas is not None:
-                basic_payload["quantidade_consumida"] = f"{input_data.quantidade_gramas}g"
-            if input_data.observacoes_tutor is not None:
-                basic_payload["observacoes_tutor"] = input_data.observacoes_tutor
-
-            created_resp = await supabase._request("POST", "/rest/v1/dieta_progresso", json=basic_payload)
-            created_item = supabase.process_response(created_resp, single_item=True)
-            if not created_item:
-                raise HTTPException(status_code=500, detail="Falha ao registrar progresso no Supabase")
-
-        # Resumo atualizado
-        updated_resp = await supabase._request("GET", prog_query)
-        updated_entries = supabase.process_response(updated_resp) or []
-        updated_completed = len(updated_entries)
-        remaining_count = max(refeicoes_por_dia - updated_completed, 0)
-
-        return {
-            "created": created_item,
-            "summary": {
-                "date": today_str,
-                "animal_id": animal_id,
-                "dieta_id": dieta["id"],
-                "refeicoes_por_dia": refeicoes_por_dia,
-                "completed_count": updated_completed,
-                "remaining_count": remaining_count,
-            },
-        }
+        result = await _register_meal_rpc(tutor_id, input_data, today_str, horario, pontos)
+        if result is None:
+            result = await _register_meal_non_atomic(current_user, input_data, today_str, horario, pontos)
+        return result
     except HTTPException:
         raise
     except Exception as e:
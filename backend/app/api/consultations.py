@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, Body, Path
+from fastapi import APIRouter, HTTPException, Depends, Query, Body, Path, Response
 from typing import Dict, Any, List, Optional
 from ..models.consultation import ConsultationCreate, ConsultationResponse, ConsultationUpdate
 from ..db.supabase import supabase_admin
@@ -6,6 +6,7 @@ from uuid import UUID
 from datetime import datetime
 import logging
 from ..api.auth import get_current_user
+from ..api.pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, Keyset, fetch_page
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO)
@@ -67,9 +68,16 @@ async def create_consultation(
         logger.error(f"Erro ao criar consulta: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+# Ordem da listagem de consultas (mais recentes primeiro)
+CONSULTATIONS_KEYSET = Keyset("date.desc", "id.desc")
+
 @router.get("", response_model=List[ConsultationResponse])
 async def get_consultations(
+    http_response: Response,
     animal_id: Optional[UUID] = Query(None, description="Filtrar consultas por ID do animal"),
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ) -> List[Dict[str, Any]]:
     clinic_id = current_user.get("id")
@@ -78,16 +86,20 @@ async def get_consultations(
 
     logger.info(f"Requisição para listar consultas da clinic_id: {clinic_id}, animal_id: {animal_id}")
     try:
-        query = f"/rest/v1/consultations?clinic_id=eq.{clinic_id}&select=*"
+        filters = [("clinic_id", f"eq.{clinic_id}")]
         if animal_id:
-            query += f"&animal_id=eq.{animal_id}"
-        query += "&order=date.desc"
+            filters.append(("animal_id", f"eq.{animal_id}"))
 
-        response = await supabase_admin._request("GET", query)
-        consultations = supabase_admin.process_response(response)
+        page = await fetch_page(
+            "consultations", CONSULTATIONS_KEYSET, filters,
+            limit=limit, cursor=cursor, include_total=include_total,
+        )
+        page.apply_headers(http_response)
 
-        logger.info(f"Consultas encontradas: {len(consultations)}")
-        return consultations
+        logger.info(f"Consultas encontradas: {len(page.items)}")
+        return page.items
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar consultas: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, Any, List
-from datetime import datetime, date
+from typing import Dict, Any, List, Awaitable, Callable, Optional
+from datetime import datetime, date, timedelta
+import asyncio
 import logging
 
 from ..db.supabase import supabase_admin
 from ..api.auth import get_current_user
+from ..core.cache import TTLCache
+from ..core.config import DASHBOARD_SNAPSHOT_TTL, DASHBOARD_SNAPSHOT_MAXSIZE
 
 # Configuração básica de logging para este módulo
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +15,113 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# --- Snapshot do dashboard por clínica ---
+# Cada seção (stats, appointments_today, alerts) é guardada por (clinic_id, seção, dia)
+# e servida enquanto estiver dentro de DASHBOARD_SNAPSHOT_TTL ou até ser invalidada
+# pelas rotas de escrita (animais, agendamentos, dietas, atividades).
+
+DASHBOARD_STATS = "stats"
+DASHBOARD_APPOINTMENTS_TODAY = "appointments_today"
+DASHBOARD_ALERTS = "alerts"
+
+dashboard_snapshots = TTLCache(maxsize=DASHBOARD_SNAPSHOT_MAXSIZE, ttl=DASHBOARD_SNAPSHOT_TTL, name="dashboard")
+# Geração por clínica: evita gravar no cache um valor calculado antes de uma invalidação
+_snapshot_generation: Dict[str, int] = {}
+_inflight: Dict[tuple, "asyncio.Future"] = {}
+
+
+def invalidate_dashboard(clinic_id: Optional[Any], *sections: str) -> None:
+    """
+    Invalida o snapshot do dashboard de uma clínica.
+    Sem `sections`, invalida tudo; invalidar `stats` invalida também `alerts`.
+    """
+    if not clinic_id:
+        return
+    clinic_id = str(clinic_id)
+    targets = set(sections)
+    if DASHBOARD_STATS in targets:
+        targets.add(DASHBOARD_ALERTS)
+    _snapshot_generation[clinic_id] = _snapshot_generation.get(clinic_id, 0) + 1
+    dashboard_snapshots.invalidate_where(
+        lambda key, _v: key[0] == clinic_id and (not targets or key[1] in targets)
+    )
+
+
+async def _get_snapshot_section(clinic_id: Any, section: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Lê uma seção do snapshot; em caso de falta, calcula uma única vez (requisições concorrentes aguardam)."""
+    clinic_id = str(clinic_id)
+    key = (clinic_id, section, date.today().isoformat())
+    cached = dashboard_snapshots.get(key)
+    if cached is not None:
+        return cached
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    generation = _snapshot_generation.get(clinic_id, 0)
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await compute()
+        if _snapshot_generation.get(clinic_id, 0) == generation:
+            dashboard_snapshots.set(key, value)
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        # Evita aviso de exceção não recuperada quando não há outros aguardando
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+# Indica se a função dashboard_stats (migrations/add_dashboard_stats_function.sql) existe no banco;
+# após a primeira falha, usa diretamente as contagens via PostgREST.
+_stats_rpc_available = True
+
+
+async def _compute_dashboard_stats(clinic_id: str) -> Dict[str, int]:
+    """
+    Calcula as estatísticas do dashboard no banco, sem trazer linhas para a API.
+    Usa a RPC `dashboard_stats`; se indisponível, faz contagens `count=exact` em paralelo.
+    """
+    global _stats_rpc_available
+    today = date.today().isoformat()
+
+    if _stats_rpc_available:
+        rpc_response = await supabase_admin.rpc(
+            "dashboard_stats", {"p_clinic_id": str(clinic_id), "p_date": today}
+        )
+        rpc_data = supabase_admin.process_response(rpc_response, single_item=True)
+        if isinstance(rpc_data, dict):
+            return {key: int(rpc_data.get(key) or 0) for key in (
+                "animais_ativos", "consultas_hoje", "animais_sem_dietas", "animais_sem_atividades"
+            )}
+        if supabase_admin.is_missing_object(rpc_response):
+            logger.warning(f"RPC dashboard_stats não existe, usando contagens: {rpc_response.get('error')}")
+            _stats_rpc_available = False
+        else:
+            # Falha transitória: contagens nesta chamada, RPC de novo na próxima
+            logger.warning(f"Falha na RPC dashboard_stats, usando contagens: {rpc_response.get('error')}")
+
+    clinic_filter = {"clinic_id": f"eq.{clinic_id}"}
+    animais, consultas, sem_dietas, sem_atividades = await asyncio.gather(
+        supabase_admin.count("animals", clinic_filter),
+        supabase_admin.count("appointments", {**clinic_filter, "date": f"eq.{today}"}),
+        # Anti-join: animais da clínica sem nenhuma dieta / plano de atividade
+        supabase_admin.count("animals", {**clinic_filter, "dietas": "is.null"}, select="id,dietas!left(id)"),
+        supabase_admin.count("animals", {**clinic_filter, "planos_atividade": "is.null"}, select="id,planos_atividade!left(id)"),
+    )
+    return {
+        "animais_ativos": animais or 0,
+        "consultas_hoje": consultas or 0,
+        "animais_sem_dietas": sem_dietas or 0,
+        "animais_sem_atividades": sem_atividades or 0,
+    }
+
+
 @router.get("/dashboard/stats")
 async def get_dashboard_stats(
     current_user: Dict[str, Any] = Depends(get_current_user)
@@ -25,78 +135,45 @@ async def get_dashboard_stats(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
-        stats = {}
-
-        # 1. Total de animais ativos
-        animals_response = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/animals?clinic_id=eq.{clinic_id}&select=id"
+        return await _get_snapshot_section(
+            clinic_id, DASHBOARD_STATS, lambda: _compute_dashboard_stats(clinic_id)
         )
-        animals_data = supabase_admin.process_response(animals_response)
-        stats["animais_ativos"] = len(animals_data) if animals_data else 0
-
-        # 2. Agendamentos de hoje (buscar todos e filtrar por data)
-        appointments_today_response = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/appointments?clinic_id=eq.{clinic_id}&select=id,date"
-        )
-        appointments_all = supabase_admin.process_response(appointments_today_response)
-        
-        # Filtrar por data de hoje no Python
-        today = date.today()
-        appointments_today_data = []
-        if appointments_all:
-            for apt in appointments_all:
-                apt_date = apt.get('date', '')
-                if apt_date.startswith(today.isoformat()):
-                    appointments_today_data.append(apt)
-        
-        stats["consultas_hoje"] = len(appointments_today_data) if appointments_today_data else 0
-
-        # 3. Animais sem dietas
-        if animals_data:
-            animal_ids = [animal['id'] for animal in animals_data]
-            
-            # Buscar dietas existentes para esses animais
-            diets_response = await supabase_admin._request(
-                "GET",
-                f"/rest/v1/dietas?animal_id=in.({','.join(animal_ids)})&select=animal_id"
-            )
-            diets_data = supabase_admin.process_response(diets_response)
-            
-            animals_with_diets = set()
-            if diets_data:
-                animals_with_diets = {diet['animal_id'] for diet in diets_data}
-            
-            animals_without_diets = len(animal_ids) - len(animals_with_diets)
-            stats["animais_sem_dietas"] = animals_without_diets
-        else:
-            stats["animais_sem_dietas"] = 0
-
-        # 4. Animais sem planos de atividade
-        if animals_data:
-            # Buscar planos de atividade existentes
-            activity_plans_response = await supabase_admin._request(
-                "GET",
-                f"/rest/v1/planos_atividade?animal_id=in.({','.join(animal_ids)})&select=animal_id"
-            )
-            activity_plans_data = supabase_admin.process_response(activity_plans_response)
-            
-            animals_with_activities = set()
-            if activity_plans_data:
-                animals_with_activities = {plan['animal_id'] for plan in activity_plans_data}
-            
-            animals_without_activities = len(animal_ids) - len(animals_with_activities)
-            stats["animais_sem_atividades"] = animals_without_activities
-        else:
-            stats["animais_sem_atividades"] = 0
-
-        return stats
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar estatísticas do dashboard: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar estatísticas: {str(e)}")
 
+async def _compute_appointments_today(clinic_id: str) -> List[Dict[str, Any]]:
+    """Agendamentos de hoje da clínica com nome do animal e do tutor."""
+    # Uma única consulta: filtro de data no banco e dados do animal embutidos
+    today = date.today().isoformat()
+    appointments_response = await supabase_admin._request(
+        "GET",
+        f"/rest/v1/appointments?clinic_id=eq.{clinic_id}&date=eq.{today}&animal_id=not.is.null"
+        "&order=start_time.asc&select=id,start_time,status,description,animals(name,tutor_name)"
+    )
+    appointments_today_data = supabase_admin.process_response(appointments_response)
+    if not appointments_today_data:
+        return []
+
+    enriched_appointments = []
+    for appointment in appointments_today_data:
+        animal_data = appointment.get('animals') or {}
+        enriched_appointment = {
+            "id": appointment.get('id'),
+            "animal_name": animal_data.get('name') or 'N/A',
+            "owner_name": animal_data.get('tutor_name') or 'Tutor não informado',
+            "time_scheduled": appointment.get('start_time'),  # Manter esse nome para compatibilidade com frontend
+            "status": appointment.get('status', 'agendado'),
+            "description": appointment.get('description', 'Consulta'),
+            "notes": appointment.get('description', '')
+        }
+        enriched_appointments.append(enriched_appointment)
+
+    return enriched_appointments
+
 @router.get("/dashboard/appointments-today")
 async def get_appointments_today(
     current_user: Dict[str, Any] = Depends(get_current_user)
@@ -110,57 +187,60 @@ async def get_appointments_today(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
-        # Buscar todos os agendamentos e filtrar por data de hoje
-        appointments_response = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/appointments?clinic_id=eq.{clinic_id}&order=start_time.asc&select=*"
+        return await _get_snapshot_section(
+            clinic_id, DASHBOARD_APPOINTMENTS_TODAY, lambda: _compute_appointments_today(clinic_id)
         )
-        
-        appointments_all = supabase_admin.process_response(appointments_response)
-        if not appointments_all:
-            return []
-
-        # Filtrar por data de hoje no Python
-        today = date.today()
-        appointments_today_data = []
-        if appointments_all:
-            for apt in appointments_all:
-                apt_date = apt.get('date', '')
-                if apt_date.startswith(today.isoformat()):
-                    appointments_today_data.append(apt)
-
-        if not appointments_today_data:
-            return []
-
-        # Para cada agendamento, buscar dados do animal
-        enriched_appointments = []
-        for appointment in appointments_today_data:
-            animal_id = appointment.get('animal_id')
-            if animal_id:
-                # Buscar dados do animal (corrigir campo tutor_name)
-                animal_response = await supabase_admin._request(
-                    "GET",
-                    f"/rest/v1/animals?id=eq.{animal_id}&select=name,tutor_name"
-                )
-                animal_data = supabase_admin.process_response(animal_response, single_item=True)
-                
-                enriched_appointment = {
-                    "id": appointment.get('id'),
-                    "animal_name": animal_data.get('name', 'N/A') if animal_data else 'N/A',
-                    "owner_name": animal_data.get('tutor_name') if animal_data and animal_data.get('tutor_name') else 'Tutor não informado',
-                    "time_scheduled": appointment.get('start_time'),  # Manter esse nome para compatibilidade com frontend
-                    "status": appointment.get('status', 'agendado'),
-                    "description": appointment.get('description', 'Consulta'),
-                    "notes": appointment.get('description', '')
-                }
-                enriched_appointments.append(enriched_appointment)
-
-        return enriched_appointments
 
     except Exception as e:
         logger.error(f"Erro ao buscar agendamentos de hoje: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar agendamentos: {str(e)}")
 
+async def _compute_dashboard_alerts(clinic_id: str) -> List[Dict[str, Any]]:
+    """Alertas do dashboard: dietas expirando e animais sem dieta/atividades."""
+    alerts = []
+
+    # 1. Verificar dietas prestes a expirar (próximos 7 dias)
+    next_week = (date.today() + timedelta(days=7)).isoformat()
+    
+    expiring_diets_response = await supabase_admin._request(
+        "GET",
+        f"/rest/v1/dietas?clinic_id=eq.{clinic_id}&data_fim=lte.{next_week}&data_fim=gte.{date.today().isoformat()}&select=id,data_fim"
+    )
+    expiring_diets_data = supabase_admin.process_response(expiring_diets_response)
+    
+    if expiring_diets_data:
+        alerts.append({
+            "type": "warning",
+            "icon": "🔁",
+            "message": f"{len(expiring_diets_data)} dieta(s) personalizada(s) expira(m) nos próximos 7 dias."
+        })
+
+    # 2. Verificar animais sem dietas
+    # Reaproveita a seção de estatísticas do snapshot
+    stats_response = await _get_snapshot_section(
+        clinic_id, DASHBOARD_STATS, lambda: _compute_dashboard_stats(clinic_id)
+    )
+    animals_without_diets = stats_response.get("animais_sem_dietas", 0)
+    
+    if animals_without_diets > 0:
+        alerts.append({
+            "type": "info",
+            "icon": "🍽️",
+            "message": f"{animals_without_diets} animal(is) ainda não possui(em) plano de dieta."
+        })
+
+    # 3. Verificar animais sem atividades
+    animals_without_activities = stats_response.get("animais_sem_atividades", 0)
+    
+    if animals_without_activities > 0:
+        alerts.append({
+            "type": "info",
+            "icon": "🏃‍♂️",
+            "message": f"{animals_without_activities} animal(is) ainda não possui(em) plano de atividades."
+        })
+
+    return alerts
+
 @router.get("/dashboard/alerts")
 async def get_dashboard_alerts(
     current_user: Dict[str, Any] = Depends(get_current_user)
@@ -174,47 +254,9 @@ async def get_dashboard_alerts(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
-        alerts = []
-
-        # 1. Verificar dietas prestes a expirar (próximos 7 dias)
-        from datetime import timedelta
-        next_week = (date.today() + timedelta(days=7)).isoformat()
-        
-        expiring_diets_response = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/dietas?clinic_id=eq.{clinic_id}&data_fim=lte.{next_week}&data_fim=gte.{date.today().isoformat()}&select=id,data_fim"
+        return await _get_snapshot_section(
+            clinic_id, DASHBOARD_ALERTS, lambda: _compute_dashboard_alerts(clinic_id)
         )
-        expiring_diets_data = supabase_admin.process_response(expiring_diets_response)
-        
-        if expiring_diets_data:
-            alerts.append({
-                "type": "warning",
-                "icon": "🔁",
-                "message": f"{len(expiring_diets_data)} dieta(s) personalizada(s) expira(m) nos próximos 7 dias."
-            })
-
-        # 2. Verificar animais sem dietas
-        stats_response = await get_dashboard_stats(current_user)
-        animals_without_diets = stats_response.get("animais_sem_dietas", 0)
-        
-        if animals_without_diets > 0:
-            alerts.append({
-                "type": "info",
-                "icon": "🍽️",
-                "message": f"{animals_without_diets} animal(is) ainda não possui(em) plano de dieta."
-            })
-
-        # 3. Verificar animais sem atividades
-        animals_without_activities = stats_response.get("animais_sem_atividades", 0)
-        
-        if animals_without_activities > 0:
-            alerts.append({
-                "type": "info",
-                "icon": "🏃‍♂️",
-                "message": f"{animals_without_activities} animal(is) ainda não possui(em) plano de atividades."
-            })
-
-        return alerts
 
     except Exception as e:
         logger.error(f"Erro ao buscar alertas do dashboard: {str(e)}")
@@ -1,16 +1,30 @@
-from fastapi import APIRouter, HTTPException, Depends, Path
-from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Path, Query, Response
+from typing import Dict, Any, List, Optional, Tuple
 from uuid import UUID
 import logging
 
+import numpy as np
+
 from ..models.diet import (
     DietCreate, DietUpdate, DietResponse,
     RestrictedFoodCreate, RestrictedFoodUpdate, RestrictedFoodResponse,
     DietProgressCreate, DietProgressUpdate, DietProgressResponse,
-    AlimentoBaseCreate, AlimentoBaseUpdate, AlimentoBaseResponse
+    AlimentoBaseCreate, AlimentoBaseUpdate, AlimentoBaseResponse,
+    AlimentoBaseSearchResponse, NutritionAuditResponse
 )
+from ..models.raca import RacaSugestao
 from ..db.supabase import supabase_admin
 from ..api.auth import get_current_user
+from ..api.dashboard import invalidate_dashboard, DASHBOARD_STATS, DASHBOARD_ALERTS
+from ..api.pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, Keyset, Page, fetch_page
+from ..db.alimentos_catalog import alimentos_catalog, get_alimento_nomes
+from ..db.racas_index import racas_index
+from ..core.config import NUTRITION_MATRIX_MAX_CELLS
+from ..core.nutrition import (
+    CONDICOES, calorias_diarias, classificar_condicoes, compatibilidade, direcao_objetivo,
+    densidade_kcal_100g, melhor_alimento, multiplicador_especie, porcoes_gramas, to_float_array,
+)
+from ..core.text_search import normalize_text
 
 # Configuração básica de logging para este módulo
 logging.basicConfig(level=logging.INFO)
@@ -22,27 +36,8 @@ router = APIRouter()
 async def _get_alimento_nome(alimento_id: Optional[int]) -> Optional[str]:
     if not alimento_id:
         return None
-    try:
-        # Primeiro tenta por coluna 'alimento_id'
-        resp = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/alimentos_base?alimento_id=eq.{alimento_id}&select=nome"
-        )
-        data = supabase_admin.process_response(resp)
-        if isinstance(data, list) and len(data) > 0:
-            return data[0].get("nome")
-
-        # Fallback: tenta por coluna 'id'
-        resp2 = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/alimentos_base?id=eq.{alimento_id}&select=nome"
-        )
-        data2 = supabase_admin.process_response(resp2)
-        if isinstance(data2, list) and len(data2) > 0:
-            return data2[0].get("nome")
-    except Exception:
-        pass
-    return None
+    nomes = await get_alimento_nomes([alimento_id])
+    return nomes.get(str(alimento_id))
 
 # Rotas para Dietas
 @router.post("/animals/{animal_id}/diets", response_model=DietResponse)
@@ -103,6 +98,7 @@ async def create_diet(
         if not created_diet:
             raise HTTPException(status_code=500, detail="Erro ao criar dieta: dados não retornados")
         
+        invalidate_dashboard(clinic_id, DASHBOARD_STATS)
         return created_diet
         
     except Exception as e:
@@ -144,17 +140,13 @@ async def list_diets(
             # Se não houver dietas, retornar uma lista vazia
             return []
 
-        # Enriquecer cada dieta com o nome do alimento (quando houver alimento_id)
-        enriched = []
+        # Enriquecer as dietas com o nome do alimento (uma busca em lote)
+        nomes = await get_alimento_nomes(d.get("alimento_id") for d in diets)
         for d in diets:
-            try:
-                aid = d.get("alimento_id")
-                d["alimento_nome"] = await _get_alimento_nome(aid)
-            except Exception:
-                d["alimento_nome"] = None
-            enriched.append(d)
+            aid = d.get("alimento_id")
+            d["alimento_nome"] = nomes.get(str(aid)) if aid else None
 
-        return enriched
+        return diets
         
     except Exception as e:
         print(f"Erro ao listar dietas: {str(e)}")
@@ -261,6 +253,8 @@ async def update_diet(
             if not updated_diet:
                 raise HTTPException(status_code=404, detail="Dieta não encontrada após atualização")
         
+        # data_fim alimenta o alerta de dietas expirando
+        invalidate_dashboard(clinic_id, DASHBOARD_ALERTS)
         return updated_diet
         
     except Exception as e:
@@ -297,6 +291,7 @@ async def delete_diet(
             f"/rest/v1/dietas?id=eq.{diet_id}"
         )
         
+        invalidate_dashboard(clinic_id, DASHBOARD_STATS)
         return {"message": "Dieta removida com sucesso"}
         
     except Exception as e:
@@ -613,17 +608,65 @@ async def create_alimento_base(
         if not created_alimento:
             raise HTTPException(status_code=500, detail="Erro ao criar alimento base: dados não retornados")
         
+        alimentos_catalog.upsert(created_alimento)
         return created_alimento
         
     except Exception as e:
         print(f"Erro ao criar alimento base: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao criar alimento base: {str(e)}")
 
+# Ordem da listagem de alimentos base (alimento_id desempata nomes repetidos)
+ALIMENTOS_KEYSET = Keyset("nome.asc", "alimento_id.asc")
+
+async def buscar_alimentos_base(
+    nome: Optional[str] = None,
+    tipo: Optional[str] = None,
+    especie_destino: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+) -> Page:
+    """
+    Alimentos base filtrados por nome, tipo e espécie destino, do catálogo em memória ou,
+    sem ele, do PostgREST. Sem `limit`, devolve todos os resultados em uma única página.
+    """
+    if await alimentos_catalog.ensure_loaded():
+        rows = alimentos_catalog.filter(nome=nome, tipo=tipo, especie_destino=especie_destino)
+        if limit is None:
+            return Page(rows)
+        return ALIMENTOS_KEYSET.paginate(rows, limit, cursor, include_total)
+
+    # Construir os filtros
+    filters = []
+    if nome:
+        filters.append(("nome", f"ilike.%{nome}%"))
+    if tipo:
+        filters.append(("tipo", f"eq.{tipo}"))
+    if especie_destino:
+        filters.append(("especie_destino", f"eq.{especie_destino}"))
+
+    if limit is None:
+        response = await supabase_admin._request(
+            "GET", "/rest/v1/alimentos_base",
+            params=[("select", "*"), *filters, ("order", ALIMENTOS_KEYSET.order)],
+        )
+        if "error" in response:
+            raise HTTPException(status_code=500, detail=f"Erro ao listar alimentos base: {response['error']}")
+        return Page(supabase_admin.process_response(response) or [])
+    return await fetch_page(
+        "alimentos_base", ALIMENTOS_KEYSET, filters,
+        limit=limit, cursor=cursor, include_total=include_total,
+    )
+
 @router.get("/alimentos-base", response_model=List[AlimentoBaseResponse])
 async def get_alimentos_base(
+    http_response: Response,
     nome: Optional[str] = None,
     tipo: Optional[str] = None,
     especie_destino: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ) -> List[Dict[str, Any]]:
     """
@@ -639,35 +682,12 @@ async def get_alimentos_base(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
             
-        # Construir a query com os filtros
-        query = "/rest/v1/alimentos_base?"
-        filters = []
-        
-        if nome:
-            filters.append(f"nome=ilike.%{nome}%")
-        if tipo:
-            filters.append(f"tipo=eq.{tipo}")
-        if especie_destino:
-            filters.append(f"especie_destino=eq.{especie_destino}")
-            
-        if filters:
-            query += "&".join(filters)
-            
-        # Adicionar ordenação
-        if query.endswith("?"):
-            query += "order=nome.asc"
-        else:
-            query += "&order=nome.asc"
-        
-        # Buscar os alimentos base
-        alimentos_response = await supabase_admin._request(
-            "GET",
-            query
-        )
-        
-        alimentos_data = supabase_admin.process_response(alimentos_response)
-        return alimentos_data or []
+        page = await buscar_alimentos_base(nome, tipo, especie_destino, limit, cursor, include_total)
+        page.apply_headers(http_response)
+        return page.items
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro ao listar alimentos base: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao listar alimentos base: {str(e)}")
@@ -687,6 +707,9 @@ async def get_alimentos_tipos(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
             
+        if await alimentos_catalog.ensure_loaded():
+            return alimentos_catalog.tipos()
+            
         # Buscar tipos distintos
         tipos_response = await supabase_admin._request(
             "GET",
@@ -720,6 +743,9 @@ async def get_alimentos_especies(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
             
+        if await alimentos_catalog.ensure_loaded():
+            return alimentos_catalog.especies()
+            
         # Buscar espécies distintas
         especies_response = await supabase_admin._request(
             "GET",
@@ -738,6 +764,55 @@ async def get_alimentos_especies(
         print(f"Erro ao obter espécies de alimentos: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao obter espécies de alimentos: {str(e)}")
 
+@router.get("/alimentos-base/busca", response_model=AlimentoBaseSearchResponse)
+async def search_alimentos_base(
+    q: str = Query(..., min_length=1, description="Termo buscado em nome, marca e linha (sem acentos, aceita prefixos e erros de digitação)"),
+    tipo: Optional[str] = None,
+    especie_destino: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Busca aproximada de alimentos base, ordenada por relevância e paginada.
+    Servida pelo índice em memória do catálogo; sem ele, usa ilike no PostgREST.
+    """
+    try:
+        if not isinstance(current_user, dict):
+            raise HTTPException(status_code=401, detail="Usuário não autenticado")
+        clinic_id = current_user.get("id")
+        if not clinic_id:
+            raise HTTPException(status_code=401, detail="Usuário não autenticado")
+
+        if await alimentos_catalog.ensure_loaded():
+            results = alimentos_catalog.search(q, tipo=tipo, especie_destino=especie_destino)
+            items = [{**row, "score": score} for row, score in results[offset:offset + limit]]
+            return {"total": len(results), "limit": limit, "offset": offset, "items": items}
+
+        # Fallback sem catálogo: substring (sensível a acentos) em nome, marca e linha
+        term = q.replace(",", " ").replace("(", " ").replace(")", " ").strip()
+        query = f"/rest/v1/alimentos_base?or=(nome.ilike.*{term}*,marca.ilike.*{term}*,linha.ilike.*{term}*)"
+        if tipo:
+            query += f"&tipo=eq.{tipo}"
+        if especie_destino:
+            query += f"&especie_destino=eq.{especie_destino}"
+        query += "&order=nome.asc"
+
+        alimentos_response = await supabase_admin._request("GET", query)
+        alimentos_data = supabase_admin.process_response(alimentos_response) or []
+        return {
+            "total": len(alimentos_data),
+            "limit": limit,
+            "offset": offset,
+            "items": alimentos_data[offset:offset + limit],
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao buscar alimentos base: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar alimentos base: {str(e)}")
+
 @router.get("/alimentos-base/{alimento_id}", response_model=AlimentoBaseResponse)
 async def get_alimento_base(
     alimento_id: int,
@@ -752,6 +827,12 @@ async def get_alimento_base(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
             
+        if await alimentos_catalog.ensure_loaded():
+            alimento = alimentos_catalog.get(alimento_id)
+            if not alimento:
+                raise HTTPException(status_code=404, detail="Alimento base não encontrado")
+            return alimento
+            
         # Buscar o alimento base
         alimento_response = await supabase_admin._request(
             "GET",
@@ -825,6 +906,7 @@ async def update_alimento_base(
             if not updated_alimento:
                 raise HTTPException(status_code=500, detail="Erro ao atualizar alimento base")
                 
+        alimentos_catalog.upsert(updated_alimento)
         return updated_alimento
         
     except Exception as e:
@@ -879,6 +961,8 @@ async def delete_alimento_base(
             if supabase_admin.process_response(check_response):
                 raise HTTPException(status_code=500, detail="Falha ao excluir o alimento base")
         
+        alimentos_catalog.remove(alimento_id)
+        
         # Retornar os dados do alimento que foi excluído
         return existing_alimento[0]
         
@@ -887,6 +971,177 @@ async def delete_alimento_base(
         raise HTTPException(status_code=500, detail=f"Erro ao excluir alimento base: {str(e)}")
 
 
+# Cálculo nutricional vetorizado da clínica
+async def _get_clinic_animals_for_nutrition(clinic_id: str) -> List[Dict[str, Any]]:
+    base = f"/rest/v1/animals?clinic_id=eq.{clinic_id}&order=name.asc&select=id,name,species,breed,weight"
+    response = await supabase_admin._request("GET", base + ",preferencias_pet(objetivo)")
+    if "error" in response:
+        # Sem relacionamento embutível: seguir sem o objetivo das preferências
+        logger.warning(f"Preferências não embutidas no cálculo nutricional: {response['error']}")
+        response = await supabase_admin._request("GET", base)
+    return supabase_admin.process_response(response) or []
+
+
+async def _get_breed_ranges(animals: List[Dict[str, Any]]) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """Faixas de peso (min, max) por (raça, espécie): índice de raças em memória ou uma única consulta a 'racas'."""
+    wanted = {(a.get("breed"), a.get("species") or "") for a in animals if a.get("breed")}
+    if not wanted:
+        return {}
+    ranges: Dict[Tuple[str, str], Tuple[float, float]] = {}
+    if await racas_index.ensure_loaded():
+        for breed, species in wanted:
+            faixa = racas_index.weight_range(breed, species)
+            if faixa:
+                ranges[(breed, species)] = (faixa["peso_min_kg"], faixa["peso_max_kg"])
+        return ranges
+
+    response = await supabase_admin._request(
+        "GET",
+        "/rest/v1/racas?select=nome,nome_popular,nome_oficial,peso_min_kg,peso_max_kg"
+        "&peso_min_kg=not.is.null&peso_max_kg=not.is.null"
+    )
+    racas = supabase_admin.process_response(response) or []
+    nomes_racas = [
+        [normalize_text(r.get(col)) for col in ("nome", "nome_popular", "nome_oficial") if r.get(col)]
+        for r in racas
+    ]
+    for breed, species in wanted:
+        needle = normalize_text(breed)
+        for raca, nomes in zip(racas, nomes_racas):
+            if any(needle in nome for nome in nomes):
+                ranges[(breed, species)] = (float(raca["peso_min_kg"]), float(raca["peso_max_kg"]))
+                break
+    return ranges
+
+
+def _objetivo_preferencias(animal: Dict[str, Any]) -> Optional[str]:
+    prefs = animal.get("preferencias_pet")
+    if isinstance(prefs, list):
+        prefs = prefs[0] if prefs else None
+    return prefs.get("objetivo") if isinstance(prefs, dict) else None
+
+
+@router.get("/diets/nutricao/clinica", response_model=NutritionAuditResponse)
+async def get_clinic_nutrition(
+    modo: str = Query("melhor", description="'melhor' (alimento mais adequado por animal) ou 'matriz' (porções animal x alimento)", pattern="^(melhor|matriz)$"),
+    tipo: Optional[str] = Query(None, description="Considerar apenas alimentos deste tipo"),
+    objetivo: Optional[str] = Query(None, description="Objetivo aplicado a todos os animais (substitui o das preferências)"),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Calcula de uma vez, para todos os animais da clínica, a necessidade calórica (RER/MER com
+    ajuste por condição de peso e objetivo) e a porção diária em gramas de cada alimento base
+    compatível com a espécie.
+    """
+    try:
+        clinic_id = current_user.get("id")
+        if not clinic_id:
+            raise HTTPException(status_code=401, detail="Usuário não autenticado")
+
+        animals = await _get_clinic_animals_for_nutrition(clinic_id)
+        # Só alimentos com densidade calórica conhecida permitem calcular porções
+        todos_alimentos = (await buscar_alimentos_base(tipo=tipo)).items
+        kcal_todos = densidade_kcal_100g(
+            to_float_array(a.get("kcal_por_100g") for a in todos_alimentos),
+            to_float_array(a.get("kcal_por_kg") for a in todos_alimentos),
+        )
+        alimentos = [a for a, k in zip(todos_alimentos, kcal_todos) if k > 0]
+        kcal = kcal_todos[kcal_todos > 0]
+        if modo == "matriz" and len(animals) * len(alimentos) > NUTRITION_MATRIX_MAX_CELLS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Matriz com {len(animals)}x{len(alimentos)} porções excede o limite; filtre por tipo ou use modo 'melhor'"
+            )
+        ranges = await _get_breed_ranges(animals)
+
+        # Vetores por animal
+        pesos = to_float_array(a.get("weight") for a in animals)
+        faixas = [ranges.get((a.get("breed"), a.get("species") or "")) or (np.nan, np.nan) for a in animals]
+        peso_min = np.array([f[0] for f in faixas], dtype=float)
+        peso_max = np.array([f[1] for f in faixas], dtype=float)
+        multiplicadores = np.array([multiplicador_especie(a.get("species")) for a in animals], dtype=float)
+        direcoes = np.array([direcao_objetivo(objetivo or _objetivo_preferencias(a)) for a in animals], dtype=int)
+
+        condicoes = classificar_condicoes(pesos, peso_min, peso_max)
+        calorias = calorias_diarias(pesos, multiplicadores, condicoes, direcoes)
+
+        # Matriz animal x alimento
+        compativel = compatibilidade(
+            [a.get("species") for a in animals], [a.get("especie_destino") for a in alimentos]
+        ).reshape(len(animals), len(alimentos))
+        gramas = porcoes_gramas(calorias, kcal, compativel)
+        melhores = melhor_alimento(kcal, compativel, condicoes)
+
+        resultado = []
+        for i, animal in enumerate(animals):
+            j = int(melhores[i])
+            escolhido = alimentos[j] if j >= 0 else None
+            resultado.append({
+                "animal_id": str(animal.get("id")),
+                "nome": animal.get("name"),
+                "especie": animal.get("species"),
+                "peso_kg": None if np.isnan(pesos[i]) else float(pesos[i]),
+                "condicao_peso": CONDICOES[condicoes[i]],
+                "calorias_alvo": None if np.isnan(calorias[i]) else int(calorias[i]),
+                "alimento_id": escolhido.get("alimento_id") if escolhido else None,
+                "alimento_nome": escolhido.get("nome") if escolhido else None,
+                "kcal_por_100g": float(kcal[j]) if escolhido else None,
+                "quantidade_gramas": int(gramas[i, j]) if escolhido and not np.isnan(gramas[i, j]) else None,
+            })
+
+        response: Dict[str, Any] = {"modo": modo, "animais": resultado}
+        if modo == "matriz":
+            celulas = np.where(np.isnan(gramas), 0, gramas).astype(np.int64).astype(object)
+            celulas[np.isnan(gramas)] = None
+            response["alimentos"] = [
+                {
+                    "alimento_id": a.get("alimento_id"),
+                    "nome": a.get("nome"),
+                    "especie_destino": a.get("especie_destino"),
+                    "kcal_por_100g": float(k),
+                }
+                for a, k in zip(alimentos, kcal)
+            ]
+            response["porcoes_gramas"] = celulas.tolist()
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro no cálculo nutricional da clínica: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro no cálculo nutricional da clínica: {str(e)}")
+
+@router.get("/racas/autocomplete", response_model=List[RacaSugestao])
+async def autocomplete_racas(
+    q: str = Query(..., min_length=1, description="Início ou parte do nome da raça (sem acentos, aceita erros de digitação)"),
+    especie: Optional[str] = Query(None, description="Restringir à espécie (ex.: cachorro, gato)"),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+) -> List[Dict[str, Any]]:
+    """
+    Sugestões de raças para autocomplete, do índice de raças em memória
+    (nome, nome popular, nome oficial e apelidos).
+    """
+    if not current_user.get("id"):
+        raise HTTPException(status_code=401, detail="Usuário não autenticado")
+    if not await racas_index.ensure_loaded():
+        raise HTTPException(status_code=503, detail="Índice de raças indisponível")
+
+    sugestoes = []
+    for raca, score, casamento in racas_index.search(q, especie)[:limit]:
+        sugestoes.append({
+            "id": raca.get("id"),
+            "nome": raca.get("nome"),
+            "nome_popular": raca.get("nome_popular"),
+            "nome_oficial": raca.get("nome_oficial"),
+            "especie": (raca.get("especies") or {}).get("nome_comum"),
+            "peso_min_kg": raca.get("peso_min_kg"),
+            "peso_max_kg": raca.get("peso_max_kg"),
+            "score": score,
+            "casamento": casamento,
+        })
+    return sugestoes
+
 # Rota para atualizar informações de dieta no animal
 @router.put("/animals/{animal_id}/dieta-atual", response_model=Dict[str, Any])
 async def update_animal_dieta(
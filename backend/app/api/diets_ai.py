@@ -1,48 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Query
 from typing import Dict, Any, Optional, List
-from datetime import time
+from datetime import time, datetime
+import asyncio
+import logging
+import time as time_module
+import uuid
 
 from ..db.supabase import supabase_admin as supabase
 from ..api.auth import get_current_user
-from ..models.diet import DietCreate
-from ..ai.gemini_service import generate_diet_proposal, DietAIError
-from ..api.diets import get_alimentos_base
-from ..core.config import SUPABASE_KEY
+from ..models.diet import DietCreate, DietAIBatchCreate
+from ..ai.gemini_service import generate_diet_proposal, DietAIError, DietAITimeoutError
+from ..api.diets import buscar_alimentos_base
+from ..api.dashboard import invalidate_dashboard, DASHBOARD_STATS
+from ..core.cache import TTLCache
+from ..core.config import (
+    SUPABASE_KEY, AI_CONTEXT_TIMEOUT, AI_BATCH_WORKERS, AI_BATCH_RATE_PER_MINUTE, AI_BATCH_MAX_ANIMALS,
+    AI_BATCH_JOB_TTL, AI_BATCH_JOBS_MAXSIZE,
+)
+from ..core.rate_limit import AsyncRateLimiter
+from ..db.racas_index import racas_index
+from ..core.nutrition import (
+    AJUSTE_CONDICAO, AJUSTE_EMAGRECIMENTO, AJUSTE_GANHO, multiplicador_especie, direcao_objetivo,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-async def _get_animal_and_preferences(clinic_headers: Dict[str, str], animal_id: str) -> tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
-    # Busca animal
-    animal_result = await supabase._request(
-        "GET",
-        "/rest/v1/animals",
-        params={"id": f"eq.{animal_id}", "select": "*"},
-        headers=clinic_headers,
+async def _get_animal_and_preferences(
+    clinic_headers: Optional[Dict[str, str]],
+    animal_id: str,
+    clinic_id: Optional[str] = None,
+) -> tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    # Sem token da clínica (jobs em segundo plano), a clínica é filtrada explicitamente
+    animal_params = {"id": f"eq.{animal_id}", "select": "*"}
+    if clinic_headers is None:
+        animal_params["clinic_id"] = f"eq.{clinic_id}"
+    # Animal e preferências são independentes: buscar em paralelo
+    animal_result, prefs_result = await asyncio.gather(
+        supabase._request(
+            "GET",
+            "/rest/v1/animals",
+            params=animal_params,
+            headers=clinic_headers,
+        ),
+        supabase._request(
+            "GET",
+            "/rest/v1/preferencias_pet",
+            params={"animal_id": f"eq.{animal_id}", "select": "*"},
+            headers=clinic_headers,
+        ),
     )
     animal_list = supabase.process_response(animal_result)
     if not animal_list:
         raise HTTPException(status_code=404, detail="Animal não encontrado")
     animal = animal_list[0]
 
-    # Busca preferências do pet
-    prefs_result = await supabase._request(
-        "GET",
-        "/rest/v1/preferencias_pet",
-        params={"animal_id": f"eq.{animal_id}", "select": "*"},
-        headers=clinic_headers,
-    )
     prefs_list = supabase.process_response(prefs_result)
     preferences = prefs_list[0] if isinstance(prefs_list, list) and len(prefs_list) > 0 else None
 
     return animal, preferences
 
 
-async def _get_breed_weight_range(clinic_headers: Dict[str, str], species: Optional[str], breed: Optional[str]) -> Optional[Dict[str, Any]]:
+async def _get_breed_weight_range(clinic_headers: Optional[Dict[str, str]], species: Optional[str], breed: Optional[str]) -> Optional[Dict[str, Any]]:
     """Busca faixa de peso saudável da raça na tabela 'racas' (peso_min_kg/peso_max_kg).
-    Faz correspondência por nome, nome_popular ou nome_oficial.
+    Faz correspondência por nome, nome_popular ou nome_oficial, pelo índice em memória
+    quando disponível (exato, prefixo ou aproximado, na espécie do animal).
     """
     if not breed:
         return None
+    if await racas_index.ensure_loaded():
+        return racas_index.weight_range(breed, species)
     try:
         # Buscar por variações de nome (case-insensitive)
         params = {
@@ -100,19 +128,14 @@ def _estimate_calories_with_goal(species: Optional[str], weight: Optional[float]
         rer = 70 * (float(weight) ** 0.75)
     except Exception:
         return None
-    sp = (species or "").lower()
-    base_mult = 1.6 if (sp.startswith("dog") or sp.startswith("cão") or sp.startswith("cachorro")) else 1.2
-    ajuste = 1.0
-    if condicao == "acima":
-        ajuste = 0.85
-    elif condicao == "abaixo":
-        ajuste = 1.15
+    base_mult = multiplicador_especie(species)
+    ajuste = AJUSTE_CONDICAO.get(condicao, 1.0)
     # Objetivo informado reforça ajuste
-    obj = (objetivo or "").lower()
-    if "emagrec" in obj:
-        ajuste = min(ajuste, 0.80)
-    elif "ganho" in obj or "massa" in obj:
-        ajuste = max(ajuste, 1.20)
+    direcao = direcao_objetivo(objetivo)
+    if direcao < 0:
+        ajuste = min(ajuste, AJUSTE_EMAGRECIMENTO)
+    elif direcao > 0:
+        ajuste = max(ajuste, AJUSTE_GANHO)
     return int(rer * base_mult * ajuste)
 
 
@@ -184,10 +207,21 @@ def _normalize_horario_value(value: Any) -> Optional[str]:
     except Exception:
         return None
 
+def _get_clinic_headers(authorization: Optional[str]) -> Dict[str, str]:
+    """Cabeçalhos REST com o token Bearer da clínica (as escritas respeitam RLS)."""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Cabeçalho Authorization Bearer é obrigatório")
+    clinic_token = authorization.split(" ", 1)[1].strip()
+    return {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {clinic_token}"
+    }
+
 @router.post("/animals/{animal_id}/diets/ai", response_model=Dict[str, Any])
 async def create_diet_ai(
     animal_id: str,
     user_input: Optional[Dict[str, Any]] = None,
+    usar_cache: bool = Query(True, description="Reaproveitar proposta em cache para um perfil equivalente (false força nova geração)"),
     authorization: str = Header(None),
     current_user: Dict[str, Any] = Depends(get_current_user),
 ):
@@ -196,28 +230,79 @@ async def create_diet_ai(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Apenas clínicas podem gerar dietas com IA")
 
     # Extrair token Bearer do cabeçalho Authorization
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Cabeçalho Authorization Bearer é obrigatório")
-    clinic_token = authorization.split(" ", 1)[1].strip()
+    clinic_headers = _get_clinic_headers(authorization)
 
-    clinic_headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {clinic_token}"
-    }
+    return await _generate_diet_for_animal(animal_id, user_input, clinic_headers, current_user, use_cache=usar_cache)
+
+
+async def _generate_diet_for_animal(
+    animal_id: str,
+    user_input: Optional[Dict[str, Any]],
+    clinic_headers: Optional[Dict[str, str]],
+    current_user: Dict[str, Any],
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Gera a proposta via IA para um animal e cria a dieta com o token da clínica. Sem
+    `clinic_headers` (jobs em lote), usa a service key com o clinic_id do usuário nos filtros.
+    """
+    # Coleta de contexto em duas etapas paralelas sob um único prazo (AI_CONTEXT_TIMEOUT)
+    started = time_module.perf_counter()
+    deadline = started + AI_CONTEXT_TIMEOUT
+    timings: Dict[str, float] = {}
+
+    def remaining() -> float:
+        return max(deadline - time_module.perf_counter(), 0.001)
 
-    # Verificar animal e preferências via token da clínica
+    def mark(stage: str, since: float) -> float:
+        now = time_module.perf_counter()
+        timings[stage] = round((now - since) * 1000, 1)
+        return now
+
+    # Etapa 1: animal e preferências via token da clínica
     try:
-        animal, preferences = await _get_animal_and_preferences(clinic_headers, animal_id)
+        animal, preferences = await asyncio.wait_for(
+            _get_animal_and_preferences(clinic_headers, animal_id, current_user.get("clinic_id") or current_user.get("id")),
+            timeout=remaining(),
+        )
     except HTTPException:
         raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Tempo limite excedido ao buscar dados do animal")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar dados do Supabase: {str(e)}")
+    stage_start = mark("animal_preferencias", started)
+
+    # Etapa 2: faixa de peso da raça e alimentos-base (espécie e 'ambos'), em paralelo
+    species = (animal.get("species") or "").lower()
+    breed = animal.get("breed")
+    tipo_pref = (user_input or {}).get("tipo_alimento_preferencia") or (preferences or {}).get("tipo_alimento_preferencia")
+
+    async def fetch_alimentos(especie_destino: str) -> List[Dict[str, Any]]:
+        # Selecionar alimento_base com a mesma consulta da rota de alimentos-base para diversificar
+        try:
+            return (await buscar_alimentos_base(tipo=tipo_pref, especie_destino=especie_destino)).items
+        except Exception as e:
+            logger.warning(f"Falha ao buscar alimentos-base ({especie_destino}): {e}")
+            return []
+
+    try:
+        faixa, alimentos_especie, alimentos_ambos = await asyncio.wait_for(
+            asyncio.gather(
+                _get_breed_weight_range(clinic_headers, species, breed),
+                fetch_alimentos(species),
+                fetch_alimentos("ambos"),
+            ),
+            timeout=remaining(),
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Prazo de contexto esgotado para animal {animal_id}; seguindo sem raça/alimentos-base")
+        faixa, alimentos_especie, alimentos_ambos = None, [], []
+    alimentos: List[Dict[str, Any]] = alimentos_especie + alimentos_ambos
+    stage_start = mark("raca_alimentos", stage_start)
 
     # Preparar contexto de peso/raça para orientar a IA e enriquecer cálculo
     try:
-        species = (animal.get("species") or "").lower()
-        breed = animal.get("breed")
-        faixa = await _get_breed_weight_range(clinic_headers, species, breed)
         condicao = _classificar_condicao_peso(animal.get("weight"), faixa)
 
         # Refeições: respeitar entrada; caso contrário, heurística por condição
@@ -247,33 +332,17 @@ async def create_diet_ai(
         }
 
         # Gerar proposta via IA com contexto enriquecido
-        proposal, justificativa = await generate_diet_proposal(animal, preferences, enriched_user_input)
+        proposal, justificativa = await generate_diet_proposal(animal, preferences, enriched_user_input, use_cache=use_cache)
+    except DietAITimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except DietAIError as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        mark("ia", stage_start)
+        logger.info(f"Dieta IA animal {animal_id}: tempos por etapa (ms) {timings}")
 
     # Preencher campos faltantes da proposta com base no banco e personalizações
     try:
-        # Selecionar alimento_base usando a rota de alimentos-base para diversificar
-        species = (animal.get("species") or "").lower()
-        tipo_pref = (user_input or {}).get("tipo_alimento_preferencia") or (preferences or {}).get("tipo_alimento_preferencia")
-        alimentos: List[Dict[str, Any]] = []
-        try:
-            alimentos_especie = await get_alimentos_base(
-                nome=None,
-                tipo=tipo_pref,
-                especie_destino=species,
-                current_user=current_user,
-            )
-            alimentos_ambos = await get_alimentos_base(
-                nome=None,
-                tipo=tipo_pref,
-                especie_destino="ambos",
-                current_user=current_user,
-            )
-            alimentos = (alimentos_especie or []) + (alimentos_ambos or [])
-        except Exception:
-            alimentos = []
-
         def escolher_alimento(alims: List[Dict[str, Any]], condicao_local: str) -> Optional[Dict[str, Any]]:
             if not alims:
                 return None
@@ -372,7 +441,7 @@ async def create_diet_ai(
 
     try:
         # Garantir retorno de representação e evitar nulos
-        headers = {**clinic_headers, "Prefer": "return=representation"}
+        headers = {**clinic_headers, "Prefer": "return=representation"} if clinic_headers else None
         result = await supabase._request(
             "POST",
             "/rest/v1/dietas",
@@ -386,4 +455,168 @@ async def create_diet_ai(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Falha ao criar dieta no Supabase: {str(e)}")
 
+    invalidate_dashboard(clinic_id, DASHBOARD_STATS)
     return {"diet": created, "proposal": proposal, "justificativa": justificativa}
+
+
+# --- Lotes de dietas por IA ---
+# Cada job processa seus animais em até AI_BATCH_WORKERS tarefas, respeitando
+# AI_BATCH_RATE_PER_MINUTE gerações por minuto. As tarefas rodam desacopladas da
+# requisição (sobrevivem à desconexão do cliente). Jobs pendentes/em andamento ficam
+# fixados em _active_jobs (fora do LRU, não podem ser descartados); ao terminar vão para
+# ai_diet_jobs e ficam disponíveis para consulta por AI_BATCH_JOB_TTL segundos.
+# O estado é por processo.
+
+# Status de jobs e de itens (animais) do job
+STATUS_PENDENTE = "pendente"
+STATUS_EM_ANDAMENTO = "em_andamento"
+STATUS_PROCESSANDO = "processando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+STATUS_PARCIAL = "parcial"  # Job terminado com parte dos itens em erro
+STATUS_FALHOU = "falhou"  # Job terminado com todos os itens em erro
+
+ai_diet_jobs = TTLCache(maxsize=AI_BATCH_JOBS_MAXSIZE, ttl=AI_BATCH_JOB_TTL, name="ai_diet_jobs")
+_active_jobs: Dict[str, Dict[str, Any]] = {}  # Jobs ainda não finalizados, por job_id
+_job_tasks: set = set()  # Referências às tarefas em execução (evita coleta pelo GC)
+_batch_rate_limiter = AsyncRateLimiter(AI_BATCH_RATE_PER_MINUTE)
+
+
+def _get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return _active_jobs.get(job_id) or ai_diet_jobs.get(job_id)
+
+
+def _final_status(job: Dict[str, Any]) -> str:
+    erros = sum(1 for item in job["itens"] if item["status"] != STATUS_CONCLUIDO)
+    if not erros:
+        return STATUS_CONCLUIDO
+    return STATUS_FALHOU if erros == len(job["itens"]) else STATUS_PARCIAL
+
+
+def _job_view(job: Dict[str, Any], include_items: bool = True) -> Dict[str, Any]:
+    total = len(job["itens"])
+    concluidos = sum(1 for item in job["itens"] if item["status"] == STATUS_CONCLUIDO)
+    erros = sum(1 for item in job["itens"] if item["status"] == STATUS_ERRO)
+    view = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "total": total,
+        "concluidos": concluidos,
+        "erros": erros,
+        "progresso": round((concluidos + erros) / total * 100, 1) if total else 100.0,
+        "created_at": job["created_at"],
+        "finished_at": job.get("finished_at"),
+    }
+    if include_items:
+        view["itens"] = [dict(item) for item in job["itens"]]
+    return view
+
+
+async def _run_diet_job(job: Dict[str, Any], current_user: Dict[str, Any]) -> None:
+    # Sem o token do cliente (um lote longo passa da validade do JWT): leituras e
+    # inserção usam a service key, filtradas pelo clinic_id do usuário
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    for item in job["itens"]:
+        queue.put_nowait(item)
+
+    async def worker() -> None:
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            item["status"] = STATUS_PROCESSANDO
+            try:
+                await _batch_rate_limiter.acquire()
+                result = await _generate_diet_for_animal(
+                    item["animal_id"], job["user_input"], None, current_user, use_cache=job["usar_cache"]
+                )
+                item["status"] = STATUS_CONCLUIDO
+                item["diet_id"] = (result.get("diet") or {}).get("id")
+            except HTTPException as e:
+                item["status"] = STATUS_ERRO
+                item["erro"] = str(e.detail)
+            except Exception as e:
+                item["status"] = STATUS_ERRO
+                item["erro"] = str(e)
+
+    job["status"] = STATUS_EM_ANDAMENTO
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(AI_BATCH_WORKERS, len(job["itens"])) or 1)))
+    finally:
+        job["status"] = _final_status(job)
+        job["finished_at"] = datetime.utcnow().isoformat()
+        # A retenção por AI_BATCH_JOB_TTL conta a partir do fim do job
+        ai_diet_jobs.set(job["job_id"], job)
+        _active_jobs.pop(job["job_id"], None)
+        logger.info(f"Job de dietas IA {job['job_id']} finalizado: {_job_view(job, include_items=False)}")
+
+
+async def _resolve_batch_animal_ids(clinic_id: str, batch: DietAIBatchCreate) -> List[str]:
+    if batch.animal_ids:
+        # Remove duplicados mantendo a ordem
+        return list(dict.fromkeys(str(a) for a in batch.animal_ids))
+    if not batch.filtro:
+        raise HTTPException(status_code=400, detail="Informe 'animal_ids' ou 'filtro'")
+
+    params = {"clinic_id": f"eq.{clinic_id}", "select": "id", "order": "created_at.asc"}
+    if batch.filtro == "sem_dietas":
+        # Anti-join: animais da clínica sem nenhuma dieta
+        params.update({"select": "id,dietas!left(id)", "dietas": "is.null"})
+    result = await supabase._request("GET", "/rest/v1/animals", params=params)
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar animais da clínica: {result['error']}")
+    return [a["id"] for a in supabase.process_response(result) or []]
+
+
+@router.post("/diets/ai/jobs", response_model=Dict[str, Any], status_code=202)
+async def create_diet_ai_job(
+    batch: DietAIBatchCreate,
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """Enfileira a geração de dietas por IA para vários animais; acompanhe por GET /diets/ai/jobs/{job_id}."""
+    if current_user.get("user_type") != "clinic":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Apenas clínicas podem gerar dietas com IA")
+    clinic_id = str(current_user.get("clinic_id") or current_user.get("id"))
+
+    animal_ids = await _resolve_batch_animal_ids(clinic_id, batch)
+    if len(animal_ids) > AI_BATCH_MAX_ANIMALS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {AI_BATCH_MAX_ANIMALS} animais por lote")
+
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "clinic_id": clinic_id,
+        "status": STATUS_PENDENTE,
+        "user_input": batch.user_input,
+        "usar_cache": batch.usar_cache,
+        "itens": [{"animal_id": a, "status": STATUS_PENDENTE, "diet_id": None, "erro": None} for a in animal_ids],
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    _active_jobs[job["job_id"]] = job
+
+    task = asyncio.create_task(_run_diet_job(job, current_user))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+
+    logger.info(f"Job de dietas IA {job['job_id']} criado para {len(animal_ids)} animais da clínica {clinic_id}")
+    return _job_view(job)
+
+
+@router.get("/diets/ai/jobs", response_model=List[Dict[str, Any]])
+async def list_diet_ai_jobs(current_user: Dict[str, Any] = Depends(get_current_user)):
+    """Lista os jobs de dietas por IA da clínica ainda retidos, do mais recente ao mais antigo."""
+    clinic_id = str(current_user.get("clinic_id") or current_user.get("id"))
+    jobs = [job for job in _active_jobs.values() if job["clinic_id"] == clinic_id]
+    jobs += [job for _key, job in ai_diet_jobs.items() if job["clinic_id"] == clinic_id and job["job_id"] not in _active_jobs]
+    jobs.sort(key=lambda job: job["created_at"], reverse=True)
+    return [_job_view(job, include_items=False) for job in jobs]
+
+
+@router.get("/diets/ai/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_diet_ai_job(job_id: str, current_user: Dict[str, Any] = Depends(get_current_user)):
+    """Status, progresso e resultado por animal de um job de dietas por IA."""
+    clinic_id = str(current_user.get("clinic_id") or current_user.get("id"))
+    job = _get_job(job_id)
+    if not job or job["clinic_id"] != clinic_id:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return _job_view(job)
@@ -0,0 +1,185 @@
+"""
+Exportação completa de dados da clínica em NDJSON ou CSV, em streaming.
+
+As linhas saem direto das páginas do PostgREST (keyset por `id`, EXPORT_PAGE_SIZE linhas
+por página), sem montar a exportação em memória. No CSV o corpo de cada página é repassado
+como veio do PostgREST (Accept: text/csv): uma consulta de uma linha acha o último `id` da
+página e a página é lida em streaming com `id` até ele. No NDJSON cada página JSON vira uma
+linha por registro.
+"""
+import json
+import logging
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse
+
+from .auth import get_current_user
+from .pagination import Keyset, fetch_page
+from ..core.config import EXPORT_PAGE_SIZE
+from ..db.supabase import get_http_client, supabase_admin
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Recursos exportáveis: tabela, embed usado só para filtrar e filtro pela clínica
+EXPORTS: Dict[str, Dict[str, str]] = {
+    "animals": {"table": "animals", "embed": "", "clinic_column": "clinic_id"},
+    "consultations": {"table": "consultations", "embed": "", "clinic_column": "clinic_id"},
+    "dietas": {"table": "dietas", "embed": "", "clinic_column": "clinic_id"},
+    # Registros de atividade não têm clinic_id: filtrados pelo animal (inner join sem colunas)
+    "atividades-realizadas": {"table": "atividades_realizadas", "embed": "animals!inner()", "clinic_column": "animals.clinic_id"},
+}
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+EXPORT_KEYSET = Keyset("id.asc")
+
+
+def _select(export: Dict[str, str], columns: str) -> str:
+    return f"{columns},{export['embed']}" if export["embed"] else columns
+
+
+async def _page_end(export: Dict[str, str], filters: List[Tuple[str, str]]) -> Tuple[bool, Optional[Any]]:
+    """
+    Último `id` da próxima página (uma linha, via offset sobre o índice de `id`).
+    Retorna (ok, id); id None indica que a página restante é a última.
+    """
+    params = [
+        ("select", _select(export, "id")),
+        *filters,
+        ("order", "id.asc"),
+        ("limit", "1"),
+        ("offset", str(EXPORT_PAGE_SIZE - 1)),
+    ]
+    response = await supabase_admin._request("GET", f"/rest/v1/{export['table']}", params=params)
+    if "error" in response:
+        logger.error(f"Erro ao paginar exportação de {export['table']}: {response['error']}")
+        return False, None
+    rows = supabase_admin.process_response(response) or []
+    return True, rows[0]["id"] if rows else None
+
+
+async def _stream_csv(
+    export: Dict[str, str],
+    filters: List[Tuple[str, str]],
+    first_end: Optional[Any],
+) -> AsyncIterator[bytes]:
+    """Repassa o CSV do PostgREST página a página (o cabeçalho só na primeira)."""
+    url = f"{supabase_admin.url}/rest/v1/{export['table']}"
+    headers = {**supabase_admin.headers, "Accept": "text/csv"}
+    headers.pop("Prefer", None)
+    after: List[Tuple[str, str]] = []
+    end = first_end
+    first_page = True
+    last_byte = b"\n"
+    try:
+        while True:
+            params = [("select", _select(export, "*")), *filters, *after]
+            if end is not None:
+                params.append(("id", f"lte.{end}"))
+            params.append(("order", "id.asc"))
+
+            async with get_http_client().stream("GET", url, params=params, headers=headers) as response:
+                if response.status_code >= 400:
+                    body = await response.aread()
+                    logger.error(f"Erro ao exportar {export['table']} (CSV): {response.status_code} - {body[:500]!r}")
+                    raise HTTPException(status_code=500, detail=f"Erro ao exportar {export['table']}")
+                skip_header = not first_page
+                page_started = False
+                async for chunk in response.aiter_bytes():
+                    if skip_header:
+                        newline = chunk.find(b"\n")
+                        if newline < 0:
+                            continue
+                        chunk = chunk[newline + 1:]
+                        skip_header = False
+                    if not chunk:
+                        continue
+                    # Páginas do PostgREST não terminam em quebra de linha
+                    if not page_started and last_byte != b"\n":
+                        yield b"\n"
+                    page_started = True
+                    yield chunk
+                    last_byte = chunk[-1:]
+            first_page = False
+
+            if end is None:
+                break
+            after = [EXPORT_KEYSET.after_filter(EXPORT_KEYSET.encode({"id": end}))]
+            ok, end = await _page_end(export, [*filters, *after])
+            if not ok:
+                raise HTTPException(status_code=500, detail=f"Erro ao exportar {export['table']}")
+        if last_byte != b"\n":
+            yield b"\n"
+    except Exception as e:
+        # Propaga: a conexão é abortada e o cliente vê o download falhar, em vez de um arquivo truncado
+        logger.error(f"Exportação CSV de {export['table']} interrompida: {e}", exc_info=True)
+        raise
+
+
+async def _stream_ndjson(
+    export: Dict[str, str],
+    filters: List[Tuple[str, str]],
+    first_page: Any,
+) -> AsyncIterator[bytes]:
+    """Uma linha JSON por registro, buscando a página seguinte só depois de enviar a atual."""
+    page = first_page
+    try:
+        while True:
+            if page.items:
+                yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in page.items).encode()
+            if not page.next_cursor:
+                break
+            page = await fetch_page(
+                export["table"], EXPORT_KEYSET, filters, select=_select(export, "*"),
+                limit=EXPORT_PAGE_SIZE, cursor=page.next_cursor,
+            )
+    except Exception as e:
+        logger.error(f"Exportação NDJSON de {export['table']} interrompida: {e}", exc_info=True)
+        raise
+
+
+@router.get("/exports/{recurso}")
+async def export_clinic_data(
+    recurso: str = Path(..., description="animals, consultations, dietas ou atividades-realizadas"),
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson ou csv"),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+) -> StreamingResponse:
+    """
+    Exporta todos os registros do recurso para a clínica autenticada, em streaming.
+
+    A primeira página é consultada antes da resposta começar (erros de consulta viram
+    HTTP 500); uma falha no meio do streaming é registrada no log e aborta a conexão, para que
+    o cliente não tome um arquivo incompleto por completo.
+    """
+    clinic_id = current_user.get("id")
+    if not clinic_id:
+        raise HTTPException(status_code=401, detail="Usuário não autenticado ou ID da clínica não encontrado no token")
+
+    export = EXPORTS.get(recurso)
+    if not export:
+        raise HTTPException(status_code=404, detail=f"Recurso de exportação desconhecido. Opções: {', '.join(EXPORTS)}")
+
+    filters = [(export["clinic_column"], f"eq.{clinic_id}")]
+    logger.info(f"Exportando {recurso} ({formato}) da clinic_id: {clinic_id}")
+
+    if formato == "csv":
+        ok, first_end = await _page_end(export, filters)
+        if not ok:
+            raise HTTPException(status_code=500, detail=f"Erro ao exportar {recurso}")
+        body = _stream_csv(export, filters, first_end)
+    else:
+        first_page = await fetch_page(
+            export["table"], EXPORT_KEYSET, filters, select=_select(export, "*"), limit=EXPORT_PAGE_SIZE,
+        )
+        body = _stream_ndjson(export, filters, first_page)
+
+    filename = f"{recurso}-{date.today().isoformat()}.{formato}"
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
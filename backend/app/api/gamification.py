@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Path, Query
+from fastapi import APIRouter, HTTPException, Depends, Path, Query, Response
 from typing import Dict, Any, List, Optional
 from uuid import UUID
 import logging
@@ -10,12 +10,16 @@ from ..models.gamification_goal import GamificationGoalCreate, GamificationGoalU
 from ..models.gamification_score import GamificationScoreCreate, GamificationScoreResponse
 from ..models.gamification_reward import GamificationRewardCreate, GamificationRewardUpdate, GamificationRewardResponse
 from ..models.gamification_assigned_reward import AssignedRewardCreate, AssignedRewardResponse
-from ..models.gamification_ranking import RankingResponse, RankingEntry
+from ..models.gamification_ranking import RankingResponse, RankingEntry, AnimalRankResponse
 from ..models.gamification_stats import GamificationStatsResponse, PointsHistory, GoalProgress
 from ..models.gamification_report import GamificationReportResponse, ReportAnimalInfo, ReportPeriod, ReportSummary, ReportCategoryProgress, ReportMonthlyDetail, ReportMonthlyDetailItem
 
 from ..db.supabase import supabase_admin
 from ..api.auth import get_current_user
+from ..api.pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, Keyset, fetch_page
+from ..core.cache import TTLCache
+from ..core.config import LEADERBOARD_TTL, LEADERBOARD_MAXSIZE
+from ..core.leaderboard import Leaderboard
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -54,6 +58,110 @@ def get_period_dates(periodo: str, data_inicio: Optional[date], data_fim: Option
 
     return start_date, end_date
 
+# Indica se a tabela gamificacao_saldos (migrations/add_gamificacao_saldos_ledger.sql) existe no banco;
+# só é desligado quando a tabela não existe (falhas transitórias somam o histórico só naquela chamada).
+_ledger_available = True
+
+def _empty_balance() -> Dict[str, int]:
+    return {"pontos_ganhos": 0, "pontos_gastos": 0, "pontos_disponiveis": 0, "recompensas_resgatadas": 0}
+
+async def _get_points_balances(animal_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    """
+    Retorna o saldo de pontos (ganhos, gastos, disponíveis, resgates) de cada animal.
+    Lê uma linha por animal do ledger `gamificacao_saldos`; se indisponível, soma o histórico.
+    """
+    global _ledger_available
+    balances = {str(animal_id): _empty_balance() for animal_id in animal_ids}
+    if not balances:
+        return balances
+    ids_filter = f"in.({','.join(balances.keys())})"
+
+    if _ledger_available:
+        ledger_resp = await supabase_admin._request(
+            "GET",
+            f"/rest/v1/gamificacao_saldos?animal_id={ids_filter}"
+            f"&select=animal_id,pontos_ganhos,pontos_gastos,pontos_disponiveis,recompensas_resgatadas"
+        )
+        if "error" not in ledger_resp:
+            for row in supabase_admin.process_response(ledger_resp):
+                balances[row["animal_id"]] = {key: int(row.get(key) or 0) for key in _empty_balance()}
+            return balances
+        if supabase_admin.is_missing_object(ledger_resp):
+            logger.warning(f"Ledger gamificacao_saldos não existe, somando histórico: {ledger_resp.get('error')}")
+            _ledger_available = False
+        else:
+            logger.warning(f"Falha ao ler ledger gamificacao_saldos, somando histórico: {ledger_resp.get('error')}")
+
+    scores_resp = await supabase_admin._request(
+        "GET", f"/rest/v1/gamificacao_pontuacoes?animal_id={ids_filter}&select=animal_id,pontos_obtidos"
+    )
+    for score in supabase_admin.process_response(scores_resp):
+        balances[score["animal_id"]]["pontos_ganhos"] += score.get("pontos_obtidos") or 0
+
+    used_resp = await supabase_admin._request(
+        "GET", f"/rest/v1/gamificacao_recompensas_atribuidas?animal_id={ids_filter}&select=animal_id,pontos_utilizados"
+    )
+    for used in supabase_admin.process_response(used_resp):
+        balances[used["animal_id"]]["pontos_gastos"] += used.get("pontos_utilizados") or 0
+        balances[used["animal_id"]]["recompensas_resgatadas"] += 1
+
+    for balance in balances.values():
+        balance["pontos_disponiveis"] = balance["pontos_ganhos"] - balance["pontos_gastos"]
+    return balances
+
+async def _get_points_balance(animal_id: Any) -> Dict[str, int]:
+    """Saldo de pontos de um único animal (ver `_get_points_balances`)."""
+    balances = await _get_points_balances([str(animal_id)])
+    return balances[str(animal_id)]
+
+# Indica se a tabela gamificacao_pontos_diarios (migrations/add_gamificacao_pontos_diarios_rollup.sql)
+# existe no banco; só é desligado quando a tabela não existe (falhas transitórias montam os buckets
+# a partir das pontuações só naquela chamada).
+_rollups_available = True
+
+async def _get_daily_points(animal_ids: List[str], start_date: date, end_date: date) -> List[Dict[str, Any]]:
+    """
+    Pontos por (animal, meta, dia) no intervalo [start_date, end_date], em ordem de dia.
+    Lê os agregados diários; se indisponíveis, agrega as pontuações do período.
+    """
+    global _rollups_available
+    if not animal_ids:
+        return []
+    ids_filter = f"in.({','.join(map(str, animal_ids))})"
+
+    if _rollups_available:
+        rollup_resp = await supabase_admin._request(
+            "GET",
+            f"/rest/v1/gamificacao_pontos_diarios?animal_id={ids_filter}"
+            f"&dia=gte.{start_date.isoformat()}&dia=lte.{end_date.isoformat()}"
+            f"&select=animal_id,meta_id,dia,pontos&order=dia.asc"
+        )
+        if "error" not in rollup_resp:
+            return [
+                {"animal_id": b["animal_id"], "meta_id": b.get("meta_id"), "dia": date.fromisoformat(b["dia"]), "pontos": int(b.get("pontos") or 0)}
+                for b in supabase_admin.process_response(rollup_resp)
+            ]
+        if supabase_admin.is_missing_object(rollup_resp):
+            logger.warning(f"Agregados gamificacao_pontos_diarios não existem, somando pontuações: {rollup_resp.get('error')}")
+            _rollups_available = False
+        else:
+            logger.warning(f"Falha ao ler gamificacao_pontos_diarios, somando pontuações: {rollup_resp.get('error')}")
+
+    scores_resp = await supabase_admin._request(
+        "GET",
+        f"/rest/v1/gamificacao_pontuacoes?animal_id={ids_filter}"
+        f"&data=gte.{start_date.isoformat()}&data=lt.{(end_date + timedelta(days=1)).isoformat()}"
+        f"&select=animal_id,meta_id,data,pontos_obtidos"
+    )
+    buckets = defaultdict(int)
+    for score in supabase_admin.process_response(scores_resp) or []:
+        dia = datetime.fromisoformat(score["data"]).date()
+        buckets[(score["animal_id"], score.get("meta_id"), dia)] += score.get("pontos_obtidos") or 0
+    return [
+        {"animal_id": animal_id, "meta_id": meta_id, "dia": dia, "pontos": pontos}
+        for (animal_id, meta_id, dia), pontos in sorted(buckets.items(), key=lambda item: item[0][2])
+    ]
+
 # --- Seção 1: Metas de Gamificação ---
 
 @router.post("/gamificacao/metas", response_model=GamificationGoalResponse, status_code=201)
@@ -99,11 +207,18 @@ async def create_gamification_goal(
         logger.error(f"Erro ao criar meta de gamificação para clínica {clinic_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno no servidor ao criar meta: {str(e)}")
 
+# Ordem da listagem de metas
+GOALS_KEYSET = Keyset("descricao.asc", "id.asc")
+
 @router.get("/gamificacao/metas", response_model=List[GamificationGoalResponse])
 async def list_gamification_goals(
+    http_response: Response,
     tipo: Optional[str] = Query(None, description="Filtrar por tipo de meta (atividade, alimentacao, etc)"),
     status: Optional[str] = Query(None, description="Filtrar por status (ativa, inativa)"),
     periodo: Optional[str] = Query(None, description="Filtrar por período (diario, semanal, mensal)"),
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (header X-Next-Cursor)"),
+    include_total: bool = Query(False, description="Incluir o total no header X-Total-Count"),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ) -> List[Dict[str, Any]]:
     ''' Lista todas as metas de gamificação disponíveis para a clínica logada. '''
@@ -112,22 +227,25 @@ async def list_gamification_goals(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
-        query = f"/rest/v1/gamificacao_metas?clinic_id=eq.{clinic_id}&select=*"
+        filters = [("clinic_id", f"eq.{clinic_id}")]
         if tipo:
-            query += f"&tipo=eq.{tipo}"
+            filters.append(("tipo", f"eq.{tipo}"))
         if status:
-            query += f"&status=eq.{status}"
+            filters.append(("status", f"eq.{status}"))
         if periodo:
-            query += f"&periodo=eq.{periodo}"
+            filters.append(("periodo", f"eq.{periodo}"))
 
-        query += "&order=descricao.asc"
-
-        response = await supabase_admin._request("GET", query)
-        goals = supabase_admin.process_response(response)
+        page = await fetch_page(
+            "gamificacao_metas", GOALS_KEYSET, filters,
+            limit=limit, cursor=cursor, include_total=include_total,
+        )
+        page.apply_headers(http_response)
 
-        logger.info(f"Listando {len(goals)} metas de gamificação para a clínica {clinic_id}")
-        return goals
+        logger.info(f"Listando {len(page.items)} metas de gamificação para a clínica {clinic_id}")
+        return page.items
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao listar metas de gamificação para clínica {clinic_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno no servidor ao listar metas: {str(e)}")
@@ -329,6 +447,7 @@ async def create_gamification_score(
 
         # Adicionar descrição da meta, se aplicável
         created_score["meta_descricao"] = meta_description
+        _apply_leaderboard_delta(clinic_id, score_data.animal_id, score_data.pontos_obtidos, score_data.data.date())
 
         logger.info(f"Pontuação registrada com sucesso: {created_score.get('id')} para animal {score_data.animal_id}")
         return created_score
@@ -407,7 +526,7 @@ async def delete_gamification_score(
         # 1. Verificar se a pontuação existe e obter o animal_id
         score_resp = await supabase_admin._request(
             "GET",
-            f"/rest/v1/gamificacao_pontuacoes?id=eq.{pontuacao_id}&select=id,animal_id"
+            f"/rest/v1/gamificacao_pontuacoes?id=eq.{pontuacao_id}&select=id,animal_id,pontos_obtidos,data"
         )
         score_info = supabase_admin.process_response(score_resp, single_item=True)
         if not score_info:
@@ -438,6 +557,14 @@ async def delete_gamification_score(
             logger.error(f"Erro ao deletar pontuação {pontuacao_id}: ainda encontrada após DELETE.")
             raise HTTPException(status_code=500, detail="Erro ao remover pontuação: Falha na exclusão.")
 
+        if score_info.get("data"):
+            _apply_leaderboard_delta(
+                clinic_id, animal_id, -(score_info.get("pontos_obtidos") or 0),
+                datetime.fromisoformat(score_info["data"]).date()
+            )
+        else:
+            invalidate_leaderboards(clinic_id)
+
         logger.info(f"Pontuação {pontuacao_id} removida com sucesso pela clínica {clinic_id}.")
         return None
 
@@ -646,6 +773,118 @@ async def delete_gamification_reward(
 
 # --- Seção 4: Atribuição de Recompensas ---
 
+# Indica se a função gamificacao_resgatar_recompensa (migrations/add_gamificacao_resgatar_recompensa_function.sql)
+# existe no banco; só quando a função não existe usa a verificação de saldo seguida de inserção.
+_redeem_rpc_available = True
+
+async def _redeem_reward_rpc(animal_id: UUID, clinic_id: str, assignment_data: AssignedRewardCreate) -> Optional[tuple]:
+    """
+    Resgata a recompensa em uma única transação no banco (saldo bloqueado + inserção).
+    Retorna (atribuição criada, nome da recompensa, novo saldo) ou None se a RPC não existir;
+    outras falhas da RPC viram HTTP 503, sem recorrer ao caminho não atômico.
+    """
+    global _redeem_rpc_available
+    if not _redeem_rpc_available:
+        return None
+
+    rpc_response = await supabase_admin.rpc("gamificacao_resgatar_recompensa", {
+        "p_animal_id": str(animal_id),
+        "p_clinic_id": str(clinic_id),
+        "p_recompensa_id": str(assignment_data.recompensa_id),
+        "p_codigo_verificacao": assignment_data.codigo_verificacao,
+        "p_data_expiracao": assignment_data.data_expiracao.isoformat() if assignment_data.data_expiracao else None,
+        "p_observacoes": assignment_data.observacoes,
+    })
+    if "error" in rpc_response:
+        if supabase_admin.is_missing_object(rpc_response):
+            logger.warning(f"RPC gamificacao_resgatar_recompensa não existe, usando verificação + inserção: {rpc_response['error']}")
+            _redeem_rpc_available = False
+            return None
+        # A RPC pode ter sido efetivada com a resposta perdida: não repetir a escrita por outro caminho
+        logger.error(f"Falha na RPC gamificacao_resgatar_recompensa: {rpc_response['error']}")
+        raise HTTPException(
+            status_code=503,
+            detail="Falha ao resgatar recompensa. Confira as recompensas do animal antes de tentar novamente."
+        )
+
+    result = supabase_admin.process_response(rpc_response, single_item=True)
+    if not isinstance(result, dict):
+        logger.error(f"Erro ao registrar atribuição de recompensa: Resposta inesperada: {rpc_response}")
+        raise HTTPException(status_code=500, detail="Erro ao registrar atribuição de recompensa: dados não retornados")
+
+    status = result.get("status")
+    if status == "animal_nao_encontrado":
+        raise HTTPException(status_code=404, detail="Animal não encontrado ou não pertence a esta clínica")
+    if status == "recompensa_nao_encontrada":
+        raise HTTPException(status_code=404, detail="Recompensa não encontrada")
+    if status == "pontos_insuficientes":
+        raise HTTPException(status_code=400, detail=f"Pontos insuficientes. Necessários: {result.get('pontos_necessarios')}, Disponíveis: {result.get('pontos_disponiveis')}")
+    if status != "ok" or not result.get("atribuicao"):
+        logger.error(f"Erro ao registrar atribuição de recompensa: Resposta inesperada: {rpc_response}")
+        raise HTTPException(status_code=500, detail="Erro ao registrar atribuição de recompensa: dados não retornados")
+
+    return result["atribuicao"], result.get("recompensa_nome"), result.get("pontos_disponiveis")
+
+async def _redeem_reward_non_atomic(animal_id: UUID, clinic_id: str, assignment_data: AssignedRewardCreate) -> tuple:
+    """ Verifica o saldo e insere a atribuição em passos separados (sem a RPC de resgate). """
+    # 1. Verificar se o animal pertence à clínica
+    animal_resp = await supabase_admin._request(
+        "GET",
+        f"/rest/v1/animals?id=eq.{animal_id}&clinic_id=eq.{clinic_id}&select=id"
+    )
+    if not supabase_admin.process_response(animal_resp):
+        raise HTTPException(status_code=404, detail="Animal não encontrado ou não pertence a esta clínica")
+
+    # 2. Verificar se a recompensa existe
+    reward_resp = await supabase_admin._request(
+        "GET",
+        f"/rest/v1/gamificacao_recompensas?id=eq.{assignment_data.recompensa_id}&select=id,nome,pontos_necessarios"
+    )
+    reward_info = supabase_admin.process_response(reward_resp, single_item=True)
+    if not reward_info:
+        raise HTTPException(status_code=404, detail="Recompensa não encontrada")
+
+    pontos_necessarios = reward_info.get("pontos_necessarios", 0)
+    recompensa_nome = reward_info.get("nome")
+
+    # 3-5. Obter saldo de pontos disponíveis (ledger)
+    balance = await _get_points_balance(animal_id)
+    pontos_disponiveis = balance["pontos_disponiveis"]
+
+    # 6. Verificar se há pontos suficientes
+    if pontos_disponiveis < pontos_necessarios:
+        raise HTTPException(status_code=400, detail=f"Pontos insuficientes. Necessários: {pontos_necessarios}, Disponíveis: {pontos_disponiveis}")
+
+    # 7. Preparar dados para inserção na nova tabela
+    insert_data = {
+        "animal_id": str(animal_id),
+        "recompensa_id": str(assignment_data.recompensa_id),
+        "pontos_utilizados": pontos_necessarios, # Custo da recompensa atual
+        "status": "disponivel", # Status inicial
+        "codigo_verificacao": assignment_data.codigo_verificacao,
+        "data_expiracao": assignment_data.data_expiracao.isoformat() if assignment_data.data_expiracao else None,
+        "observacoes": assignment_data.observacoes,
+        # data_atribuicao, created_at, updated_at são definidos pelo DB
+    }
+
+    # 8. Inserir o registro da atribuição
+    headers = supabase_admin.admin_headers.copy()
+    headers["Prefer"] = "return=representation"
+
+    assign_response = await supabase_admin._request(
+        "POST",
+        "/rest/v1/gamificacao_recompensas_atribuidas",
+        json={k: v for k, v in insert_data.items() if v is not None}, # Remover Nones para não sobrescrever defaults
+        headers=headers
+    )
+
+    created_assignment = supabase_admin.process_response(assign_response, single_item=True)
+    if not created_assignment:
+        logger.error(f"Erro ao registrar atribuição de recompensa: Resposta inesperada: {assign_response}")
+        raise HTTPException(status_code=500, detail="Erro ao registrar atribuição de recompensa: dados não retornados")
+
+    return created_assignment, recompensa_nome, pontos_disponiveis - pontos_necessarios
+
 @router.post("/animals/{animal_id}/gamificacao/recompensas", response_model=AssignedRewardResponse, status_code=201)
 async def assign_reward_to_animal(
     animal_id: UUID = Path(..., description="ID do animal"),
@@ -658,89 +897,26 @@ async def assign_reward_to_animal(
         if not clinic_id:
             raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
-        # 1. Verificar se o animal pertence à clínica
-        animal_resp = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/animals?id=eq.{animal_id}&clinic_id=eq.{clinic_id}&select=id"
-        )
-        if not supabase_admin.process_response(animal_resp):
-            raise HTTPException(status_code=404, detail="Animal não encontrado ou não pertence a esta clínica")
-
-        # 2. Verificar se a recompensa existe
-        reward_resp = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/gamificacao_recompensas?id=eq.{assignment_data.recompensa_id}&select=id,nome,pontos_necessarios"
-        )
-        reward_info = supabase_admin.process_response(reward_resp, single_item=True)
-        if not reward_info:
-            raise HTTPException(status_code=404, detail="Recompensa não encontrada")
-
-        pontos_necessarios = reward_info.get("pontos_necessarios", 0)
-        recompensa_nome = reward_info.get("nome")
-
-        # 3. Calcular pontos totais ganhos
-        points_resp = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/gamificacao_pontuacoes?animal_id=eq.{animal_id}&select=pontos_obtidos"
-        )
-        scores = supabase_admin.process_response(points_resp)
-        pontos_totais_ganhos = sum(score.get("pontos_obtidos", 0) for score in scores)
-
-        # 4. Calcular pontos totais utilizados
-        used_points_resp = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/gamificacao_recompensas_atribuidas?animal_id=eq.{animal_id}&select=pontos_utilizados"
-        )
-        assigned_rewards_data = supabase_admin.process_response(used_points_resp)
-        pontos_totais_utilizados = sum(reward.get("pontos_utilizados", 0) for reward in assigned_rewards_data)
-
-        # 5. Calcular pontos disponíveis reais
-        pontos_disponiveis = pontos_totais_ganhos - pontos_totais_utilizados
-
-        # 6. Verificar se há pontos suficientes
-        if pontos_disponiveis < pontos_necessarios:
-            raise HTTPException(status_code=400, detail=f"Pontos insuficientes. Necessários: {pontos_necessarios}, Disponíveis: {pontos_disponiveis}")
-
-        # 7. Preparar dados para inserção na nova tabela
-        insert_data = {
-            "animal_id": str(animal_id),
-            "recompensa_id": str(assignment_data.recompensa_id),
-            "pontos_utilizados": pontos_necessarios, # Custo da recompensa atual
-            "status": "disponivel", # Status inicial
-            "codigo_verificacao": assignment_data.codigo_verificacao,
-            "data_expiracao": assignment_data.data_expiracao.isoformat() if assignment_data.data_expiracao else None,
-            "observacoes": assignment_data.observacoes,
-            # data_atribuicao, created_at, updated_at são definidos pelo DB
-        }
-
-        # 8. Inserir o registro da atribuição
-        headers = supabase_admin.admin_headers.copy()
-        headers["Prefer"] = "return=representation"
-
-        assign_response = await supabase_admin._request(
-            "POST",
-            "/rest/v1/gamificacao_recompensas_atribuidas",
-            json={k: v for k, v in insert_data.items() if v is not None}, # Remover Nones para não sobrescrever defaults
-            headers=headers
-        )
-
-        created_assignment = supabase_admin.process_response(assign_response, single_item=True)
-        if not created_assignment:
-            logger.error(f"Erro ao registrar atribuição de recompensa: Resposta inesperada: {assign_response}")
-            raise HTTPException(status_code=500, detail="Erro ao registrar atribuição de recompensa: dados não retornados")
+        # Resgate atômico (uma ida ao banco); sem a RPC, verifica o saldo e insere em seguida
+        redeemed = await _redeem_reward_rpc(animal_id, clinic_id, assignment_data)
+        if redeemed is None:
+            redeemed = await _redeem_reward_non_atomic(animal_id, clinic_id, assignment_data)
+        created_assignment, recompensa_nome, pontos_disponiveis = redeemed
+        _apply_leaderboard_delta(clinic_id, animal_id, -(created_assignment.get("pontos_utilizados") or 0))
 
         # 9. Preparar e retornar a resposta formatada
         response_data = AssignedRewardResponse(
             id=created_assignment["id"],
             animal_id=UUID(created_assignment["animal_id"]),
             recompensa_id=UUID(created_assignment["recompensa_id"]),
-            recompensa_nome=recompensa_nome, # Obtido da verificação da recompensa
+            recompensa_nome=recompensa_nome,
             pontos_utilizados=created_assignment["pontos_utilizados"],
             data_atribuicao=created_assignment["data_atribuicao"],
             codigo_verificacao=created_assignment.get("codigo_verificacao"),
             data_expiracao=created_assignment.get("data_expiracao"),
             observacoes=created_assignment.get("observacoes"),
-            status=created_assignment["status"]
+            status=created_assignment["status"],
+            pontos_disponiveis=pontos_disponiveis
         )
 
         logger.info(f"Recompensa {assignment_data.recompensa_id} atribuída ao animal {animal_id} (Registro: {created_assignment['id']}).")
@@ -815,6 +991,116 @@ async def list_animal_assigned_rewards(
 
 # --- Seção 5: Ranking e Estatísticas ---
 
+# --- Classificações em memória por (clinic_id, periodo, início, fim) ---
+# Construídas na primeira consulta e atualizadas incrementalmente a cada pontuação
+# registrada/removida e recompensa resgatada; expiram em LEADERBOARD_TTL (outros processos).
+
+leaderboards = TTLCache(maxsize=LEADERBOARD_MAXSIZE, ttl=LEADERBOARD_TTL, name="leaderboards")
+# Geração por clínica: descarta classificações construídas antes de uma escrita concorrente
+_leaderboard_generation: Dict[str, int] = {}
+
+def invalidate_leaderboards(clinic_id: Optional[Any]) -> None:
+    """ Descarta as classificações de uma clínica (ex.: animal criado, renomeado ou removido). """
+    if not clinic_id:
+        return
+    clinic_id = str(clinic_id)
+    _leaderboard_generation[clinic_id] = _leaderboard_generation.get(clinic_id, 0) + 1
+    leaderboards.invalidate_where(lambda key, _v: key[0] == clinic_id)
+
+def _apply_leaderboard_delta(clinic_id: Optional[Any], animal_id: Any, delta: int, score_date: Optional[date] = None) -> None:
+    """
+    Aplica uma variação de pontos às classificações em memória da clínica.
+    Pontuações afetam apenas os períodos que contêm `score_date`; pontos gastos
+    (`score_date=None`) são descontados em todos os períodos, como no cálculo completo.
+    """
+    if not clinic_id or not delta:
+        return
+    clinic_id = str(clinic_id)
+    animal_id = str(animal_id)
+    _leaderboard_generation[clinic_id] = _leaderboard_generation.get(clinic_id, 0) + 1
+    for key, entry in leaderboards.items():
+        if key[0] != clinic_id:
+            continue
+        if score_date and key[1] != 'total' and not (key[2] <= score_date.isoformat() <= key[3]):
+            continue
+        if animal_id in entry["board"]:
+            entry["board"].add(animal_id, delta)
+        else:
+            leaderboards.pop(key)
+
+async def _compute_ranking_points(target_clinic_id: str, periodo: str, start_date: date, end_date: date) -> tuple:
+    """ Calcula (animais, pontos líquidos por animal) da clínica no período a partir do banco. """
+    animal_query = f"/rest/v1/animals?select=id,name,clinic_id"
+    if target_clinic_id:
+         animal_query += f"&clinic_id=eq.{target_clinic_id}"
+
+    animal_resp = await supabase_admin._request("GET", animal_query)
+    animals_data = supabase_admin.process_response(animal_resp)
+    animal_map = {a['id']: {"name": a['name'], "clinic_id": a['clinic_id']} for a in animals_data}
+
+    if not animal_map:
+        return animal_map, {}
+
+    animal_ids = list(animal_map.keys())
+
+    # Saldo de cada animal vem do ledger (uma linha por animal)
+    balances = await _get_points_balances(animal_ids)
+
+    net_total_points = {}
+    if periodo == 'total':
+        for animal_id in animal_ids:
+            net_total_points[animal_id] = balances[animal_id]["pontos_disponiveis"]
+    else:
+        # Soma dos agregados diários do período
+        period_points_by_animal = defaultdict(int)
+        for bucket in await _get_daily_points(animal_ids, start_date, end_date):
+            period_points_by_animal[bucket["animal_id"]] += bucket["pontos"]
+
+        for animal_id in animal_ids:
+            net_total_points[animal_id] = period_points_by_animal[animal_id] - balances[animal_id]["pontos_gastos"]
+
+    return animal_map, net_total_points
+
+async def _get_clinic_names(clinic_ids: set) -> Dict[str, str]:
+    if not clinic_ids:
+        return {}
+    clinic_query = f"/rest/v1/clinics?id=in.({','.join(map(str, clinic_ids))})&select=id,name"
+    clinic_resp = await supabase_admin._request("GET", clinic_query)
+    clinic_data = supabase_admin.process_response(clinic_resp) or []
+    return {c['id']: c['name'] for c in clinic_data}
+
+async def _get_leaderboard(clinic_id: str, periodo: str) -> Dict[str, Any]:
+    """ Classificação da clínica no período padrão (sem datas explícitas), construída sob demanda. """
+    clinic_id = str(clinic_id)
+    start_date, end_date = get_period_dates(periodo, None, None)
+    key = (clinic_id, periodo, start_date.isoformat(), end_date.isoformat())
+    entry = leaderboards.get(key)
+    if entry is not None:
+        return entry
+
+    generation = _leaderboard_generation.get(clinic_id, 0)
+    animal_map, net_total_points = await _compute_ranking_points(clinic_id, periodo, start_date, end_date)
+    clinic_names = await _get_clinic_names({a["clinic_id"] for a in animal_map.values() if a["clinic_id"]})
+    entry = {
+        "board": Leaderboard(net_total_points),
+        "animais": animal_map,
+        "clinic_nomes": clinic_names,
+    }
+    if _leaderboard_generation.get(clinic_id, 0) == generation:
+        leaderboards.set(key, entry)
+    return entry
+
+def _ranking_entry(entry: Dict[str, Any], animal_id: str, pontos: int, posicao: int) -> RankingEntry:
+    animal_info = entry["animais"].get(animal_id, {})
+    return RankingEntry(
+        posicao=posicao,
+        animal_id=animal_id,
+        animal_nome=animal_info.get("name"),
+        pontos_totais=pontos,
+        clinic_id=animal_info.get("clinic_id"),
+        clinic_nome=entry["clinic_nomes"].get(animal_info.get("clinic_id")),
+    )
+
 @router.get("/gamificacao/ranking", response_model=RankingResponse)
 async def get_gamification_ranking(
     periodo: str = Query("total", description="Período para cálculo (semanal, mensal, trimestral, total)", pattern="^(semanal|mensal|trimestral|total)$"),
@@ -837,79 +1123,31 @@ async def get_gamification_ranking(
         else:
              logger.info(f"Usuário {requesting_clinic_id} solicitando ranking para sua própria clínica")
 
-        start_date, end_date = get_period_dates(periodo, data_inicio, data_fim)
-
-        animal_query = f"/rest/v1/animals?select=id,name,clinic_id"
-        if target_clinic_id:
-             animal_query += f"&clinic_id=eq.{target_clinic_id}"
+        # Período padrão: top-K direto da classificação em memória
+        if not data_inicio and not data_fim:
+            entry = await _get_leaderboard(target_clinic_id, periodo)
+            ranked_results = [
+                _ranking_entry(entry, animal_id, pontos, i + 1)
+                for i, (animal_id, pontos) in enumerate(entry["board"].top(limite))
+            ]
+            return RankingResponse(ranking=ranked_results).dict()
 
-        animal_resp = await supabase_admin._request("GET", animal_query)
-        animals_data = supabase_admin.process_response(animal_resp)
-        animal_map = {a['id']: {"name": a['name'], "clinic_id": a['clinic_id']} for a in animals_data}
+        # Intervalo de datas explícito: cálculo completo a partir do banco
+        start_date, end_date = get_period_dates(periodo, data_inicio, data_fim)
+        animal_map, net_total_points = await _compute_ranking_points(target_clinic_id, periodo, start_date, end_date)
 
         if not animal_map:
             return RankingResponse(ranking=[]).dict()
 
-        animal_ids = list(animal_map.keys())
-
-        total_scores_query = (
-            f"/rest/v1/gamificacao_pontuacoes?select=animal_id,pontos_obtidos"
-            f"&animal_id=in.({','.join(map(str, animal_ids))})"
-        )
-        if periodo != 'total':
-             total_scores_query += (
-                 f"&data=gte.{start_date.isoformat()}"
-                 f"&data=lt.{(end_date + timedelta(days=1)).isoformat()}"
-             )
-
-        total_scores_resp = await supabase_admin._request("GET", total_scores_query)
-        total_scores_data = supabase_admin.process_response(total_scores_resp)
-
-        total_points_by_animal = defaultdict(int)
-        for score in total_scores_data:
-            total_points_by_animal[score["animal_id"]] += score.get("pontos_obtidos", 0)
-
-        used_points_query = (
-             f"/rest/v1/gamificacao_recompensas_atribuidas?select=animal_id,pontos_utilizados"
-             f"&animal_id=in.({','.join(map(str, animal_ids))})"
-        )
-        used_points_resp = await supabase_admin._request("GET", used_points_query)
-        used_points_data = supabase_admin.process_response(used_points_resp)
-
-        used_points_by_animal = defaultdict(int)
-        for used in used_points_data:
-             used_points_by_animal[used["animal_id"]] += used.get("pontos_utilizados", 0)
-
-        net_total_points = {}
-        for animal_id in animal_ids:
-            net_total_points[animal_id] = total_points_by_animal[animal_id] - used_points_by_animal[animal_id]
-
-        ranking_list = []
-        for animal_id, total_pts in net_total_points.items():
-            animal_info = animal_map.get(animal_id)
-            if animal_info:
-                ranking_list.append({
-                    "animal_id": animal_id,
-                    "animal_nome": animal_info["name"],
-                    "pontos_totais": total_pts,
-                    "clinic_id": animal_info["clinic_id"]
-                })
-
-        ranking_list.sort(key=lambda x: x["pontos_totais"], reverse=True)
-
-        ranked_results = []
-        clinic_ids_in_ranking = {entry["clinic_id"] for entry in ranking_list if entry["clinic_id"]}
-        clinic_names = {}
-        if clinic_ids_in_ranking:
-            clinic_query = f"/rest/v1/clinics?id=in.({','.join(map(str, clinic_ids_in_ranking))})&select=id,name"
-            clinic_resp = await supabase_admin._request("GET", clinic_query)
-            clinic_data = supabase_admin.process_response(clinic_resp)
-            clinic_names = {c['id']: c['name'] for c in clinic_data}
-
-        for i, entry in enumerate(ranking_list[:limite]):
-            entry["posicao"] = i + 1
-            entry["clinic_nome"] = clinic_names.get(entry["clinic_id"])
-            ranked_results.append(RankingEntry(**entry))
+        ranking_list = sorted(net_total_points.items(), key=lambda item: item[1], reverse=True)[:limite]
+        entry = {
+            "animais": animal_map,
+            "clinic_nomes": await _get_clinic_names({a["clinic_id"] for a in animal_map.values() if a["clinic_id"]}),
+        }
+        ranked_results = [
+            _ranking_entry(entry, animal_id, pontos, i + 1)
+            for i, (animal_id, pontos) in enumerate(ranking_list)
+        ]
 
         return RankingResponse(ranking=ranked_results).dict()
 
@@ -919,6 +1157,45 @@ async def get_gamification_ranking(
         logger.error(f"Erro ao gerar ranking: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro interno no servidor ao gerar ranking: {str(e)}")
 
+@router.get("/animals/{animal_id}/gamificacao/ranking", response_model=AnimalRankResponse)
+async def get_animal_gamification_rank(
+    animal_id: UUID = Path(..., description="ID do animal"),
+    periodo: str = Query("total", description="Período para cálculo (semanal, mensal, trimestral, total)", pattern="^(semanal|mensal|trimestral|total)$"),
+    vizinhos: int = Query(2, description="Quantidade de animais acima e abaixo a incluir", ge=0, le=50),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """ Posição do pet no ranking da clínica e os animais imediatamente acima e abaixo. """
+    try:
+        clinic_id = current_user.get("id")
+        if not clinic_id:
+            raise HTTPException(status_code=401, detail="Usuário não autenticado")
+
+        entry = await _get_leaderboard(clinic_id, periodo)
+        board = entry["board"]
+        # A classificação contém exatamente os animais da clínica
+        index, window = board.around(str(animal_id), vizinhos)
+        if index is None:
+            raise HTTPException(status_code=404, detail="Animal não encontrado ou não pertence a esta clínica")
+
+        first_position = index - min(index, vizinhos) + 1
+        return AnimalRankResponse(
+            animal_id=animal_id,
+            periodo=periodo,
+            posicao=index + 1,
+            pontos_totais=board.score(str(animal_id)),
+            total_participantes=len(board),
+            vizinhos=[
+                _ranking_entry(entry, neighbour_id, pontos, first_position + i)
+                for i, (neighbour_id, pontos) in enumerate(window)
+            ],
+        ).dict()
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        logger.error(f"Erro ao obter posição do animal {animal_id} no ranking: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erro interno no servidor ao obter posição no ranking: {str(e)}")
+
 @router.get("/animals/{animal_id}/gamificacao/estatisticas", response_model=GamificationStatsResponse)
 async def get_animal_gamification_stats(
     animal_id: UUID = Path(..., description="ID do animal"),
@@ -942,41 +1219,27 @@ async def get_animal_gamification_stats(
             raise HTTPException(status_code=404, detail="Animal não encontrado ou não pertence a esta clínica")
 
         start_date, end_date = get_period_dates(periodo, data_inicio, data_fim)
-        start_datetime_str = datetime.combine(start_date, datetime.min.time()).isoformat()
-        end_datetime_str = datetime.combine(end_date + timedelta(days=1), datetime.min.time()).isoformat()
-
-        total_scores_resp = await supabase_admin._request(
-            "GET", f"/rest/v1/gamificacao_pontuacoes?animal_id=eq.{animal_id}&select=pontos_obtidos"
-        )
-        total_scores_data = supabase_admin.process_response(total_scores_resp)
-        pontos_totais = sum(s.get("pontos_obtidos", 0) for s in total_scores_data)
-
-        used_points_resp = await supabase_admin._request(
-            "GET", f"/rest/v1/gamificacao_recompensas_atribuidas?animal_id=eq.{animal_id}&select=pontos_utilizados"
-        )
-        used_points_data = supabase_admin.process_response(used_points_resp)
-        pontos_utilizados_total = sum(r.get("pontos_utilizados", 0) for r in used_points_data)
 
-        pontos_disponiveis = pontos_totais - pontos_utilizados_total
+        balance = await _get_points_balance(animal_id)
+        pontos_totais = balance["pontos_ganhos"]
+        pontos_disponiveis = balance["pontos_disponiveis"]
+        recompensas_resgatadas = balance["recompensas_resgatadas"]
 
-        period_scores_resp = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/gamificacao_pontuacoes?animal_id=eq.{animal_id}"
-            f"&data=gte.{start_datetime_str}&data=lt.{end_datetime_str}"
-            f"&select=pontos_obtidos,data,meta_id"
-            f"&order=data.asc"
-        )
-        period_scores_data = supabase_admin.process_response(period_scores_resp)
-        pontos_periodo = sum(s.get("pontos_obtidos", 0) for s in period_scores_data)
-
-        recompensas_resgatadas = len(used_points_data)
+        # Pontos do período a partir dos agregados diários (um ponto de histórico por dia)
+        period_buckets = await _get_daily_points([str(animal_id)], start_date, end_date)
+        pontos_periodo = sum(b["pontos"] for b in period_buckets)
 
-        historico_pontos = []
+        pontos_por_dia = defaultdict(int)
         metas_ids_periodo = set()
-        for score in period_scores_data:
-            historico_pontos.append(PointsHistory(data=datetime.fromisoformat(score["data"]), pontos=score["pontos_obtidos"]))
-            if score.get("meta_id"):
-                metas_ids_periodo.add(score["meta_id"])
+        for bucket in period_buckets:
+            pontos_por_dia[bucket["dia"]] += bucket["pontos"]
+            if bucket.get("meta_id"):
+                metas_ids_periodo.add(bucket["meta_id"])
+
+        historico_pontos = [
+            PointsHistory(data=datetime.combine(dia, datetime.min.time()), pontos=pontos)
+            for dia, pontos in sorted(pontos_por_dia.items())
+        ]
 
         progresso_metas = []
         metas_concluidas = 0
@@ -1054,14 +1317,7 @@ async def get_animal_gamification_report(
         start_datetime_str = datetime.combine(start_date, datetime.min.time()).isoformat()
         end_datetime_str = datetime.combine(end_date + timedelta(days=1), datetime.min.time()).isoformat()
 
-        scores_resp = await supabase_admin._request(
-            "GET",
-            f"/rest/v1/gamificacao_pontuacoes?animal_id=eq.{animal_id}"
-            f"&data=gte.{start_datetime_str}&data=lt.{end_datetime_str}"
-            f"&select=pontos_obtidos,data,meta:gamificacao_metas(id,descricao,tipo)"
-            f"&order=data.asc"
-        )
-        scores_data = supabase_admin.process_response(scores_resp)
+        scores_data = await _get_daily_points([str(animal_id)], start_date, end_date)
 
         rewards_resp = await supabase_admin._request(
             "GET",
@@ -1071,15 +1327,14 @@ async def get_animal_gamification_report(
         )
         rewards_data = supabase_admin.process_response(rewards_resp)
 
-        pontos_acumulados_periodo = sum(s.get("pontos_obtidos", 0) for s in scores_data)
+        pontos_acumulados_periodo = sum(b["pontos"] for b in scores_data)
         recompensas_resgatadas_periodo = len(rewards_data)
         progresso_por_categoria = defaultdict(lambda: {"total_metas": 0, "concluidas": 0, "percentual": 0.0})
         metas_tocadas_ids = set()
 
-        for score in scores_data:
-            meta_info = score.get("meta")
-            if meta_info and meta_info.get("id"):
-                metas_tocadas_ids.add(meta_info["id"])
+        for bucket in scores_data:
+            if bucket.get("meta_id"):
+                metas_tocadas_ids.add(bucket["meta_id"])
 
         metas_concluidas_total = len(metas_tocadas_ids)
 
@@ -1100,13 +1355,11 @@ async def get_animal_gamification_report(
                      progresso_por_categoria[tipo_meta]["percentual"] = 100.0
 
         detalhamento_mensal_data = defaultdict(lambda: {"pontos": 0, "metas_concluidas": 0, "metas_ids": set()})
-        for score in scores_data:
-            score_dt = datetime.fromisoformat(score["data"])
-            month_year = score_dt.strftime("%B/%Y")
-            detalhamento_mensal_data[month_year]["pontos"] += score.get("pontos_obtidos", 0)
-            meta_info = score.get("meta")
-            if meta_info and meta_info.get("id"):
-                detalhamento_mensal_data[month_year]["metas_ids"].add(meta_info["id"])
+        for bucket in scores_data:
+            month_year = bucket["dia"].strftime("%B/%Y")
+            detalhamento_mensal_data[month_year]["pontos"] += bucket["pontos"]
+            if bucket.get("meta_id"):
+                detalhamento_mensal_data[month_year]["metas_ids"].add(bucket["meta_id"])
 
         detalhamento_mensal = []
         if metas_tocadas_ids:
@@ -1,7 +1,30 @@
 from fastapi import APIRouter
 
+from .auth import principal_cache
+from .appointments import schedule_indexes
+from .dashboard import dashboard_snapshots
+from .gamification import leaderboards
+from ..ai.gemini_service import proposal_cache
+from .diets_ai import ai_diet_jobs
+from ..db.alimentos_catalog import alimentos_catalog
+from ..db.racas_index import racas_index
+
 router = APIRouter()
 
 @router.get("/health")
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@router.get("/health/cache")
+async def cache_stats():
+    """Contadores de acerto/erro dos caches em memória do processo."""
+    return {
+        "principal": principal_cache.stats(),
+        "dashboard": dashboard_snapshots.stats(),
+        "leaderboards": leaderboards.stats(),
+        "ai_proposals": proposal_cache.stats(),
+        "ai_diet_jobs": ai_diet_jobs.stats(),
+        "alimentos_catalog": alimentos_catalog.stats(),
+        "racas_index": racas_index.stats(),
+        "schedule": schedule_indexes.stats(),
+    }
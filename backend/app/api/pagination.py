@@ -0,0 +1,189 @@
+"""
+Paginação por cursor (keyset) compartilhada pelas listagens.
+
+Cada listagem declara a ordenação com `Keyset` (a última coluna deve ser única, em geral
+`id`). O cursor é opaco: base64 dos valores dessas colunas no último item da página, e a
+página seguinte é um filtro "depois desta chave" + `order` + `limit` no PostgREST, sem OFFSET.
+As listagens continuam devolvendo a lista no corpo; o cursor da próxima página vai no header
+X-Next-Cursor e, quando pedido (`include_total`), o total do filtro em X-Total-Count.
+"""
+import base64
+import json
+import logging
+from functools import cmp_to_key
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from fastapi import HTTPException, Response
+
+from ..core.config import LIST_PAGE_SIZE_DEFAULT, LIST_PAGE_SIZE_MAX
+from ..db.supabase import supabase_admin
+
+logger = logging.getLogger(__name__)
+
+# Reexportados para os parâmetros `limit` das rotas
+PAGE_SIZE_DEFAULT = LIST_PAGE_SIZE_DEFAULT
+PAGE_SIZE_MAX = LIST_PAGE_SIZE_MAX
+
+Filters = Union[Dict[str, str], Sequence[Tuple[str, str]]]
+
+
+def _quote(value: Any) -> str:
+    """Valor em uma árvore lógica do PostgREST (aspas protegem vírgulas, pontos e parênteses)."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+class Page:
+    """Itens de uma página, cursor da seguinte (None na última) e total, se pedido."""
+
+    def __init__(self, items: List[Dict[str, Any]], next_cursor: Optional[str] = None, total: Optional[int] = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+
+    def apply_headers(self, response: Response) -> None:
+        if self.next_cursor:
+            response.headers["X-Next-Cursor"] = self.next_cursor
+        if self.total is not None:
+            response.headers["X-Total-Count"] = str(self.total)
+
+
+class Keyset:
+    """
+    Ordenação estável de uma listagem: `Keyset("date.desc", "start_time.desc", "id.desc")`.
+
+    Nulos ficam por último em todas as colunas (`nullslast`), tanto no banco quanto em
+    `paginate` (listas em memória), para que o filtro "depois do cursor" seja exato.
+    """
+
+    def __init__(self, *columns: str):
+        if not columns:
+            raise ValueError("Keyset precisa de ao menos uma coluna")
+        self.columns: List[Tuple[str, bool]] = []
+        for column in columns:
+            name, _, direction = column.partition(".")
+            self.columns.append((name, direction == "desc"))
+        self.order = ",".join(
+            f"{name}.{'desc' if desc else 'asc'}" + (".nullslast" if i < len(self.columns) - 1 else "")
+            for i, (name, desc) in enumerate(self.columns)
+        )
+
+    # --- Cursor ---
+
+    def encode(self, row: Dict[str, Any]) -> str:
+        values = [row.get(name) for name, _desc in self.columns]
+        values = [v if v is None or isinstance(v, (bool, int, float)) else str(v) for v in values]
+        raw = json.dumps(values, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> List[Any]:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (ValueError, TypeError):
+            values = None
+        if (
+            not isinstance(values, list)
+            or len(values) != len(self.columns)
+            or values[-1] is None
+            or any(isinstance(v, (list, dict)) for v in values)
+        ):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        return values
+
+    # --- Banco (PostgREST) ---
+
+    def _after(self, values: List[Any], i: int = 0) -> str:
+        name, desc = self.columns[i]
+        value = values[i]
+        last = i == len(self.columns) - 1
+        if value is None:
+            # Já entre os nulos (fim da ordenação desta coluna): desempata pelas seguintes
+            return f"and({name}.is.null,{self._after(values, i + 1)})"
+        terms = [f"{name}.{'lt' if desc else 'gt'}.{_quote(value)}"]
+        if not last:
+            terms.append(f"{name}.is.null")
+            terms.append(f"and({name}.eq.{_quote(value)},{self._after(values, i + 1)})")
+        return f"or({','.join(terms)})" if len(terms) > 1 else terms[0]
+
+    def after_filter(self, cursor: str) -> Tuple[str, str]:
+        """Parâmetro PostgREST que seleciona os itens depois do cursor."""
+        expression = self._after(self.decode(cursor))
+        if expression.startswith("or("):
+            return "or", expression[2:]
+        return "and", f"({expression})"
+
+    # --- Memória ---
+
+    def _compare(self, a: List[Any], b: List[Any]) -> int:
+        for (_name, desc), x, y in zip(self.columns, a, b):
+            if x == y:
+                continue
+            if x is None:
+                return 1
+            if y is None:
+                return -1
+            try:
+                result = -1 if x < y else 1
+            except TypeError:
+                result = -1 if str(x) < str(y) else 1
+            return -result if desc else result
+        return 0
+
+    def _key(self, row: Dict[str, Any]) -> List[Any]:
+        values = [row.get(name) for name, _desc in self.columns]
+        return [v if v is None or isinstance(v, (bool, int, float, str)) else str(v) for v in values]
+
+    def paginate(
+        self,
+        rows: Iterable[Dict[str, Any]],
+        limit: int,
+        cursor: Optional[str] = None,
+        include_total: bool = False,
+    ) -> Page:
+        """Mesma paginação sobre uma lista já carregada (ex.: catálogos em memória)."""
+        rows = list(rows)
+        compare = cmp_to_key(self._compare)
+        ordered = sorted(rows, key=lambda r: compare(self._key(r)))
+        if cursor:
+            after = compare(self.decode(cursor))
+            ordered = [r for r in ordered if compare(self._key(r)) > after]
+        items = ordered[:limit]
+        next_cursor = self.encode(items[-1]) if len(ordered) > limit else None
+        return Page(items, next_cursor, len(rows) if include_total else None)
+
+
+async def fetch_page(
+    table: str,
+    keyset: Keyset,
+    filters: Filters = (),
+    select: str = "*",
+    limit: int = PAGE_SIZE_DEFAULT,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+) -> Page:
+    """
+    Uma página de `table`: filtros + chave do cursor + `order` + `limit` (um item a mais
+    indica se há próxima página). Com `include_total`, conta o filtro com HEAD (count=exact).
+    """
+    base = list(filters.items()) if isinstance(filters, dict) else list(filters)
+    params = [("select", select), *base]
+    if cursor:
+        params.append(keyset.after_filter(cursor))
+    params += [("order", keyset.order), ("limit", str(limit + 1))]
+
+    response = await supabase_admin._request("GET", f"/rest/v1/{table}", params=params)
+    if "error" in response:
+        logger.error(f"Erro ao paginar {table}: {response['error']}")
+        raise HTTPException(status_code=500, detail=f"Erro ao listar {table}")
+    rows = supabase_admin.process_response(response) or []
+
+    items = rows[:limit]
+    next_cursor = keyset.encode(items[-1]) if len(rows) > limit else None
+    total = None
+    if include_total:
+        total = len(items) if not cursor and next_cursor is None else await supabase_admin.count(table, base, select=select)
+    return Page(items, next_cursor, total)
@@ -22,4 +22,72 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
 # Configurações do Google Gemini
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
\ No newline at end of file
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# Tempo limite (segundos) por chamada ao Gemini e número máximo de chamadas simultâneas por processo
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "45"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+# Prazo único (segundos) para a coleta de contexto antes da chamada à IA
+AI_CONTEXT_TIMEOUT = float(os.getenv("AI_CONTEXT_TIMEOUT", "10"))
+# Cache de propostas de dieta por contexto (peso agrupado em faixas de AI_PROPOSAL_WEIGHT_BUCKET_KG)
+AI_PROPOSAL_CACHE_TTL = float(os.getenv("AI_PROPOSAL_CACHE_TTL", "3600"))
+AI_PROPOSAL_CACHE_MAXSIZE = int(os.getenv("AI_PROPOSAL_CACHE_MAXSIZE", "512"))
+AI_PROPOSAL_WEIGHT_BUCKET_KG = float(os.getenv("AI_PROPOSAL_WEIGHT_BUCKET_KG", "0.5"))
+# Lotes de dietas por IA: workers simultâneos, ritmo máximo de gerações/minuto e retenção dos jobs
+AI_BATCH_WORKERS = int(os.getenv("AI_BATCH_WORKERS", "4"))
+AI_BATCH_RATE_PER_MINUTE = float(os.getenv("AI_BATCH_RATE_PER_MINUTE", "30"))
+AI_BATCH_MAX_ANIMALS = int(os.getenv("AI_BATCH_MAX_ANIMALS", "500"))
+AI_BATCH_JOB_TTL = float(os.getenv("AI_BATCH_JOB_TTL", "86400"))
+AI_BATCH_JOBS_MAXSIZE = int(os.getenv("AI_BATCH_JOBS_MAXSIZE", "256"))
+
+# Pool de conexões HTTP com o Supabase (compartilhado entre supabase_client e supabase_admin)
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() in ("1", "true", "yes")
+SUPABASE_POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "100"))
+SUPABASE_POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+SUPABASE_POOL_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "30"))
+
+# Validação de tokens JWT do Supabase
+# SUPABASE_AUTH_MODE: "local" valida a assinatura localmente (segredo HS256 ou JWKS)
+# e só consulta /auth/v1/user quando não há chave disponível; "remote" sempre consulta.
+SUPABASE_AUTH_MODE = os.getenv("SUPABASE_AUTH_MODE", "local").lower()
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL", f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json")
+SUPABASE_JWKS_CACHE_TTL = int(os.getenv("SUPABASE_JWKS_CACHE_TTL", "600"))
+# Intervalo mínimo entre buscas do JWKS (kid desconhecido ou falha na busca)
+SUPABASE_JWKS_MIN_REFETCH_INTERVAL = float(os.getenv("SUPABASE_JWKS_MIN_REFETCH_INTERVAL", "30"))
+
+# Cache de identidade (clínica/tutor) resolvida em get_current_user
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAXSIZE = int(os.getenv("PRINCIPAL_CACHE_MAXSIZE", "2048"))
+
+# Snapshot do dashboard por clínica (segundos de defasagem tolerada)
+DASHBOARD_SNAPSHOT_TTL = float(os.getenv("DASHBOARD_SNAPSHOT_TTL", "30"))
+DASHBOARD_SNAPSHOT_MAXSIZE = int(os.getenv("DASHBOARD_SNAPSHOT_MAXSIZE", "1024"))
+
+# Classificações de gamificação por clínica/período mantidas em memória
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "300"))
+LEADERBOARD_MAXSIZE = int(os.getenv("LEADERBOARD_MAXSIZE", "512"))
+
+# Catálogo de alimentos_base em memória (segundos até recarregar do banco)
+ALIMENTOS_CATALOG_TTL = float(os.getenv("ALIMENTOS_CATALOG_TTL", "300"))
+
+# Limite de células (animais x alimentos) da matriz de porções do cálculo nutricional
+NUTRITION_MATRIX_MAX_CELLS = int(os.getenv("NUTRITION_MATRIX_MAX_CELLS", "250000"))
+
+# Índice de raças em memória (segundos até recarregar do banco)
+RACAS_INDEX_TTL = float(os.getenv("RACAS_INDEX_TTL", "3600"))
+
+# Agenda: duração assumida para agendamentos sem horário de término e cache dos índices por (clínica, dia).
+# A duração não é configurável: precisa ser igual ao INTERVAL '60 minutes' da exclusion constraint
+# (migrations/add_appointments_no_overlap_constraint.sql); alterar as duas juntas.
+APPOINTMENT_DEFAULT_DURATION_MINUTES = 60
+SCHEDULE_INDEX_TTL = float(os.getenv("SCHEDULE_INDEX_TTL", "60"))
+SCHEDULE_INDEX_MAXSIZE = int(os.getenv("SCHEDULE_INDEX_MAXSIZE", "1024"))
+
+# Paginação por cursor das listagens (tamanho padrão e máximo de página)
+LIST_PAGE_SIZE_DEFAULT = int(os.getenv("LIST_PAGE_SIZE_DEFAULT", "100"))
+LIST_PAGE_SIZE_MAX = int(os.getenv("LIST_PAGE_SIZE_MAX", "500"))
+
+# Exportações em streaming (linhas por página lida do PostgREST)
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "5000"))
@@ -0,0 +1,63 @@
+from bisect import bisect_left, insort
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class Leaderboard:
+    """
+    Classificação ordenada por pontos (maior primeiro), mantida incrementalmente.
+
+    Guarda uma lista ordenada de (-pontos, membro) e um índice membro -> pontos:
+    top-K é um fatiamento O(K) e a posição de um membro é uma busca binária O(log n).
+    Empates são desfeitos pelo identificador do membro, para uma ordem estável.
+    """
+
+    def __init__(self, scores: Optional[Dict[Hashable, int]] = None):
+        self._scores: Dict[Hashable, int] = dict(scores or {})
+        self._order: List[Tuple[int, Hashable]] = sorted((-points, member) for member, points in self._scores.items())
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, member: Hashable) -> bool:
+        return member in self._scores
+
+    def score(self, member: Hashable) -> Optional[int]:
+        return self._scores.get(member)
+
+    def add(self, member: Hashable, delta: int) -> int:
+        """Soma `delta` aos pontos do membro (inserindo-o com 0 se necessário) e retorna o novo total."""
+        old = self._scores.get(member)
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, member))]
+        new = (old or 0) + delta
+        self._scores[member] = new
+        insort(self._order, (-new, member))
+        return new
+
+    def remove(self, member: Hashable) -> None:
+        old = self._scores.pop(member, None)
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, member))]
+
+    def top(self, k: int) -> List[Tuple[Hashable, int]]:
+        """Os `k` primeiros como (membro, pontos)."""
+        return [(member, -neg) for neg, member in self._order[:max(k, 0)]]
+
+    def rank(self, member: Hashable) -> Optional[int]:
+        """Posição (base 0) do membro, ou None se não estiver na classificação."""
+        points = self._scores.get(member)
+        if points is None:
+            return None
+        return bisect_left(self._order, (-points, member))
+
+    def around(self, member: Hashable, neighbours: int) -> Tuple[Optional[int], List[Tuple[Hashable, int]]]:
+        """
+        Posição (base 0) do membro e a janela com até `neighbours` vizinhos de cada lado.
+        A janela começa na posição `rank - min(rank, neighbours)`.
+        """
+        index = self.rank(member)
+        if index is None:
+            return None, []
+        start = max(index - neighbours, 0)
+        window = self._order[start:index + neighbours + 1]
+        return index, [(m, -neg) for neg, m in window]
@@ -0,0 +1,128 @@
+"""
+Cálculo nutricional vetorizado (NumPy) para vários animais e alimentos de uma vez.
+
+Mesmas regras do cálculo individual da dieta IA:
+- RER = 70 * peso^0.75; MER = RER * multiplicador da espécie (cão 1.6, demais 1.2)
+- Condição de peso pela faixa da raça: acima -> 0.85x, abaixo -> 1.15x
+- Objetivo reforça o ajuste: emagrecimento -> no máximo 0.80x, ganho/massa -> no mínimo 1.20x
+- Porção diária em gramas = calorias / (kcal_por_100g / 100); sem kcal_por_100g, usa kcal_por_kg / 10
+"""
+import warnings
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from .text_search import normalize_text
+
+MULTIPLICADOR_CAO = 1.6
+MULTIPLICADOR_OUTROS = 1.2
+AJUSTE_CONDICAO = {"acima": 0.85, "abaixo": 1.15}
+AJUSTE_EMAGRECIMENTO = 0.80
+AJUSTE_GANHO = 1.20
+
+# Códigos de condição de peso usados nos arrays
+CONDICOES = ("indefinido", "saudavel", "acima", "abaixo")
+_INDEFINIDO, _SAUDAVEL, _ACIMA, _ABAIXO = range(len(CONDICOES))
+
+
+def especie_canonica(value: Optional[str]) -> str:
+    """'cao', 'gato' ou o valor normalizado (ex.: 'ambos')."""
+    sp = normalize_text(value)
+    if sp.startswith(("dog", "cao", "cachorro", "canin")):
+        return "cao"
+    if sp.startswith(("cat", "gato", "felin")):
+        return "gato"
+    return sp
+
+
+def multiplicador_especie(species: Optional[str]) -> float:
+    return MULTIPLICADOR_CAO if especie_canonica(species) == "cao" else MULTIPLICADOR_OUTROS
+
+
+def direcao_objetivo(objetivo: Optional[str]) -> int:
+    """-1 para emagrecimento, 1 para ganho de peso/massa, 0 caso contrário."""
+    obj = (objetivo or "").lower()
+    if "emagrec" in obj:
+        return -1
+    if "ganho" in obj or "massa" in obj:
+        return 1
+    return 0
+
+
+def classificar_condicoes(pesos: np.ndarray, peso_min: np.ndarray, peso_max: np.ndarray) -> np.ndarray:
+    """Códigos de condição (índices de CONDICOES); NaN em peso ou faixa -> indefinido."""
+    with np.errstate(invalid="ignore"):
+        definido = (pesos > 0) & ~np.isnan(peso_min) & ~np.isnan(peso_max)
+        condicoes = np.full(pesos.shape, _SAUDAVEL, dtype=np.int8)
+        condicoes[pesos > peso_max] = _ACIMA
+        condicoes[pesos < peso_min] = _ABAIXO
+    condicoes[~definido] = _INDEFINIDO
+    return condicoes
+
+
+def calorias_diarias(
+    pesos: np.ndarray,
+    multiplicadores: np.ndarray,
+    condicoes: np.ndarray,
+    direcoes: np.ndarray,
+) -> np.ndarray:
+    """Calorias diárias (kcal, truncadas como no cálculo individual); NaN sem peso válido."""
+    with np.errstate(invalid="ignore"):
+        rer = np.where(pesos > 0, 70.0 * np.power(np.where(pesos > 0, pesos, 1.0), 0.75), np.nan)
+    ajuste = np.ones(pesos.shape)
+    ajuste[condicoes == _ACIMA] = AJUSTE_CONDICAO["acima"]
+    ajuste[condicoes == _ABAIXO] = AJUSTE_CONDICAO["abaixo"]
+    ajuste = np.where(direcoes < 0, np.minimum(ajuste, AJUSTE_EMAGRECIMENTO), ajuste)
+    ajuste = np.where(direcoes > 0, np.maximum(ajuste, AJUSTE_GANHO), ajuste)
+    return np.trunc(rer * multiplicadores * ajuste)
+
+
+def compatibilidade(especies_animais: Sequence[str], especies_alimentos: Sequence[str]) -> np.ndarray:
+    """Matriz booleana animal x alimento: mesma espécie canônica ou alimento para 'ambos'."""
+    animais = np.array([especie_canonica(s) for s in especies_animais], dtype=object)
+    alimentos = np.array([especie_canonica(s) for s in especies_alimentos], dtype=object)
+    return (animais[:, None] == alimentos[None, :]) | (alimentos[None, :] == "ambos")
+
+
+def densidade_kcal_100g(kcal_por_100g: np.ndarray, kcal_por_kg: np.ndarray) -> np.ndarray:
+    """kcal/100g de cada alimento; onde kcal_por_100g falta, derivado de kcal_por_kg / 10."""
+    return np.where(np.isnan(kcal_por_100g), kcal_por_kg / 10.0, kcal_por_100g)
+
+
+def porcoes_gramas(calorias: np.ndarray, kcal_por_100g: np.ndarray, compativel: np.ndarray) -> np.ndarray:
+    """Matriz animal x alimento de gramas/dia; NaN onde incompatível ou sem dados."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gramas = np.round(calorias[:, None] / (kcal_por_100g[None, :] / 100.0))
+    valido = compativel & (kcal_por_100g[None, :] > 0) & ~np.isnan(calorias)[:, None]
+    return np.where(valido, gramas, np.nan)
+
+
+def melhor_alimento(kcal_por_100g: np.ndarray, compativel: np.ndarray, condicoes: np.ndarray) -> np.ndarray:
+    """
+    Índice do alimento mais adequado por animal (-1 se nenhum), pela densidade calórica:
+    acima do peso -> menor kcal/100g, abaixo -> maior, demais -> mais próximo da mediana.
+    """
+    kcal = np.where(compativel & (kcal_por_100g[None, :] > 0), kcal_por_100g[None, :], np.nan)
+    if kcal.shape[1] == 0:
+        # Nenhum alimento elegível: nanmin/nanmax não aceitam eixo vazio
+        return np.full(kcal.shape[0], -1, dtype=int)
+    tem_opcao = ~np.all(np.isnan(kcal), axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        alvo = np.nanmedian(kcal, axis=1)
+        alvo = np.where(condicoes == _ACIMA, np.nanmin(kcal, axis=1), alvo)
+        alvo = np.where(condicoes == _ABAIXO, np.nanmax(kcal, axis=1), alvo)
+    distancia = np.where(np.isnan(kcal), np.inf, np.abs(kcal - alvo[:, None]))
+    escolhido = np.argmin(distancia, axis=1)
+    return np.where(tem_opcao, escolhido, -1)
+
+
+def to_float_array(values: Iterable) -> np.ndarray:
+    """Converte valores opcionais (None/str/num) em float64, com NaN para ausentes ou inválidos."""
+    out = []
+    for value in values:
+        try:
+            out.append(float(value) if value is not None else np.nan)
+        except (TypeError, ValueError):
+            out.append(np.nan)
+    return np.array(out, dtype=float)
@@ -0,0 +1,164 @@
+from bisect import bisect_left, insort
+from datetime import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import APPOINTMENT_DEFAULT_DURATION_MINUTES
+
+# Status que ocupam a agenda (pendentes/cancelados/concluídos não bloqueiam horários)
+BLOCKING_STATUSES = ("scheduled", "confirmed")
+
+_DAY_SECONDS = 24 * 60 * 60
+
+
+def parse_time(value: Any) -> Optional[time]:
+    """Aceita time ou string ISO ('HH:MM', 'HH:MM:SS[.ffffff]'); None se ausente/inválido."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, time):
+        return value
+    try:
+        return time.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def to_seconds(value: time) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def interval_seconds(start: Any, end: Any = None) -> Optional[Tuple[int, int]]:
+    """
+    Intervalo semiaberto [início, fim) em segundos do dia.
+    Sem término (ou término não posterior ao início), usa APPOINTMENT_DEFAULT_DURATION_MINUTES,
+    a mesma regra da exclusion constraint de appointments no banco.
+    """
+    start_t = parse_time(start)
+    if start_t is None:
+        return None
+    start_s = to_seconds(start_t)
+    end_t = parse_time(end)
+    end_s = to_seconds(end_t) if end_t is not None else None
+    if end_s is None or end_s <= start_s:
+        end_s = start_s + APPOINTMENT_DEFAULT_DURATION_MINUTES * 60
+    return start_s, end_s
+
+
+class ScheduleIndex:
+    """
+    Índice de intervalos de um dia da agenda de uma clínica.
+
+    Intervalos ordenados por início, com o maior término acumulado (prefix max):
+    a verificação de conflito é uma busca binária mais, em agendas sem sobreposição,
+    O(1) passos para trás, e continua correta se o histórico tiver sobreposições.
+    """
+
+    def __init__(self, appointments: Iterable[Dict[str, Any]] = ()):
+        self._items: List[Tuple[int, int, str]] = []
+        self._starts: List[int] = []
+        self._max_end: List[int] = []
+        for appointment in appointments:
+            self.add(appointment.get("id"), appointment.get("start_time"), appointment.get("end_time"), _rebuild=False)
+        self._rebuild()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _rebuild(self) -> None:
+        self._items.sort()
+        self._starts = [start for start, _end, _id in self._items]
+        self._max_end = []
+        running = -1
+        for _start, end, _id in self._items:
+            running = max(running, end)
+            self._max_end.append(running)
+
+    def add(self, appointment_id: Any, start: Any, end: Any = None, _rebuild: bool = True) -> None:
+        interval = interval_seconds(start, end)
+        if interval is None:
+            return
+        item = (interval[0], interval[1], str(appointment_id))
+        if _rebuild:
+            insort(self._items, item)
+            self._rebuild()
+        else:
+            self._items.append(item)
+
+    def remove(self, appointment_id: Any) -> None:
+        appointment_id = str(appointment_id)
+        self._items = [item for item in self._items if item[2] != appointment_id]
+        self._rebuild()
+
+    def find_conflict(self, start: Any, end: Any = None, exclude_id: Any = None) -> Optional[Dict[str, Any]]:
+        """Primeiro agendamento que se sobrepõe a [start, end), ignorando `exclude_id`."""
+        interval = interval_seconds(start, end)
+        if interval is None:
+            return None
+        new_start, new_end = interval
+        exclude_id = str(exclude_id) if exclude_id is not None else None
+
+        # Candidatos: começam antes do fim do novo intervalo; retrocede enquanto algum término passa do início
+        i = bisect_left(self._starts, new_end) - 1
+        while i >= 0 and self._max_end[i] > new_start:
+            start_s, end_s, appointment_id = self._items[i]
+            if end_s > new_start and appointment_id != exclude_id:
+                return {
+                    "id": appointment_id,
+                    "start_time": _format(start_s),
+                    "end_time": _format(end_s),
+                }
+            i -= 1
+        return None
+
+
+def _format(seconds: int) -> str:
+    seconds = min(seconds, _DAY_SECONDS - 1)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def merge_intervals(intervals: Iterable[Tuple[int, int]], buffer_seconds: int = 0) -> List[Tuple[int, int]]:
+    """Ordena e mescla intervalos ocupados, expandidos por `buffer_seconds` de cada lado."""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted((s - buffer_seconds, e + buffer_seconds) for s, e in intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slots(
+    busy: List[Tuple[int, int]],
+    open_seconds: int,
+    close_seconds: int,
+    slot_seconds: int,
+    step_seconds: Optional[int] = None,
+    not_before: Optional[int] = None,
+) -> List[Tuple[int, int]]:
+    """
+    Horários livres de `slot_seconds` dentro do expediente, em uma varredura sobre os
+    intervalos ocupados já mesclados (`merge_intervals`). Os inícios seguem a grade
+    `open_seconds + k * step_seconds` (padrão: a própria duração).
+    """
+    step = step_seconds or slot_seconds
+    slots: List[Tuple[int, int]] = []
+    start = open_seconds
+    if not_before is not None and not_before > start:
+        # Próximo ponto da grade a partir de `not_before`
+        start += -(-(not_before - start) // step) * step
+    i = 0
+    while start + slot_seconds <= close_seconds:
+        end = start + slot_seconds
+        # Avança sobre ocupados que terminam antes do início do slot
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        if i < len(busy) and busy[i][0] < end:
+            # Slot sobreposto: pular para o primeiro ponto da grade após o fim do ocupado
+            start += max(1, -(-(busy[i][1] - start) // step)) * step
+            continue
+        slots.append((start, end))
+        start += step
+    return slots
+
+
+def format_seconds(seconds: int) -> str:
+    return _format(seconds)
@@ -0,0 +1,126 @@
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+# Similaridade mínima (coeficiente de Dice sobre trigramas) para aceitar um termo com erro de digitação
+MIN_SIMILARITY = 0.4
+# Peso de um termo do documento que apenas começa com o termo buscado (autocomplete)
+PREFIX_WEIGHT = 0.85
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados ("Ração  Úmida" -> "racao umida")."""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(value))
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(without_accents.casefold().split())
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """Termos normalizados, separando por qualquer caractere não alfanumérico."""
+    normalized = normalize_text(value)
+    return "".join(c if c.isalnum() else " " for c in normalized).split()
+
+
+def trigrams(token: str) -> Set[str]:
+    """Trigramas no estilo pg_trgm (dois espaços no início, um no fim)."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TextSearchIndex:
+    """
+    Índice de busca textual em memória sobre campos ponderados (ex.: nome, marca, linha).
+
+    Cada termo buscado casa com os termos do documento por igualdade (1.0), por
+    prefixo (autocomplete, PREFIX_WEIGHT) ou por similaridade de trigramas
+    (tolerância a erros de digitação, >= MIN_SIMILARITY). Todos os termos da busca
+    precisam casar; o score do documento é a média dos melhores casamentos,
+    multiplicados pelo peso do campo.
+    """
+
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = dict(weights)
+        # termo -> {doc_id: maior peso de campo em que o termo aparece}
+        self._postings: Dict[str, Dict[Hashable, float]] = {}
+        # trigrama -> termos do vocabulário que o contêm
+        self._trigram_terms: Dict[str, Set[str]] = {}
+        self._term_trigrams: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def build(self, docs: Dict[Hashable, Dict[str, Optional[str]]]) -> None:
+        """(Re)constrói o índice a partir de {doc_id: {campo: texto}}."""
+        postings: Dict[str, Dict[Hashable, float]] = defaultdict(dict)
+        for doc_id, fields in docs.items():
+            for field, weight in self.weights.items():
+                for term in tokenize(fields.get(field)):
+                    if postings[term].get(doc_id, 0.0) < weight:
+                        postings[term][doc_id] = weight
+
+        trigram_terms: Dict[str, Set[str]] = defaultdict(set)
+        term_trigrams: Dict[str, Set[str]] = {}
+        for term in postings:
+            grams = trigrams(term)
+            term_trigrams[term] = grams
+            for gram in grams:
+                trigram_terms[gram].add(term)
+
+        self._postings = dict(postings)
+        self._trigram_terms = dict(trigram_terms)
+        self._term_trigrams = term_trigrams
+        self._vocabulary = sorted(postings)
+        self._size = len(docs)
+
+    def _matching_terms(self, query_term: str) -> Dict[str, float]:
+        """Termos do vocabulário que casam com `query_term`, com a qualidade do casamento."""
+        matches: Dict[str, float] = {}
+
+        # Prefixo (inclui o termo exato) via busca binária no vocabulário ordenado
+        i = bisect_left(self._vocabulary, query_term)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(query_term):
+            term = self._vocabulary[i]
+            matches[term] = 1.0 if term == query_term else PREFIX_WEIGHT
+            i += 1
+
+        # Similaridade de trigramas (erros de digitação); termos muito curtos ficam só no prefixo
+        if len(query_term) >= 3:
+            query_grams = trigrams(query_term)
+            shared: Dict[str, int] = defaultdict(int)
+            for gram in query_grams:
+                for term in self._trigram_terms.get(gram, ()):
+                    shared[term] += 1
+            for term, count in shared.items():
+                similarity = 2.0 * count / (len(query_grams) + len(self._term_trigrams[term]))
+                if similarity >= MIN_SIMILARITY and similarity * PREFIX_WEIGHT > matches.get(term, 0.0):
+                    matches[term] = similarity * PREFIX_WEIGHT
+        return matches
+
+    def search(self, query: str) -> List[Tuple[Hashable, float]]:
+        """Documentos que casam com todos os termos de `query`, do maior para o menor score."""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return []
+
+        scores: Optional[Dict[Hashable, float]] = None
+        for query_term in query_terms:
+            best: Dict[Hashable, float] = {}
+            for term, quality in self._matching_terms(query_term).items():
+                for doc_id, weight in self._postings[term].items():
+                    score = quality * weight
+                    if score > best.get(doc_id, 0.0):
+                        best[doc_id] = score
+            if scores is None:
+                scores = best
+            else:
+                scores = {doc_id: scores[doc_id] + score for doc_id, score in best.items() if doc_id in scores}
+            if not scores:
+                return []
+
+        n = len(query_terms)
+        return sorted(((doc_id, round(score / n, 4)) for doc_id, score in scores.items()), key=lambda item: -item[1])
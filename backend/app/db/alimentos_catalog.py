@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .supabase import supabase_admin
+from ..core.config import ALIMENTOS_CATALOG_TTL
+from ..core.text_search import TextSearchIndex, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Tamanho da página ao carregar o catálogo (limite padrão de linhas do PostgREST)
+_PAGE_SIZE = 1000
+
+# Pesos dos campos na busca textual
+SEARCH_WEIGHTS = {"nome": 1.0, "marca": 0.7, "linha": 0.6}
+
+# Intervalo mínimo (segundos) entre tentativas de recarga após uma falha
+_RELOAD_RETRY_INTERVAL = 30.0
+
+
+def _ci(value: Any) -> Optional[str]:
+    """Chave de tipo/especie_destino (CITEXT no banco): sem distinção de caixa; vazio vale None."""
+    if value is None or value == "":
+        return None
+    return str(value).casefold()
+
+
+class AlimentosCatalog:
+    """
+    Catálogo de alimentos_base em memória (por processo), com índices secundários.
+
+    Carregado no startup (lifespan), recarregado após ALIMENTOS_CATALOG_TTL segundos
+    e atualizado no lugar pelas rotas de escrita de /alimentos-base.
+    Quando nunca pôde ser carregado, `ensure_loaded()` retorna False e as rotas
+    consultam o PostgREST diretamente.
+    """
+
+    def __init__(self, ttl: float = ALIMENTOS_CATALOG_TTL):
+        self.ttl = ttl
+        self.loaded_at: Optional[float] = None
+        self._retry_at: Optional[float] = None
+        self._rows: List[Dict[str, Any]] = []
+        self._by_alimento_id: Dict[int, Dict[str, Any]] = {}
+        self._by_row_id: Dict[str, Dict[str, Any]] = {}
+        self._by_tipo: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_especie: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_nome: Dict[str, List[Dict[str, Any]]] = {}
+        self._tipo_labels: Dict[str, str] = {}
+        self._especie_labels: Dict[str, str] = {}
+        self._search_index = TextSearchIndex(SEARCH_WEIGHTS)
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # --- Carga e atualização ---
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _index(self, rows: List[Dict[str, Any]]) -> None:
+        rows = sorted(rows, key=lambda r: r.get("nome") or "")
+        by_alimento_id, by_row_id = {}, {}
+        by_tipo, by_especie, by_nome = defaultdict(list), defaultdict(list), defaultdict(list)
+        tipo_labels, especie_labels = {}, {}
+        for row in rows:
+            if row.get("alimento_id") is not None:
+                by_alimento_id[int(row["alimento_id"])] = row
+            if row.get("id") is not None:
+                by_row_id[str(row["id"])] = row
+            tipo, especie = _ci(row.get("tipo")), _ci(row.get("especie_destino"))
+            by_tipo[tipo].append(row)
+            by_especie[especie].append(row)
+            if tipo is not None:
+                tipo_labels.setdefault(tipo, row["tipo"])
+            if especie is not None:
+                especie_labels.setdefault(especie, row["especie_destino"])
+            by_nome[normalize_text(row.get("nome"))].append(row)
+        self._rows = rows
+        self._by_alimento_id = by_alimento_id
+        self._by_row_id = by_row_id
+        self._by_tipo = dict(by_tipo)
+        self._by_especie = dict(by_especie)
+        self._by_nome = dict(by_nome)
+        self._tipo_labels = tipo_labels
+        self._especie_labels = especie_labels
+        # Documentos da busca textual chaveados pela posição em _rows
+        self._search_index.build({i: row for i, row in enumerate(rows)})
+
+    async def load(self) -> bool:
+        """Carrega o catálogo completo; em falha mantém os dados anteriores."""
+        rows: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            response = await supabase_admin._request(
+                "GET",
+                f"/rest/v1/alimentos_base?select=*&order=nome.asc&limit={_PAGE_SIZE}&offset={offset}"
+            )
+            if "error" in response:
+                logger.warning(f"Falha ao carregar catálogo de alimentos_base: {response['error']}")
+                return False
+            page = supabase_admin.process_response(response) or []
+            rows.extend(page)
+            if len(page) < _PAGE_SIZE:
+                break
+            offset += _PAGE_SIZE
+
+        self._index(rows)
+        self.loaded_at = time.monotonic()
+        logger.info(f"Catálogo de alimentos_base carregado: {len(rows)} itens")
+        return True
+
+    def _fresh(self) -> bool:
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.loaded_at < self.ttl:
+            return True
+        # Recarga falhou há pouco: não tenta de novo antes de _RELOAD_RETRY_INTERVAL
+        return self._retry_at is not None and now < self._retry_at
+
+    async def ensure_loaded(self) -> bool:
+        """
+        Garante um catálogo carregado e dentro do TTL (recarga única sob concorrência).
+        Após uma falha, novas tentativas esperam _RELOAD_RETRY_INTERVAL segundos.
+        """
+        if self._fresh():
+            return self.loaded_at is not None
+        async with self._get_lock():
+            if self._fresh():
+                return self.loaded_at is not None
+            loaded = await self.load()
+            self._retry_at = None if loaded else time.monotonic() + _RELOAD_RETRY_INTERVAL
+        # Dados expirados ainda servem se a recarga falhar
+        return loaded or self.loaded_at is not None
+
+    def upsert(self, row: Optional[Dict[str, Any]]) -> None:
+        """Aplica um item criado/atualizado ao catálogo carregado."""
+        if not row or self.loaded_at is None:
+            return
+        rows = [
+            r for r in self._rows
+            if not (
+                (row.get("alimento_id") is not None and r.get("alimento_id") == row.get("alimento_id"))
+                or (row.get("id") is not None and r.get("id") == row.get("id"))
+            )
+        ]
+        rows.append(row)
+        self._index(rows)
+
+    def remove(self, alimento_id: int) -> None:
+        if self.loaded_at is None:
+            return
+        self._index([r for r in self._rows if r.get("alimento_id") != alimento_id])
+
+    # --- Leituras ---
+
+    def get(self, alimento_id: Any) -> Optional[Dict[str, Any]]:
+        """Busca por alimento_id (inteiro) ou, como alternativa, pela coluna id."""
+        try:
+            row = self._by_alimento_id.get(int(alimento_id))
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            row = self._by_row_id.get(str(alimento_id))
+        return dict(row) if row else None
+
+    def nome(self, alimento_id: Any) -> Optional[str]:
+        row = self.get(alimento_id) if alimento_id else None
+        return row.get("nome") if row else None
+
+    def find_by_nome(self, nome: str) -> List[Dict[str, Any]]:
+        """Itens cujo nome normalizado é exatamente igual ao informado."""
+        return [dict(r) for r in self._by_nome.get(normalize_text(nome), [])]
+
+    def filter(self, nome: Optional[str] = None, tipo: Optional[str] = None, especie_destino: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Equivalente em memória de nome=ilike.%nome%, tipo=eq, especie_destino=eq, ordenado por nome.
+        tipo e especie_destino são CITEXT: comparados sem distinção de caixa; vazio não filtra.
+        """
+        tipo, especie_destino = _ci(tipo), _ci(especie_destino)
+        if tipo is not None and especie_destino is not None:
+            smaller = min(self._by_tipo.get(tipo, []), self._by_especie.get(especie_destino, []), key=len)
+            candidates = [r for r in smaller if _ci(r.get("tipo")) == tipo and _ci(r.get("especie_destino")) == especie_destino]
+        elif tipo is not None:
+            candidates = self._by_tipo.get(tipo, [])
+        elif especie_destino is not None:
+            candidates = self._by_especie.get(especie_destino, [])
+        else:
+            candidates = self._rows
+        if nome:
+            needle = str(nome).casefold()
+            candidates = [r for r in candidates if needle in (r.get("nome") or "").casefold()]
+        return [dict(r) for r in candidates]
+
+    def search(
+        self,
+        query: str,
+        tipo: Optional[str] = None,
+        especie_destino: Optional[str] = None,
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """Busca aproximada (sem acentos, com prefixo e erros de digitação) em nome, marca e linha."""
+        tipo, especie_destino = _ci(tipo), _ci(especie_destino)
+        results = []
+        for position, score in self._search_index.search(query):
+            row = self._rows[position]
+            if tipo is not None and _ci(row.get("tipo")) != tipo:
+                continue
+            if especie_destino is not None and _ci(row.get("especie_destino")) != especie_destino:
+                continue
+            results.append((row, score))
+        # Empates ordenados por nome, como na listagem
+        results.sort(key=lambda item: (-item[1], item[0].get("nome") or ""))
+        return [(dict(row), score) for row, score in results]
+
+    def tipos(self) -> List[str]:
+        return sorted(self._tipo_labels.values())
+
+    def especies(self) -> List[str]:
+        return sorted(self._especie_labels.values())
+
+    def stats(self) -> Dict[str, Any]:
+        age = time.monotonic() - self.loaded_at if self.loaded_at is not None else None
+        return {
+            "name": "alimentos_catalog",
+            "size": len(self._rows),
+            "loaded": self.loaded_at is not None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "ttl": self.ttl,
+        }
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+alimentos_catalog = AlimentosCatalog()
+
+
+async def get_alimento_nomes(alimento_ids: Iterable[Any]) -> Dict[str, Optional[str]]:
+    """
+    Nomes de alimentos_base para vários ids de uma vez, chaveados por str(id).
+
+    Usa o catálogo em memória; sem ele, no máximo duas consultas em lote
+    (por alimento_id e, para os que faltarem, pela coluna id).
+    """
+    ids = list(dict.fromkeys(str(a) for a in alimento_ids if a))
+    if not ids:
+        return {}
+    if await alimentos_catalog.ensure_loaded():
+        return {a: alimentos_catalog.nome(a) for a in ids}
+
+    nomes: Dict[str, Optional[str]] = {a: None for a in ids}
+    try:
+        numeric = [a for a in ids if a.lstrip("-").isdigit()]
+        if numeric:
+            resp = await supabase_admin._request(
+                "GET",
+                f"/rest/v1/alimentos_base?alimento_id=in.({','.join(numeric)})&select=alimento_id,nome"
+            )
+            for row in supabase_admin.process_response(resp) or []:
+                nomes[str(row.get("alimento_id"))] = row.get("nome")
+
+        # Fallback: ids não resolvidos por alimento_id podem ser da coluna id
+        missing = [a for a in ids if nomes[a] is None]
+        if missing:
+            resp = await supabase_admin._request(
+                "GET",
+                f"/rest/v1/alimentos_base?id=in.({','.join(missing)})&select=id,nome"
+            )
+            for row in supabase_admin.process_response(resp) or []:
+                if str(row.get("id")) in nomes:
+                    nomes[str(row.get("id"))] = row.get("nome")
+    except Exception as e:
+        logger.warning(f"Falha ao buscar nomes de alimentos_base: {str(e)}")
+    return nomes
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .supabase import supabase_admin
+from ..core.config import RACAS_INDEX_TTL
+from ..core.nutrition import especie_canonica
+from ..core.text_search import TextSearchIndex, normalize_text
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = 1000
+_SELECT = "id,especie_id,nome,nome_popular,nome_oficial,peso_min_kg,peso_max_kg"
+_NAME_COLUMNS = ("nome", "nome_popular", "nome_oficial")
+
+# Intervalo mínimo (segundos) entre tentativas de recarga após uma falha
+_RELOAD_RETRY_INTERVAL = 30.0
+
+# Apelidos comuns em PT-BR que não aparecem nas colunas de nome
+ALIASES = {
+    "pastor alemao": "german shepherd dog",
+    "lulu da pomerania": "pomeranian",
+    "salsicha": "dachshund",
+    "golden": "golden retriever",
+    "labrador": "labrador retriever",
+    "york": "yorkshire terrier",
+    "dobermann": "doberman pinscher",
+}
+
+
+def _name_variants(value: Optional[str]) -> List[str]:
+    """Nome normalizado, sem o trecho entre parênteses e o próprio trecho ("Spitz (Pomerânia)")."""
+    name = normalize_text(value)
+    if not name:
+        return []
+    variants = [name]
+    outside = normalize_text(re.sub(r"\(.*?\)", " ", name))
+    if outside and outside != name:
+        variants.append(outside)
+    variants.extend(normalize_text(inner) for inner in re.findall(r"\((.*?)\)", name) if inner.strip())
+    return variants
+
+
+class RacasIndex:
+    """
+    Índice em memória da tabela 'racas' (por processo), particionado por espécie.
+
+    Cada raça é indexada pelos nomes normalizados (nome, nome_popular, nome_oficial,
+    trechos entre parênteses e ALIASES), com busca exata (dict), por prefixo (lista
+    ordenada + bisect) e aproximada (TextSearchIndex, tolerante a erros de digitação).
+    Recarregado após RACAS_INDEX_TTL segundos; sem carga, `ensure_loaded()` retorna False.
+    """
+
+    def __init__(self, ttl: float = RACAS_INDEX_TTL):
+        self.ttl = ttl
+        self.loaded_at: Optional[float] = None
+        self._retry_at: Optional[float] = None
+        self._rows: List[Dict[str, Any]] = []
+        self._species: List[str] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._names: List[Tuple[str, int]] = []
+        self._by_species: Dict[str, List[int]] = {}
+        self._search_index = TextSearchIndex({"nomes": 1.0})
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # --- Carga ---
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _index(self, rows: List[Dict[str, Any]]) -> None:
+        species = [especie_canonica((r.get("especies") or {}).get("nome_comum")) for r in rows]
+        names_by_row: List[List[str]] = []
+        for row in rows:
+            names: List[str] = []
+            for column in _NAME_COLUMNS:
+                names.extend(_name_variants(row.get(column)))
+            names_by_row.append(list(dict.fromkeys(names)))
+
+        # Apelidos apontam para as raças cujo nome já normalizado é o destino
+        by_name: Dict[str, List[int]] = defaultdict(list)
+        for i, names in enumerate(names_by_row):
+            for name in names:
+                by_name[name].append(i)
+        for alias, target in ALIASES.items():
+            for i in by_name.get(target, []):
+                if alias not in names_by_row[i]:
+                    names_by_row[i].append(alias)
+
+        exact: Dict[str, List[int]] = defaultdict(list)
+        by_species: Dict[str, List[int]] = defaultdict(list)
+        for i, names in enumerate(names_by_row):
+            for name in names:
+                exact[name].append(i)
+            by_species[species[i]].append(i)
+
+        self._rows = rows
+        self._species = species
+        self._exact = dict(exact)
+        self._names = sorted((name, i) for i, names in enumerate(names_by_row) for name in names)
+        self._by_species = dict(by_species)
+        self._search_index.build({i: {"nomes": " ".join(names)} for i, names in enumerate(names_by_row)})
+
+    async def _fetch(self, select: str) -> Optional[List[Dict[str, Any]]]:
+        rows: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            response = await supabase_admin._request(
+                "GET", f"/rest/v1/racas?select={select}&order=id.asc&limit={_PAGE_SIZE}&offset={offset}"
+            )
+            if "error" in response:
+                logger.warning(f"Falha ao carregar índice de raças: {response['error']}")
+                return None
+            page = supabase_admin.process_response(response) or []
+            rows.extend(page)
+            if len(page) < _PAGE_SIZE:
+                return rows
+            offset += _PAGE_SIZE
+
+    async def load(self) -> bool:
+        """Carrega todas as raças (com a espécie embutida); em falha mantém os dados anteriores."""
+        rows = await self._fetch(f"{_SELECT},especies(nome_comum)")
+        if rows is None:
+            # Sem relacionamento com 'especies': indexar sem partição por espécie
+            rows = await self._fetch(_SELECT)
+        if rows is None:
+            return False
+        self._index(rows)
+        self.loaded_at = time.monotonic()
+        logger.info(f"Índice de raças carregado: {len(rows)} raças")
+        return True
+
+    def _fresh(self) -> bool:
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.loaded_at < self.ttl:
+            return True
+        # Recarga falhou há pouco: não tenta de novo antes de _RELOAD_RETRY_INTERVAL
+        return self._retry_at is not None and now < self._retry_at
+
+    async def ensure_loaded(self) -> bool:
+        """Índice carregado (dados expirados servem enquanto a recarga falha); False se nunca carregou."""
+        if self._fresh():
+            return self.loaded_at is not None
+        async with self._get_lock():
+            if self._fresh():
+                return self.loaded_at is not None
+            loaded = await self.load()
+            self._retry_at = None if loaded else time.monotonic() + _RELOAD_RETRY_INTERVAL
+        return loaded or self.loaded_at is not None
+
+    # --- Leituras ---
+
+    def _in_species(self, i: int, species: Optional[str]) -> bool:
+        # Raças sem espécie conhecida valem para qualquer espécie
+        return not species or not self._species[i] or self._species[i] == especie_canonica(species)
+
+    def _prefix(self, query: str) -> List[int]:
+        found: List[int] = []
+        j = bisect_left(self._names, (query, -1))
+        while j < len(self._names) and self._names[j][0].startswith(query):
+            found.append(self._names[j][1])
+            j += 1
+        return list(dict.fromkeys(found))
+
+    def search(self, query: str, species: Optional[str] = None) -> List[Tuple[Dict[str, Any], float, str]]:
+        """Raças que casam com `query`, da mais à menos relevante: (raça, score, tipo de casamento)."""
+        q = normalize_text(query)
+        if not q:
+            return []
+        results: Dict[int, Tuple[float, str]] = {}
+        for i in self._exact.get(q, []):
+            results[i] = (1.0, "exato")
+        for i in self._prefix(q):
+            results.setdefault(i, (0.9, "prefixo"))
+        for i, score in self._search_index.search(q):
+            if i not in results:
+                results[i] = (min(score, 0.85), "aproximado")
+
+        matches = [(i, score, kind) for i, (score, kind) in results.items() if self._in_species(i, species)]
+        matches.sort(key=lambda m: (-m[1], len(normalize_text(self._rows[m[0]].get("nome"))), m[0]))
+        return [(dict(self._rows[i]), score, kind) for i, score, kind in matches]
+
+    def lookup(self, breed: Optional[str], species: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Melhor raça para o nome informado. Entre as raças do melhor casamento exato (ou, sem
+        ele, por prefixo) prefere as que têm faixa de peso; nunca usa a faixa de um casamento
+        pior. Sem faixa no melhor casamento, devolve a raça assim mesmo (weight_range -> None).
+        """
+        results = self.search(breed or "", species)
+        if not results:
+            return None
+        best_kind = results[0][2]
+        if best_kind in ("exato", "prefixo"):
+            for raca, _score, kind in results:
+                if kind != best_kind:
+                    break
+                if raca.get("peso_min_kg") is not None and raca.get("peso_max_kg") is not None:
+                    return raca
+        return results[0][0]
+
+    def weight_range(self, breed: Optional[str], species: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Mesmo formato de _get_breed_weight_range: peso_min_kg, peso_max_kg e nome."""
+        raca = self.lookup(breed, species)
+        if not raca or raca.get("peso_min_kg") is None or raca.get("peso_max_kg") is None:
+            return None
+        return {
+            "peso_min_kg": float(raca["peso_min_kg"]),
+            "peso_max_kg": float(raca["peso_max_kg"]),
+            "nome": raca.get("nome") or raca.get("nome_popular") or raca.get("nome_oficial") or breed,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        age = time.monotonic() - self.loaded_at if self.loaded_at is not None else None
+        return {
+            "name": "racas_index",
+            "size": len(self._rows),
+            "loaded": self.loaded_at is not None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "ttl": self.ttl,
+            "especies": {sp or "indefinida": len(ids) for sp, ids in self._by_species.items()},
+        }
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+racas_index = RacasIndex()
@@ -1,8 +1,72 @@
 import os
+import asyncio
 import httpx
 import json
 from typing import Any, Dict, List, Optional
-from ..core.config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_SERVICE_KEY
+from ..core.config import (
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    SUPABASE_SERVICE_KEY,
+    SUPABASE_HTTP2,
+    SUPABASE_POOL_MAX_CONNECTIONS,
+    SUPABASE_POOL_MAX_KEEPALIVE,
+    SUPABASE_POOL_KEEPALIVE_EXPIRY,
+    SUPABASE_HTTP_TIMEOUT,
+)
+
+try:
+    import h2  # noqa: F401  (necessário para http2=True no httpx)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# Cliente HTTP de longa duração compartilhado por todas as instâncias de SupabaseClient.
+# Aberto/fechado pelo lifespan da aplicação (ver main.py); criado sob demanda
+# caso seja usado fora do ciclo de vida do FastAPI (scripts, testes).
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=SUPABASE_HTTP2 and _HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_POOL_KEEPALIVE_EXPIRY,
+        ),
+        timeout=SUPABASE_HTTP_TIMEOUT,
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Retorna o cliente HTTP compartilhado (pool de conexões keep-alive/HTTP2)."""
+    global _http_client, _http_client_loop
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    # Conexões do pool ficam presas ao event loop em que foram abertas
+    # (ex.: TestClient sem lifespan cria um loop por requisição)
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = _build_http_client()
+        _http_client_loop = loop
+    return _http_client
+
+
+async def open_http_client() -> httpx.AsyncClient:
+    """Inicializa o pool de conexões. Chamado no startup da aplicação."""
+    return get_http_client()
+
+
+async def close_http_client() -> None:
+    """Fecha o pool de conexões. Chamado no shutdown da aplicação."""
+    global _http_client, _http_client_loop
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    _http_client_loop = None
+
 
 class SupabaseClient:
     def __init__(self, url: str, key: str, service_key: Optional[str] = None):
@@ -40,31 +104,29 @@ class SupabaseClient:
             request_headers["Prefer"] = "return=representation"
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.request(
-                    method=method,
-                    url=url,
-                    json=json,
-                    params=params,
-                    headers=request_headers,
-                    timeout=30.0
-                )
-                
+            response = await get_http_client().request(
+                method=method,
+                url=url,
+                json=json,
+                params=params,
+                headers=request_headers,
+            )
+            
+            try:
+                response.raise_for_status()
+                return {"data": response.json()}
+            except httpx.HTTPStatusError as e:
+                error_detail = response.text
                 try:
-                    response.raise_for_status()
-                    return {"data": response.json()}
-                except httpx.HTTPStatusError as e:
-                    error_detail = response.text
-                    try:
-                        error_json = response.json()
-                        if 'error' in error_json:
-                            error_detail = error_json.get('error', {}).get('message', error_detail)
-                        elif 'msg' in error_json:
-                            error_detail = error_json['msg']
-                    except:
-                        pass
-                    
-                    return {"error": f"HTTP Error: {e.response.status_code} - {error_detail}"}
+                    error_json = response.json()
+                    if 'error' in error_json:
+                        error_detail = error_json.get('error', {}).get('message', error_detail)
+                    elif 'msg' in error_json:
+                        error_detail = error_json['msg']
+                except:
+                    pass
+                
+                return {"error": f"HTTP Error: {e.response.status_code} - {error_detail}"}
         except Exception as e:
             return {"error": f"Erro inesperado: {str(e)}"}
 
@@ -95,6 +157,19 @@ class SupabaseClient:
         else:
             return data
 
+    def is_missing_object(self, response):
+        """
+        Indica se o erro de _request é de função/tabela inexistente no banco (migração não
+        aplicada): HTTP 404, PGRST202/PGRST205 ou 42P01/42883 do Postgres. Erros transitórios
+        (timeout, rede, 5xx) retornam False.
+        """
+        error = str(response.get("error") or "") if isinstance(response, dict) else ""
+        if not error:
+            return False
+        return error.startswith("HTTP Error: 404") or any(
+            code in error for code in ("PGRST202", "PGRST205", "42P01", "42883")
+        )
+
     async def register_user(self, email, password, user_data=None):
         """
         Registra um novo usuário usando a API de autenticação do Supabase
@@ -121,17 +196,16 @@ class SupabaseClient:
             print(f"Registrando usuário com email: {email}")
             
             # Fazer a requisição POST para registro
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    headers=self.headers,
-                    json=data
-                )
-                response.raise_for_status()
-                
-                # Retornar os dados do usuário
-                user = response.json()
-                return user
+            response = await get_http_client().post(
+                url,
+                headers=self.headers,
+                json=data
+            )
+            response.raise_for_status()
+            
+            # Retornar os dados do usuário
+            user = response.json()
+            return user
                 
         except httpx.HTTPError as e:
             print(f"Erro ao registrar usuário: {str(e)}")
@@ -171,6 +245,43 @@ class SupabaseClient:
         result = await self._request("GET", f"/rest/v1/{table}", params=params)
         return self.process_response(result)
 
+    async def count(self, table, filters=None, select="id"):
+        """
+        Conta registros no banco sem trafegar as linhas (HEAD + Prefer: count=exact).
+        
+        Args:
+            table (str): Nome da tabela
+            filters (dict ou lista de pares, opcional): Filtros PostgREST (ex.: {"clinic_id": "eq.1"});
+                a lista permite repetir a coluna (ex.: [("date", "gte.X"), ("date", "lte.Y")])
+            select (str): Colunas/embeds usados pelos filtros (ex.: "id,dietas!left(id)")
+            
+        Returns:
+            int: Total de registros
+            None: Se ocorrer um erro
+        """
+        params = [("select", select)]
+        if filters:
+            params += list(filters.items()) if isinstance(filters, dict) else list(filters)
+        headers = {**self.headers, "Prefer": "count=exact"}
+        try:
+            response = await get_http_client().head(
+                f"{self.url}/rest/v1/{table}", params=params, headers=headers
+            )
+            response.raise_for_status()
+            content_range = response.headers.get("content-range", "")
+            total = content_range.rsplit("/", 1)[-1]
+            return int(total) if total.isdigit() else None
+        except Exception as e:
+            print(f"Erro ao contar registros na tabela {table}: {str(e)}")
+            return None
+
+    async def rpc(self, function, params=None, headers=None):
+        """
+        Executa uma função Postgres exposta pelo PostgREST (/rest/v1/rpc/<função>).
+        Retorna o resultado bruto de _request ({"data": ...} ou {"error": ...}).
+        """
+        return await self._request("POST", f"/rest/v1/rpc/{function}", json=params or {}, headers=headers)
+
     async def get_by_eq(self, table, column, value, select="*"):
         params = {
             "select": select,
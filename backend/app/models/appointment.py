@@ -24,4 +24,19 @@ class AppointmentResponse(AppointmentBase):
     clinic_id: UUID4
     animal_id: UUID4
     created_at: Optional[datetime] = None
-    updated_at: Optional[datetime] = None 
\ No newline at end of file
+    updated_at: Optional[datetime] = None 
+
+class FreeSlot(BaseModel):
+    start_time: time
+    end_time: time
+
+class AvailabilityDay(BaseModel):
+    date: date
+    slots: List[FreeSlot]
+
+class AvailabilityResponse(BaseModel):
+    data_inicio: date
+    data_fim: date
+    duracao_minutos: int
+    total_slots: int
+    dias: List[AvailabilityDay]
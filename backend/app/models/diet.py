@@ -18,6 +18,13 @@ class DietCreate(BaseModel):
     quantidade_gramas: Optional[int] = None
     horario: Optional[str] = None
 
+class DietAIBatchCreate(BaseModel):
+    """Modelo para criação de um lote de dietas geradas por IA"""
+    animal_ids: Optional[List[str]] = Field(None, description="IDs dos animais; se omitido, usa 'filtro'")
+    filtro: Optional[str] = Field(None, pattern="^(sem_dietas|todos)$", description="'sem_dietas' ou 'todos' os animais da clínica")
+    user_input: Optional[Dict[str, Any]] = Field(None, description="Mesma entrada aceita por POST /animals/{animal_id}/diets/ai")
+    usar_cache: bool = True
+
 class DietUpdate(BaseModel):
     """Modelo para atualização de dietas para pets"""
     nome: Optional[str] = None
@@ -182,3 +189,47 @@ class AlimentoBaseResponse(BaseModel):
     
     class Config:
         from_attributes = True  # Pydantic v2 - substitui orm_mode
+
+class AlimentoBaseSearchItem(AlimentoBaseResponse):
+    """Alimento base encontrado na busca textual, com a relevância do casamento"""
+    score: Optional[float] = None
+
+class AlimentoBaseSearchResponse(BaseModel):
+    """Página de resultados da busca de alimentos base"""
+    total: int
+    limit: int
+    offset: int
+    items: List[AlimentoBaseSearchItem]
+
+# Modelos para o cálculo nutricional da clínica
+class NutritionAnimal(BaseModel):
+    """Necessidade calórica calculada para um animal"""
+    animal_id: str
+    nome: Optional[str] = None
+    especie: Optional[str] = None
+    peso_kg: Optional[float] = None
+    condicao_peso: str
+    calorias_alvo: Optional[int] = None
+
+class NutritionBestFit(NutritionAnimal):
+    """Alimento mais adequado e porção diária para um animal"""
+    alimento_id: Optional[int] = None
+    alimento_nome: Optional[str] = None
+    kcal_por_100g: Optional[float] = None
+    quantidade_gramas: Optional[int] = None
+
+class NutritionFood(BaseModel):
+    """Alimento base considerado no cálculo"""
+    alimento_id: Optional[int] = None
+    nome: str
+    especie_destino: Optional[str] = None
+    kcal_por_100g: Optional[float] = None
+
+class NutritionAuditResponse(BaseModel):
+    """Resultado do cálculo nutricional da clínica (melhor alimento ou matriz de porções)"""
+    modo: str
+    animais: List[NutritionBestFit]
+    alimentos: Optional[List[NutritionFood]] = None
+    porcoes_gramas: Optional[List[List[Optional[int]]]] = Field(
+        None, description="Gramas/dia por animal (linhas) e alimento (colunas); null quando incompatível"
+    )
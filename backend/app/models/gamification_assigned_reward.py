@@ -24,6 +24,7 @@ class AssignedRewardCreate(BaseModel):
 class AssignedRewardResponse(AssignedRewardBase):
     id: UUID # ID do registro da atribuição (se for criada uma tabela)
     recompensa_nome: Optional[str] = Field(None, example="Desconto de 15% em banho", description="Nome da recompensa (populado no endpoint)")
+    pontos_disponiveis: Optional[int] = Field(None, example=350, description="Saldo do animal após o resgate (populado na atribuição)")
 
     class Config:
         orm_mode = True 
\ No newline at end of file
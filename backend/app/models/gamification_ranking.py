@@ -11,4 +11,12 @@ class RankingEntry(BaseModel):
     clinic_nome: Optional[str] = Field(None, example="Clínica VetExemplo")
 
 class RankingResponse(BaseModel):
-    ranking: List[RankingEntry] 
\ No newline at end of file
+    ranking: List[RankingEntry] 
+
+class AnimalRankResponse(BaseModel):
+    animal_id: UUID
+    periodo: str = Field(..., example="mensal")
+    posicao: int = Field(..., example=4)
+    pontos_totais: int = Field(..., example=320)
+    total_participantes: int = Field(..., example=42, description="Número de animais na classificação")
+    vizinhos: List[RankingEntry] = Field([], description="Animais imediatamente acima e abaixo, incluindo o próprio animal")
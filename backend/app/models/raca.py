@@ -0,0 +1,14 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class RacaSugestao(BaseModel):
+    """Modelo para sugestão de raça no autocomplete"""
+    id: Optional[int] = None
+    nome: str
+    nome_popular: Optional[str] = None
+    nome_oficial: Optional[str] = None
+    especie: Optional[str] = None
+    peso_min_kg: Optional[float] = None
+    peso_max_kg: Optional[float] = None
+    score: float = Field(..., description="Relevância do casamento (0 a 1)")
+    casamento: str = Field(..., description="'exato', 'prefixo' ou 'aproximado'")
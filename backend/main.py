@@ -1,14 +1,33 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import API_V1_STR
 from app.api import api_router
+from app.db.supabase import open_http_client, close_http_client
+from app.db.alimentos_catalog import alimentos_catalog
+from app.db.racas_index import racas_index
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abrir o pool de conexões HTTP com o Supabase no startup e fechá-lo no shutdown
+    await open_http_client()
+    # Catálogo de alimentos_base e índice de raças em memória (falha aqui não impede o startup)
+    await alimentos_catalog.load()
+    await racas_index.load()
+    try:
+        yield
+    finally:
+        await close_http_client()
+
 
 # Criar aplicação FastAPI
 app = FastAPI(
     title="VeTech API",
     description="API para o sistema VeTech para clínicas veterinárias",
+    lifespan=lifespan,
 )
 
 # Configurar CORS
@@ -18,6 +37,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 # Adicionar rotas da API
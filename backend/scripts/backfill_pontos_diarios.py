@@ -0,0 +1,35 @@
+"""
+Reconstrói os agregados diários de pontos de gamificação (gamificacao_pontos_diarios)
+a partir de gamificacao_pontuacoes.
+
+Uso (a partir de backend/):
+    python scripts/backfill_pontos_diarios.py              # todos os animais
+    python scripts/backfill_pontos_diarios.py <animal_id>  # apenas um animal
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.supabase import supabase_admin, close_http_client
+
+
+async def backfill(animal_id=None):
+    params = {"p_animal_id": animal_id} if animal_id else {}
+    try:
+        response = await supabase_admin.rpc("gamificacao_reconstruir_pontos_diarios", params)
+    finally:
+        await close_http_client()
+
+    if "error" in response:
+        print(f"❌ Erro ao reconstruir agregados diários: {response['error']}")
+        return 1
+
+    alvo = f"animal {animal_id}" if animal_id else "todos os animais"
+    print(f"✅ Agregados diários reconstruídos para {alvo}: {response.get('data')} buckets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(backfill(sys.argv[1] if len(sys.argv) > 1 else None)))
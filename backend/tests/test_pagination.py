@@ -0,0 +1,128 @@
+"""
+Testes offline da paginação por cursor (app/api/pagination.py): cursor, filtro "depois da
+chave" para o PostgREST e paginação em memória. Não precisam do servidor rodando.
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.api.pagination import Keyset, Page
+
+
+def test_order_nullslast_exceto_ultima_coluna():
+    keyset = Keyset("date.desc", "start_time.desc", "id.desc")
+    assert keyset.order == "date.desc.nullslast,start_time.desc.nullslast,id.desc"
+    assert Keyset("id").order == "id.asc"
+
+
+def test_keyset_sem_colunas():
+    with pytest.raises(ValueError):
+        Keyset()
+
+
+def test_cursor_ida_e_volta():
+    keyset = Keyset("nome.asc", "alimento_id.asc")
+    cursor = keyset.encode({"nome": "Ração, \"premium\" (adulto)", "alimento_id": 42})
+    assert "=" not in cursor
+    assert keyset.decode(cursor) == ["Ração, \"premium\" (adulto)", 42]
+    # Nulo nas colunas anteriores à última é aceito (nulos por último)
+    cursor = keyset.encode({"nome": None, "alimento_id": 7})
+    assert keyset.decode(cursor) == [None, 7]
+
+
+@pytest.mark.parametrize("cursor", ["", "nao-e-base64!", "WzFd", "W251bGwsbnVsbF0", "W1sxXSwyXQ"])
+def test_cursor_invalido(cursor):
+    # Lixo, número errado de colunas, última coluna nula e valores compostos
+    keyset = Keyset("nome.asc", "id.asc")
+    with pytest.raises(HTTPException) as exc:
+        keyset.decode(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_after_filter_uma_coluna():
+    asc, desc = Keyset("id.asc"), Keyset("id.desc")
+    assert asc.after_filter(asc.encode({"id": 10})) == ("and", "(id.gt.10)")
+    assert desc.after_filter(desc.encode({"id": "abc"})) == ("and", '(id.lt."abc")')
+
+
+def test_after_filter_desempate_e_nulos_por_ultimo():
+    keyset = Keyset("name.asc", "id.asc")
+    cursor = keyset.encode({"name": "Rex", "id": "u1"})
+    assert keyset.after_filter(cursor) == (
+        "or", '(name.gt."Rex",name.is.null,and(name.eq."Rex",id.gt."u1"))'
+    )
+    # Cursor já entre os nulos: só desempata pelas colunas seguintes
+    cursor = keyset.encode({"name": None, "id": "u1"})
+    assert keyset.after_filter(cursor) == ("and", '(and(name.is.null,id.gt."u1"))')
+
+
+def test_after_filter_escapa_aspas_e_barras():
+    keyset = Keyset("nome.asc", "id.asc")
+    cursor = keyset.encode({"nome": 'a"b\\c', "id": 1})
+    _op, expression = keyset.after_filter(cursor)
+    assert 'nome.gt."a\\"b\\\\c"' in expression
+
+
+ROWS = [
+    {"id": 1, "name": "Bob"},
+    {"id": 2, "name": None},
+    {"id": 3, "name": "Ana"},
+    {"id": 4, "name": "Bob"},
+    {"id": 5, "name": None},
+    {"id": 6, "name": "Ana"},
+    {"id": 7, "name": "Caio"},
+]
+
+
+def _all_pages(keyset, rows, limit):
+    items, cursor, pages = [], None, 0
+    while True:
+        page = keyset.paginate(rows, limit, cursor)
+        items.extend(page.items)
+        pages += 1
+        if not page.next_cursor:
+            return items, pages
+        cursor = page.next_cursor
+
+
+def test_paginate_ordem_empates_e_nulos():
+    keyset = Keyset("name.asc", "id.asc")
+    items, pages = _all_pages(keyset, ROWS, limit=2)
+    assert [r["id"] for r in items] == [3, 6, 1, 4, 7, 2, 5]
+    assert pages == 4
+
+
+def test_paginate_desc_mantem_nulos_por_ultimo():
+    keyset = Keyset("name.desc", "id.desc")
+    items, _pages = _all_pages(keyset, ROWS, limit=3)
+    assert [r["id"] for r in items] == [7, 4, 1, 6, 3, 5, 2]
+
+
+def test_paginate_pagina_exata_sem_cursor_seguinte():
+    keyset = Keyset("id.asc")
+    page = keyset.paginate(ROWS, len(ROWS))
+    assert page.next_cursor is None
+    assert len(page.items) == len(ROWS)
+
+
+def test_paginate_total():
+    keyset = Keyset("id.asc")
+    first = keyset.paginate(ROWS, 3, include_total=True)
+    assert first.total == len(ROWS)
+    assert keyset.paginate(ROWS, 3).total is None
+    second = keyset.paginate(ROWS, 3, first.next_cursor, include_total=True)
+    assert [r["id"] for r in second.items] == [4, 5, 6]
+    assert second.total == len(ROWS)
+
+
+def test_page_apply_headers():
+    class FakeResponse:
+        def __init__(self):
+            self.headers = {}
+
+    response = FakeResponse()
+    Page([{"id": 1}], next_cursor="abc", total=10).apply_headers(response)
+    assert response.headers == {"X-Next-Cursor": "abc", "X-Total-Count": "10"}
+
+    response = FakeResponse()
+    Page([]).apply_headers(response)
+    assert response.headers == {}
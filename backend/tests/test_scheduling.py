@@ -0,0 +1,114 @@
+"""
+Testes offline do motor de agenda (app/core/scheduling.py): intervalos, conflitos e horários livres.
+Não precisam do servidor rodando.
+"""
+from datetime import time
+
+from app.core.scheduling import (
+    APPOINTMENT_DEFAULT_DURATION_MINUTES,
+    ScheduleIndex,
+    free_slots,
+    interval_seconds,
+    merge_intervals,
+    parse_time,
+)
+
+H = 3600
+
+
+def test_parse_time():
+    assert parse_time("08:30") == time(8, 30)
+    assert parse_time("08:30:15.5") == time(8, 30, 15, 500000)
+    assert parse_time(time(9, 0)) == time(9, 0)
+    assert parse_time("") is None
+    assert parse_time(None) is None
+    assert parse_time("25:00") is None
+
+
+def test_interval_seconds_duracao_padrao():
+    padrao = APPOINTMENT_DEFAULT_DURATION_MINUTES * 60
+    assert interval_seconds("10:00", "10:30") == (10 * H, 10 * H + 1800)
+    # Sem término, ou término não posterior ao início: duração padrão
+    assert interval_seconds("10:00") == (10 * H, 10 * H + padrao)
+    assert interval_seconds("10:00", "10:00") == (10 * H, 10 * H + padrao)
+    assert interval_seconds("10:00", "09:00") == (10 * H, 10 * H + padrao)
+    assert interval_seconds(None, "10:00") is None
+
+
+def test_find_conflict_semiaberto():
+    index = ScheduleIndex([
+        {"id": "a", "start_time": "09:00", "end_time": "10:00"},
+        {"id": "b", "start_time": "11:00", "end_time": "12:00"},
+    ])
+    # Encostar no início ou no fim não é conflito ([início, fim))
+    assert index.find_conflict("10:00", "11:00") is None
+    assert index.find_conflict("08:00", "09:00") is None
+    assert index.find_conflict("09:30", "09:45")["id"] == "a"
+    assert index.find_conflict("10:30", "11:01")["id"] == "b"
+    conflito = index.find_conflict("08:00", "13:00")
+    assert conflito["id"] in ("a", "b")
+    assert index.find_conflict(None) is None
+
+
+def test_find_conflict_exclude_id():
+    index = ScheduleIndex([{"id": "a", "start_time": "09:00", "end_time": "10:00"}])
+    assert index.find_conflict("09:00", "10:00", exclude_id="a") is None
+    assert index.find_conflict("09:00", "10:00", exclude_id="x")["id"] == "a"
+
+
+def test_find_conflict_intervalo_longo_antes_de_curtos():
+    # O intervalo longo começa antes de outros que não o alcançam: o máximo acumulado o encontra
+    index = ScheduleIndex([
+        {"id": "longo", "start_time": "08:00", "end_time": "18:00"},
+        {"id": "curto", "start_time": "09:00", "end_time": "09:30"},
+    ])
+    assert index.find_conflict("12:00", "12:30")["id"] == "longo"
+    index.remove("longo")
+    assert index.find_conflict("12:00", "12:30") is None
+    assert len(index) == 1
+
+
+def test_add_e_remove():
+    index = ScheduleIndex()
+    assert index.find_conflict("09:00", "10:00") is None
+    index.add("a", "09:00", "10:00")
+    index.add("sem_inicio", None)
+    assert len(index) == 1
+    assert index.find_conflict("09:59", "10:30")["id"] == "a"
+    index.remove("a")
+    assert index.find_conflict("09:59", "10:30") is None
+
+
+def test_merge_intervals():
+    assert merge_intervals([]) == []
+    assert merge_intervals([(5, 8), (1, 3), (2, 4)]) == [(1, 4), (5, 8)]
+    # Intervalos encostados são mesclados
+    assert merge_intervals([(1, 3), (3, 5)]) == [(1, 5)]
+    # Folga aplicada dos dois lados antes de mesclar
+    assert merge_intervals([(10, 20), (25, 30)], buffer_seconds=3) == [(7, 33)]
+
+
+def test_free_slots_grade_e_ocupados():
+    ocupados = merge_intervals([(9 * H, 10 * H)])
+    slots = free_slots(ocupados, 8 * H, 12 * H, H)
+    assert slots == [(8 * H, 9 * H), (10 * H, 11 * H), (11 * H, 12 * H)]
+
+
+def test_free_slots_passo_e_ocupado_fora_da_grade():
+    ocupados = [(9 * H + 900, 9 * H + 2700)]  # 09:15-09:45
+    slots = free_slots(ocupados, 9 * H, 11 * H, 1800, step_seconds=900)
+    inicios = [inicio for inicio, _fim in slots]
+    # Nenhum slot de 30 min sobrepõe 09:15-09:45; o primeiro livre é 09:45
+    assert all(fim <= 9 * H + 900 or inicio >= 9 * H + 2700 for inicio, fim in slots)
+    assert inicios[0] == 9 * H + 2700
+    assert slots[-1] == (10 * H + 1800, 11 * H)
+
+
+def test_free_slots_not_before():
+    slots = free_slots([], 8 * H, 12 * H, H, not_before=9 * H + 1)
+    assert slots == [(10 * H, 11 * H), (11 * H, 12 * H)]
+
+
+def test_free_slots_sem_espaco():
+    assert free_slots([(8 * H, 12 * H)], 8 * H, 12 * H, H) == []
+    assert free_slots([], 8 * H, 8 * H + 1800, H) == []
@@ -1,9 +1,9 @@
-import api from './api';
+import api, { getAllPages } from './api';
 
 export const animalService = {
   // Operações básicas de animais
   async getAnimals() {
-    const response = await api.get('/animals');
+    const response = await getAllPages('/animals');
     return response.data;
   },
 
@@ -15,7 +15,7 @@ export const animalService = {
         config.headers = { Authorization: `Bearer ${clinicToken}` };
       }
     }
-    const response = await api.get('/animals', config);
+    const response = await getAllPages('/animals', config);
     return response.data;
   },
 
@@ -39,6 +39,23 @@ api.interceptors.request.use(
   }
 );
 
+// Listagens paginadas por cursor: segue o header X-Next-Cursor até a última página
+// e devolve a última resposta com todos os itens em `data`
+const PAGE_SIZE = 500;
+
+export async function getAllPages(url, config = {}) {
+  const items = [];
+  let cursor = null;
+  let response;
+  do {
+    const params = { ...(config.params || {}), limit: PAGE_SIZE, ...(cursor ? { cursor } : {}) };
+    response = await api.get(url, { ...config, params });
+    items.push(...(response.data || []));
+    cursor = response.headers['x-next-cursor'] || null;
+  } while (cursor);
+  return { ...response, data: items };
+}
+
 // Você pode adicionar interceptors aqui se precisar (ex: para refresh token)
 // api.interceptors.response.use(...);
 
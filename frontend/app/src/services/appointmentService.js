@@ -1,15 +1,14 @@
-import api from './api';
+import api, { getAllPages } from './api';
 
 const appointmentService = {
-  // Função para buscar todos os agendamentos, com filtro opcional por animal_id
+  // Função para buscar todos os agendamentos (todas as páginas), com filtro opcional por animal_id
   getAppointments: (animalId = null, status = null) => {
     const token = localStorage.getItem('token');
-    let url = '/appointments';
-    const params = [];
-    if (animalId) params.push(`animal_id=${animalId}`);
-    if (status) params.push(`status=${status}`);
-    if (params.length > 0) url += `?${params.join('&')}`;
-    return api.get(url, {
+    const params = {};
+    if (animalId) params.animal_id = animalId;
+    if (status) params.status = status;
+    return getAllPages('/appointments', {
+      params,
       headers: {
         Authorization: `Bearer ${token}`,
       },
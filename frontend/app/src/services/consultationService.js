@@ -1,15 +1,13 @@
-import api from './api';
+import api, { getAllPages } from './api';
 
 const consultationService = {
-  // Função para buscar todas as consultas, com filtro opcional por animal_id
+  // Função para buscar todas as consultas (todas as páginas), com filtro opcional por animal_id
   getConsultations: (animalId = null) => {
     const token = localStorage.getItem('userToken');
     console.log('ConsultationService: Token lido do localStorage para getConsultations:', token);
-    let url = '/consultations';
-    if (animalId) {
-      url += `?animal_id=${animalId}`;
-    }
-    return api.get(url, {
+    const params = animalId ? { animal_id: animalId } : {};
+    return getAllPages('/consultations', {
+      params,
       headers: {
         Authorization: `Bearer ${token}`,
       },
@@ -0,0 +1,92 @@
+-- Migração: Impedir agendamentos sobrepostos na mesma clínica
+-- Exclusion constraint sobre o intervalo [date + start_time, date + end_time) dos
+-- agendamentos que ocupam a agenda (status 'scheduled' ou 'confirmed'). Sem end_time
+-- (ou com end_time não posterior ao início) o agendamento ocupa 60 minutos, a mesma regra
+-- de APPOINTMENT_DEFAULT_DURATION_MINUTES no backend (alterar os dois juntos). Inserções/atualizações concorrentes
+-- que se sobreporiam falham com 23P01 (HTTP 409 no PostgREST).
+-- Se já houver sobreposições no histórico, a constraint não é criada: a migração lista os
+-- pares conflitantes para correção manual e pode ser executada novamente depois.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE OR REPLACE FUNCTION public.appointment_periodo(p_date DATE, p_start TIME, p_end TIME)
+RETURNS TSRANGE
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT tsrange(
+        p_date + p_start,
+        CASE
+            WHEN p_end IS NOT NULL AND p_end > p_start THEN p_date + p_end
+            ELSE (p_date + p_start) + INTERVAL '60 minutes'
+        END,
+        '[)'
+    );
+$$;
+
+DO $$
+DECLARE
+    v_conflito RECORD;
+    v_total INTEGER := 0;
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'appointments_sem_sobreposicao'
+          AND conrelid = 'public.appointments'::regclass
+    ) THEN
+        RAISE NOTICE 'Constraint appointments_sem_sobreposicao já existe.';
+        RETURN;
+    END IF;
+
+    FOR v_conflito IN
+        SELECT a.id AS id_a, b.id AS id_b, a.clinic_id, a.date
+        FROM public.appointments a
+        JOIN public.appointments b
+          ON a.clinic_id = b.clinic_id
+         AND a.id < b.id
+         AND a.status IN ('scheduled', 'confirmed')
+         AND b.status IN ('scheduled', 'confirmed')
+         AND public.appointment_periodo(a.date, a.start_time, a.end_time)
+             && public.appointment_periodo(b.date, b.start_time, b.end_time)
+    LOOP
+        v_total := v_total + 1;
+        RAISE NOTICE 'Agendamentos sobrepostos: % e % (clínica %, %)', v_conflito.id_a, v_conflito.id_b, v_conflito.clinic_id, v_conflito.date;
+    END LOOP;
+
+    IF v_total > 0 THEN
+        RAISE WARNING 'Constraint appointments_sem_sobreposicao não criada: % pares sobrepostos. Corrija-os e execute a migração novamente.', v_total;
+        RETURN;
+    END IF;
+
+    ALTER TABLE public.appointments
+        ADD CONSTRAINT appointments_sem_sobreposicao
+        EXCLUDE USING gist (
+            clinic_id WITH =,
+            public.appointment_periodo(date, start_time, end_time) WITH &&
+        )
+        WHERE (status IN ('scheduled', 'confirmed'));
+    RAISE NOTICE 'Constraint appointments_sem_sobreposicao criada.';
+END
+$$;
+
+-- Se a constraint existe: o backend só mantém a agenda do dia em cache com ela ativa
+CREATE OR REPLACE FUNCTION public.appointments_sem_sobreposicao_ativa()
+RETURNS BOOLEAN
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_catalog
+AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'appointments_sem_sobreposicao'
+          AND conrelid = 'public.appointments'::regclass
+    );
+$$;
+
+REVOKE ALL ON FUNCTION public.appointments_sem_sobreposicao_ativa() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.appointments_sem_sobreposicao_ativa() TO service_role;
+
+-- Consulta da agenda do dia (índice de intervalos do backend)
+CREATE INDEX IF NOT EXISTS idx_appointments_clinic_date_status
+    ON public.appointments(clinic_id, date, status);
@@ -0,0 +1,42 @@
+-- Migração: Função agregada para as estatísticas do dashboard da clínica
+-- Calcula todos os contadores de /dashboard/stats no banco em uma única chamada
+-- (POST /rest/v1/rpc/dashboard_stats), com o filtro de data aplicado no SQL.
+
+-- Índices de apoio para as contagens por clínica / data / animal
+CREATE INDEX IF NOT EXISTS idx_animals_clinic_id ON public.animals(clinic_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_clinic_id_date ON public.appointments(clinic_id, date);
+CREATE INDEX IF NOT EXISTS idx_dietas_animal_id ON public.dietas(animal_id);
+CREATE INDEX IF NOT EXISTS idx_planos_atividade_animal_id ON public.planos_atividade(animal_id);
+
+CREATE OR REPLACE FUNCTION public.dashboard_stats(p_clinic_id UUID, p_date DATE DEFAULT CURRENT_DATE)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT json_build_object(
+        'animais_ativos', (
+            SELECT COUNT(*) FROM public.animals a
+            WHERE a.clinic_id = p_clinic_id
+        ),
+        'consultas_hoje', (
+            SELECT COUNT(*) FROM public.appointments ap
+            WHERE ap.clinic_id = p_clinic_id AND ap.date = p_date
+        ),
+        'animais_sem_dietas', (
+            SELECT COUNT(*) FROM public.animals a
+            WHERE a.clinic_id = p_clinic_id
+              AND NOT EXISTS (SELECT 1 FROM public.dietas d WHERE d.animal_id = a.id)
+        ),
+        'animais_sem_atividades', (
+            SELECT COUNT(*) FROM public.animals a
+            WHERE a.clinic_id = p_clinic_id
+              AND NOT EXISTS (SELECT 1 FROM public.planos_atividade pa WHERE pa.animal_id = a.id)
+        )
+    );
+$$;
+
+-- Apenas o backend (service role) chama esta função
+REVOKE ALL ON FUNCTION public.dashboard_stats(UUID, DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.dashboard_stats(UUID, DATE) TO service_role;
@@ -0,0 +1,94 @@
+-- Migração: Check-in atômico de refeição do tutor (dieta_progresso)
+-- Resolve o animal do tutor e a dieta ativa, aplica o limite de refeicoes_por_dia,
+-- insere o registro e devolve o resumo do dia em uma única chamada
+-- (POST /rest/v1/rpc/dieta_registrar_refeicao). A linha da dieta fica bloqueada
+-- até o fim da transação, então check-ins concorrentes não ultrapassam o limite.
+
+-- Contagem do dia por dieta
+CREATE INDEX IF NOT EXISTS idx_dieta_progresso_dieta_data
+    ON public.dieta_progresso(dieta_id, data);
+
+CREATE OR REPLACE FUNCTION public.dieta_registrar_refeicao(
+    p_tutor_user_id UUID,
+    p_data DATE,
+    p_refeicao_completa BOOLEAN DEFAULT TRUE,
+    p_horario_realizado TIME DEFAULT NULL,
+    p_pontos_ganhos INTEGER DEFAULT 0,
+    p_quantidade_consumida TEXT DEFAULT NULL,
+    p_observacoes_tutor TEXT DEFAULT NULL
+)
+RETURNS JSON
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_animal_id UUID;
+    v_dieta RECORD;
+    v_refeicoes INTEGER;
+    v_concluidas INTEGER;
+    v_registro public.dieta_progresso%ROWTYPE;
+BEGIN
+    SELECT id INTO v_animal_id
+    FROM public.animals
+    WHERE tutor_user_id = p_tutor_user_id
+    LIMIT 1;
+    IF NOT FOUND THEN
+        RETURN json_build_object('status', 'animal_nao_encontrado');
+    END IF;
+
+    -- Dieta ativa mais recente ('ativa' e 'ativo' por compatibilidade), bloqueada para o check-in
+    SELECT id, COALESCE(refeicoes_por_dia, 0) AS refeicoes_por_dia
+    INTO v_dieta
+    FROM public.dietas
+    WHERE animal_id = v_animal_id
+      AND status IN ('ativa', 'ativo')
+    ORDER BY created_at DESC
+    LIMIT 1
+    FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN json_build_object('status', 'dieta_nao_encontrada', 'animal_id', v_animal_id);
+    END IF;
+    v_refeicoes := v_dieta.refeicoes_por_dia;
+
+    SELECT COUNT(*) INTO v_concluidas
+    FROM public.dieta_progresso
+    WHERE dieta_id = v_dieta.id
+      AND animal_id = v_animal_id
+      AND data = p_data;
+
+    IF v_refeicoes > 0 AND v_concluidas >= v_refeicoes THEN
+        RETURN json_build_object(
+            'status', 'limite_atingido',
+            'animal_id', v_animal_id,
+            'dieta_id', v_dieta.id,
+            'refeicoes_por_dia', v_refeicoes,
+            'completed_count', v_concluidas
+        );
+    END IF;
+
+    INSERT INTO public.dieta_progresso (
+        animal_id, dieta_id, data, refeicao_completa, horario_realizado, pontos_ganhos,
+        refeicao_index, quantidade_consumida, observacoes_tutor
+    )
+    VALUES (
+        v_animal_id, v_dieta.id, p_data, COALESCE(p_refeicao_completa, TRUE),
+        COALESCE(p_horario_realizado, LOCALTIME(0)), COALESCE(p_pontos_ganhos, 0),
+        CASE WHEN v_refeicoes > 0 THEN v_concluidas + 1 END, p_quantidade_consumida, p_observacoes_tutor
+    )
+    RETURNING * INTO v_registro;
+
+    RETURN json_build_object(
+        'status', 'ok',
+        'created', row_to_json(v_registro),
+        'animal_id', v_animal_id,
+        'dieta_id', v_dieta.id,
+        'refeicoes_por_dia', v_refeicoes,
+        'completed_count', v_concluidas + 1
+    );
+END;
+$$;
+
+-- Apenas o backend (service role) chama esta função
+REVOKE ALL ON FUNCTION public.dieta_registrar_refeicao(UUID, DATE, BOOLEAN, TIME, INTEGER, TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.dieta_registrar_refeicao(UUID, DATE, BOOLEAN, TIME, INTEGER, TEXT, TEXT) TO service_role;
@@ -0,0 +1,124 @@
+-- Migração: Agregados diários de pontos de gamificação por animal e meta
+-- Uma linha por (animal, dia, meta) com a soma dos pontos do dia, mantida por trigger
+-- em gamificacao_pontuacoes. Consultas por período somam no máximo alguns
+-- buckets por dia em vez de varrer todas as pontuações.
+-- Reconstrução a partir do histórico: SELECT public.gamificacao_reconstruir_pontos_diarios();
+-- (ou backend/scripts/backfill_pontos_diarios.py)
+
+CREATE TABLE IF NOT EXISTS public.gamificacao_pontos_diarios (
+    id BIGSERIAL PRIMARY KEY,
+    animal_id UUID NOT NULL REFERENCES public.animals(id) ON DELETE CASCADE,
+    clinic_id UUID,
+    meta_id UUID,
+    dia DATE NOT NULL,
+    pontos BIGINT NOT NULL DEFAULT 0,
+    registros INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE public.gamificacao_pontos_diarios IS 'Pontos por animal/meta/dia, mantidos por trigger (não editar manualmente)';
+
+-- meta_id pode ser nulo: a chave usa um UUID sentinela para agrupar pontuações sem meta
+CREATE UNIQUE INDEX IF NOT EXISTS uq_gamificacao_pontos_diarios_bucket
+    ON public.gamificacao_pontos_diarios(animal_id, dia, (COALESCE(meta_id, '00000000-0000-0000-0000-000000000000'::uuid)));
+CREATE INDEX IF NOT EXISTS idx_gamificacao_pontos_diarios_clinic_dia
+    ON public.gamificacao_pontos_diarios(clinic_id, dia);
+
+-- Aplica um delta ao bucket do dia, removendo-o quando não restar nenhuma pontuação
+CREATE OR REPLACE FUNCTION public.gamificacao_aplicar_pontos_diarios(
+    p_animal_id UUID,
+    p_meta_id UUID,
+    p_dia DATE,
+    p_pontos BIGINT,
+    p_registros INTEGER
+)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF p_animal_id IS NULL OR p_dia IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO public.gamificacao_pontos_diarios AS b (animal_id, clinic_id, meta_id, dia, pontos, registros)
+    SELECT p_animal_id, a.clinic_id, p_meta_id, p_dia, p_pontos, p_registros
+    FROM public.animals a
+    WHERE a.id = p_animal_id
+    ON CONFLICT (animal_id, dia, (COALESCE(meta_id, '00000000-0000-0000-0000-000000000000'::uuid))) DO UPDATE SET
+        pontos = b.pontos + EXCLUDED.pontos,
+        registros = b.registros + EXCLUDED.registros,
+        updated_at = NOW();
+
+    DELETE FROM public.gamificacao_pontos_diarios
+    WHERE animal_id = p_animal_id
+      AND dia = p_dia
+      AND meta_id IS NOT DISTINCT FROM p_meta_id
+      AND registros <= 0;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.gamificacao_pontos_diarios_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM public.gamificacao_aplicar_pontos_diarios(
+            OLD.animal_id, OLD.meta_id, (OLD.data AT TIME ZONE 'UTC')::date, -COALESCE(OLD.pontos_obtidos, 0), -1
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.gamificacao_aplicar_pontos_diarios(
+            NEW.animal_id, NEW.meta_id, (NEW.data AT TIME ZONE 'UTC')::date, COALESCE(NEW.pontos_obtidos, 0), 1
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS gamificacao_pontuacoes_pontos_diarios ON public.gamificacao_pontuacoes;
+CREATE TRIGGER gamificacao_pontuacoes_pontos_diarios
+AFTER INSERT OR DELETE OR UPDATE OF animal_id, meta_id, data, pontos_obtidos ON public.gamificacao_pontuacoes
+FOR EACH ROW
+EXECUTE FUNCTION public.gamificacao_pontos_diarios_trigger();
+
+-- Reconstrói os agregados a partir de gamificacao_pontuacoes (todos os animais ou apenas um)
+CREATE OR REPLACE FUNCTION public.gamificacao_reconstruir_pontos_diarios(p_animal_id UUID DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_buckets INTEGER;
+BEGIN
+    DELETE FROM public.gamificacao_pontos_diarios
+    WHERE p_animal_id IS NULL OR animal_id = p_animal_id;
+
+    INSERT INTO public.gamificacao_pontos_diarios (animal_id, clinic_id, meta_id, dia, pontos, registros)
+    SELECT p.animal_id, a.clinic_id, p.meta_id, (p.data AT TIME ZONE 'UTC')::date, SUM(COALESCE(p.pontos_obtidos, 0)), COUNT(*)
+    FROM public.gamificacao_pontuacoes p
+    JOIN public.animals a ON a.id = p.animal_id
+    WHERE p.data IS NOT NULL
+      AND (p_animal_id IS NULL OR p.animal_id = p_animal_id)
+    GROUP BY p.animal_id, a.clinic_id, p.meta_id, (p.data AT TIME ZONE 'UTC')::date;
+
+    GET DIAGNOSTICS v_buckets = ROW_COUNT;
+    RETURN v_buckets;
+END;
+$$;
+
+-- Carga inicial
+SELECT public.gamificacao_reconstruir_pontos_diarios();
+
+-- Apenas o backend (service role) acessa os agregados
+ALTER TABLE public.gamificacao_pontos_diarios ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.gamificacao_pontos_diarios FROM anon, authenticated;
+GRANT SELECT ON public.gamificacao_pontos_diarios TO service_role;
+REVOKE ALL ON FUNCTION public.gamificacao_aplicar_pontos_diarios(UUID, UUID, DATE, BIGINT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.gamificacao_reconstruir_pontos_diarios(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.gamificacao_reconstruir_pontos_diarios(UUID) TO service_role;
@@ -0,0 +1,82 @@
+-- Migração: Resgate atômico de recompensas de gamificação
+-- Verifica o saldo e registra a atribuição na mesma transação
+-- (POST /rest/v1/rpc/gamificacao_resgatar_recompensa), bloqueando a linha do animal em
+-- gamificacao_saldos para que resgates concorrentes não gastem o mesmo saldo duas vezes.
+-- Depende de migrations/add_gamificacao_saldos_ledger.sql.
+
+CREATE OR REPLACE FUNCTION public.gamificacao_resgatar_recompensa(
+    p_animal_id UUID,
+    p_clinic_id UUID,
+    p_recompensa_id UUID,
+    p_codigo_verificacao TEXT DEFAULT NULL,
+    p_data_expiracao DATE DEFAULT NULL,
+    p_observacoes TEXT DEFAULT NULL
+)
+RETURNS JSON
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_recompensa RECORD;
+    v_disponiveis BIGINT;
+    v_atribuicao public.gamificacao_recompensas_atribuidas%ROWTYPE;
+BEGIN
+    PERFORM 1 FROM public.animals WHERE id = p_animal_id AND clinic_id = p_clinic_id;
+    IF NOT FOUND THEN
+        RETURN json_build_object('status', 'animal_nao_encontrado');
+    END IF;
+
+    SELECT id, nome, COALESCE(pontos_necessarios, 0) AS pontos_necessarios
+    INTO v_recompensa
+    FROM public.gamificacao_recompensas
+    WHERE id = p_recompensa_id;
+    IF NOT FOUND THEN
+        RETURN json_build_object('status', 'recompensa_nao_encontrada');
+    END IF;
+
+    -- Garante a linha do ledger e a bloqueia até o fim da transação
+    INSERT INTO public.gamificacao_saldos (animal_id, clinic_id)
+    VALUES (p_animal_id, p_clinic_id)
+    ON CONFLICT (animal_id) DO NOTHING;
+
+    SELECT pontos_disponiveis INTO v_disponiveis
+    FROM public.gamificacao_saldos
+    WHERE animal_id = p_animal_id
+    FOR UPDATE;
+
+    IF v_disponiveis < v_recompensa.pontos_necessarios THEN
+        RETURN json_build_object(
+            'status', 'pontos_insuficientes',
+            'pontos_necessarios', v_recompensa.pontos_necessarios,
+            'pontos_disponiveis', v_disponiveis
+        );
+    END IF;
+
+    -- O trigger do ledger debita os pontos dentro desta mesma transação
+    INSERT INTO public.gamificacao_recompensas_atribuidas (
+        animal_id, recompensa_id, pontos_utilizados, status,
+        codigo_verificacao, data_expiracao, observacoes
+    )
+    VALUES (
+        p_animal_id, p_recompensa_id, v_recompensa.pontos_necessarios, 'disponivel',
+        p_codigo_verificacao, p_data_expiracao, p_observacoes
+    )
+    RETURNING * INTO v_atribuicao;
+
+    SELECT pontos_disponiveis INTO v_disponiveis
+    FROM public.gamificacao_saldos
+    WHERE animal_id = p_animal_id;
+
+    RETURN json_build_object(
+        'status', 'ok',
+        'atribuicao', row_to_json(v_atribuicao),
+        'recompensa_nome', v_recompensa.nome,
+        'pontos_disponiveis', v_disponiveis
+    );
+END;
+$$;
+
+-- Apenas o backend (service role) chama esta função
+REVOKE ALL ON FUNCTION public.gamificacao_resgatar_recompensa(UUID, UUID, UUID, TEXT, DATE, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.gamificacao_resgatar_recompensa(UUID, UUID, UUID, TEXT, DATE, TEXT) TO service_role;
@@ -0,0 +1,120 @@
+-- Migração: Saldo de pontos de gamificação mantido incrementalmente (ledger)
+-- Uma linha por animal com pontos ganhos, gastos e disponíveis, atualizada por triggers
+-- a cada inserção/remoção em gamificacao_pontuacoes e gamificacao_recompensas_atribuidas.
+-- A leitura do saldo passa a ser O(1), independente do tamanho do histórico.
+
+CREATE TABLE IF NOT EXISTS public.gamificacao_saldos (
+    animal_id UUID PRIMARY KEY REFERENCES public.animals(id) ON DELETE CASCADE,
+    clinic_id UUID,
+    pontos_ganhos BIGINT NOT NULL DEFAULT 0,
+    pontos_gastos BIGINT NOT NULL DEFAULT 0,
+    pontos_disponiveis BIGINT GENERATED ALWAYS AS (pontos_ganhos - pontos_gastos) STORED,
+    recompensas_resgatadas INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE public.gamificacao_saldos IS 'Saldo de pontos por animal, mantido por triggers (não editar manualmente)';
+
+CREATE INDEX IF NOT EXISTS idx_gamificacao_saldos_clinic_disponiveis
+    ON public.gamificacao_saldos(clinic_id, pontos_disponiveis DESC);
+CREATE INDEX IF NOT EXISTS idx_gamificacao_pontuacoes_animal_id ON public.gamificacao_pontuacoes(animal_id);
+CREATE INDEX IF NOT EXISTS idx_gamificacao_recompensas_atribuidas_animal_id ON public.gamificacao_recompensas_atribuidas(animal_id);
+
+-- Aplica um delta ao saldo do animal, criando a linha se necessário
+CREATE OR REPLACE FUNCTION public.gamificacao_aplicar_saldo(
+    p_animal_id UUID,
+    p_ganhos BIGINT,
+    p_gastos BIGINT,
+    p_resgates INTEGER
+)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF p_animal_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO public.gamificacao_saldos AS s (animal_id, clinic_id, pontos_ganhos, pontos_gastos, recompensas_resgatadas)
+    SELECT p_animal_id, a.clinic_id, p_ganhos, p_gastos, p_resgates
+    FROM public.animals a
+    WHERE a.id = p_animal_id
+    ON CONFLICT (animal_id) DO UPDATE SET
+        pontos_ganhos = s.pontos_ganhos + EXCLUDED.pontos_ganhos,
+        pontos_gastos = s.pontos_gastos + EXCLUDED.pontos_gastos,
+        recompensas_resgatadas = s.recompensas_resgatadas + EXCLUDED.recompensas_resgatadas,
+        updated_at = NOW();
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.gamificacao_saldos_pontuacoes_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM public.gamificacao_aplicar_saldo(OLD.animal_id, -COALESCE(OLD.pontos_obtidos, 0), 0, 0);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.gamificacao_aplicar_saldo(NEW.animal_id, COALESCE(NEW.pontos_obtidos, 0), 0, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.gamificacao_saldos_recompensas_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM public.gamificacao_aplicar_saldo(OLD.animal_id, 0, -COALESCE(OLD.pontos_utilizados, 0), -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.gamificacao_aplicar_saldo(NEW.animal_id, 0, COALESCE(NEW.pontos_utilizados, 0), 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS gamificacao_pontuacoes_saldo ON public.gamificacao_pontuacoes;
+CREATE TRIGGER gamificacao_pontuacoes_saldo
+AFTER INSERT OR DELETE OR UPDATE OF animal_id, pontos_obtidos ON public.gamificacao_pontuacoes
+FOR EACH ROW
+EXECUTE FUNCTION public.gamificacao_saldos_pontuacoes_trigger();
+
+DROP TRIGGER IF EXISTS gamificacao_recompensas_atribuidas_saldo ON public.gamificacao_recompensas_atribuidas;
+CREATE TRIGGER gamificacao_recompensas_atribuidas_saldo
+AFTER INSERT OR DELETE OR UPDATE OF animal_id, pontos_utilizados ON public.gamificacao_recompensas_atribuidas
+FOR EACH ROW
+EXECUTE FUNCTION public.gamificacao_saldos_recompensas_trigger();
+
+-- Carga inicial / reconciliação a partir do histórico existente (idempotente)
+INSERT INTO public.gamificacao_saldos (animal_id, clinic_id, pontos_ganhos, pontos_gastos, recompensas_resgatadas)
+SELECT
+    a.id,
+    a.clinic_id,
+    COALESCE((SELECT SUM(p.pontos_obtidos) FROM public.gamificacao_pontuacoes p WHERE p.animal_id = a.id), 0),
+    COALESCE((SELECT SUM(r.pontos_utilizados) FROM public.gamificacao_recompensas_atribuidas r WHERE r.animal_id = a.id), 0),
+    (SELECT COUNT(*) FROM public.gamificacao_recompensas_atribuidas r WHERE r.animal_id = a.id)
+FROM public.animals a
+WHERE EXISTS (SELECT 1 FROM public.gamificacao_pontuacoes p WHERE p.animal_id = a.id)
+   OR EXISTS (SELECT 1 FROM public.gamificacao_recompensas_atribuidas r WHERE r.animal_id = a.id)
+ON CONFLICT (animal_id) DO UPDATE SET
+    clinic_id = EXCLUDED.clinic_id,
+    pontos_ganhos = EXCLUDED.pontos_ganhos,
+    pontos_gastos = EXCLUDED.pontos_gastos,
+    recompensas_resgatadas = EXCLUDED.recompensas_resgatadas,
+    updated_at = NOW();
+
+-- Apenas o backend (service role) acessa o ledger
+ALTER TABLE public.gamificacao_saldos ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.gamificacao_saldos FROM anon, authenticated;
+GRANT SELECT ON public.gamificacao_saldos TO service_role;
+REVOKE ALL ON FUNCTION public.gamificacao_aplicar_saldo(UUID, BIGINT, BIGINT, INTEGER) FROM PUBLIC, anon, authenticated;